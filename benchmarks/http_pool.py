@@ -0,0 +1,57 @@
+"""Бенчмарк пула соединений BaseAPIService против локального стаб-сервера.
+
+Сравнивает прежний путь (``requests.request`` с новым TCP-соединением на каждый вызов)
+и сессию с keep-alive пулом. Запуск из корня проекта::
+
+    python -m benchmarks.http_pool --requests 2000 --concurrency 8
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+from benchmarks.stub_server import start_stub_server, server_url
+from common_utils.api import BaseAPIService
+
+
+class StubAPIService(BaseAPIService):
+    host = ''
+    api_path = 'iss'
+    token = ''
+
+
+def unpooled_get(url):
+    return requests.request('GET', url, timeout=(3.05, 10))
+
+
+def run(label, call, total, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for response in executor.map(lambda _: call(), range(total)):
+            response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<10} {total} запросов за {elapsed:.2f} с — {total / elapsed:.0f} req/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    StubAPIService.host = server_url(server)
+    StubAPIService.pool_size = args.concurrency
+    url = urljoin(StubAPIService.host, 'iss/candles.json')
+    try:
+        run('unpooled', lambda: unpooled_get(url), args.requests, args.concurrency)
+        run('pooled', lambda: StubAPIService.get('candles.json'), args.requests, args.concurrency)
+    finally:
+        StubAPIService.close_session()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
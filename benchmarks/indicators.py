@@ -0,0 +1,70 @@
+"""Бенчмарк расчета технических индикаторов (moex.indicators) по истории свечей.
+
+Сравнивает векторизованное экспоненциальное сглаживание ewm с построчным циклом Python
+и измеряет время расчета и размер ответа индикаторов относительно ответа со свечами. Запуск из корня проекта::
+
+    python -m benchmarks.indicators --candles 20000,100000
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from benchmarks.response_formats import make_candle_history  # noqa: E402
+from common_utils.encoders import RowEncoder  # noqa: E402
+from moex.indicators import compute_indicators, ewm, parse_indicators  # noqa: E402
+from moex.serializers import ActionCandlesResponseSerializer  # noqa: E402
+
+INDICATORS = 'sma:20,ema:50,rsi,macd:12:26:9,bollinger:20:2,vwap'
+
+
+def ewm_loop(values: list[float], alpha: float) -> list[float]:
+    result, state = [], values[0]
+    for value in values:
+        state = alpha * value + (1 - alpha) * state
+        result.append(state)
+    return result
+
+
+def timed(call, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def run(count: int, repeat: int):
+    candles = make_candle_history(count)
+    close = [candle['close'] for candle in candles]
+    expected, loop_time = timed(lambda: ewm_loop(close, 2 / 51), repeat)
+    result, ewm_time = timed(lambda: ewm(np.array(close), 2 / 51), repeat)
+    assert np.allclose(result, expected, rtol=1e-9)
+
+    indicators = parse_indicators(INDICATORS)
+    body, compute_time = timed(lambda: compute_indicators(candles, indicators), repeat)
+    candles_body = RowEncoder.for_serializer(ActionCandlesResponseSerializer).encode(candles)
+    print(
+        f'{count:>7} свечей: ewm цикл {loop_time:7.1f} мс, NumPy {ewm_time:6.2f} мс; '
+        f'{len(indicators)} индикаторов за {compute_time:6.1f} мс, '
+        f'ответ {len(body) / 1024:6.0f} КБ против {len(candles_body) / 1024:6.0f} КБ свечей',
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--candles', default='20000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for count in map(int, args.candles.split(',')):
+        run(count, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Бенчмарк пиковой памяти разбора больших ответов MOEX ISS.
+
+Стаб-сервер отдает ленту сделок за день в формате MOEX ISS. Сравниваются
+``parse_start_structure(response.json()['trades'])`` и iter_rows по уже прочитанному телу
+(как у ответа из кэша) и по телу, читаемому из сокета (BaseAPIService.get_stream).
+Пик памяти Python-объектов измеряется tracemalloc отдельным запуском. Представления стакана, сделок
+и торговой статистики получают кэшируемый, уже прочитанный ответ: разбор по кускам (второй вариант)
+снижает пик только на разобранную копию документа ценой заметно большего времени, поэтому они разбирают
+тело целиком orjson (parse_response_block). Пик ограничивается размером куска лишь при чтении
+из сокета (третий вариант) - в задаче снимка доски (moex.snapshots). Запуск из корня проекта::
+
+    python -m benchmarks.json_memory --trades 200000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.stub_server import StubHandler, start_stub_server, server_url
+from common_utils.api import BaseAPIService, iter_response_chunks
+from moex.create_functions import iter_rows, parse_start_structure
+
+TRADES_COLUMNS = [
+    'TRADENO', 'TRADETIME', 'BOARDID', 'SECID', 'PRICE', 'QUANTITY', 'VALUE', 'PERIOD', 'TRADETIME_GRP',
+    'SYSTIME', 'BUYSELL', 'DECIMALS', 'TRADINGSESSION',
+]
+
+
+class StubAPIService(BaseAPIService):
+    host = ''
+    api_path = 'iss'
+    token = ''
+
+
+def make_trades_payload(count: int) -> bytes:
+    return json.dumps({
+        'trades': {
+            'columns': TRADES_COLUMNS,
+            'data': [
+                [
+                    12000000000 + index, '10:00:01', 'TQBR', 'SBER', 310.5 + index % 100 / 100, index % 50 + 1,
+                    3105.0, 'N', 1000, '2025-01-01 10:00:01', 'B' if index % 2 else 'S', 2, '1',
+                ]
+                for index in range(count)
+            ],
+        },
+    }).encode()
+
+
+def measure(label, call):
+    """Время без трассировки памяти и пик памяти отдельным запуском под tracemalloc."""
+    started = time.perf_counter()
+    call()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    result = call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'{label:<40} пик {peak / 2 ** 20:7.1f} МБ, {elapsed * 1000:7.0f} мс')
+    return result
+
+
+def parse_json():
+    response = StubAPIService.get('trades.json')
+    return parse_start_structure(response.json()['trades'])
+
+
+def parse_read_body():
+    response = StubAPIService.get('trades.json')
+    return list(iter_rows(iter_response_chunks(response), 'trades'))
+
+
+def parse_stream():
+    with StubAPIService.get_stream('trades.json') as response:
+        return list(iter_rows(iter_response_chunks(response), 'trades'))
+
+
+def sum_volume_stream():
+    with StubAPIService.get_stream('trades.json') as response:
+        return sum(row['QUANTITY'] for row in iter_rows(iter_response_chunks(response), 'trades', ['QUANTITY']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trades', type=int, default=200000)
+    args = parser.parse_args()
+
+    class Handler(StubHandler):
+        payload = make_trades_payload(args.trades)
+
+    StubAPIService.host = server_url(start_stub_server(Handler))
+    print(f'{args.trades} сделок, тело ответа {len(Handler.payload) / 2 ** 20:.1f} МБ')
+
+    expected = measure('response.json() + parse_start_structure', parse_json)
+    assert measure('iter_rows, прочитанное тело', parse_read_body) == expected
+    assert measure('iter_rows, сокет', parse_stream) == expected
+    total = measure('iter_rows, сокет, сумма QUANTITY', sum_volume_stream)
+    assert total == sum(row['QUANTITY'] for row in expected)
+
+
+if __name__ == '__main__':
+    main()
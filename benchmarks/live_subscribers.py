@@ -0,0 +1,95 @@
+"""Нагрузочный тест потока стаканов и сделок (moex.live) в одном воркере.
+
+В одном событийном цикле, как в воркере uvicorn, подключается заданное число подписчиков
+на iter_live_events (без HTTP и JWT), после чего в Redis публикуются события по акциям, как это
+делают фоновые задачи. Измеряются память на подписчика, время подписки и время доставки события
+всем подписчикам. Нужен Redis из REDIS_URL. Запуск из корня проекта::
+
+    python -m benchmarks.live_subscribers --subscribers 1000,5000,10000 --tickers 50
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+from django_redis import get_redis_connection  # noqa: E402
+
+from moex.live import LiveHub, iter_live_events, publish_live_event  # noqa: E402
+
+TRADE = {
+    'TRADENO': 12000000000, 'TRADETIME': '10:00:01', 'BOARDID': 'TQBR', 'SECID': 'SBER', 'PRICE': 310.5,
+    'QUANTITY': 10, 'VALUE': 3105.0, 'PERIOD': 'N', 'TRADETIME_GRP': 1000, 'SYSTIME': '2025-01-01 10:00:01',
+    'BUYSELL': 'B', 'DECIMALS': 2, 'TRADINGSESSION': '1',
+}
+
+
+async def consume(tickers, received, expected, done):
+    async for event in iter_live_events(tickers, ['trades']):
+        if event.startswith(b'event: trades'):
+            received[0] += 1
+            if received[0] == expected:
+                done.set()
+
+
+async def run(subscribers: int, tickers: list[str], events: int):
+    received = [0]
+    done = asyncio.Event()
+    hub = LiveHub.get()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = [
+        asyncio.create_task(consume([tickers[index % len(tickers)]], received, subscribers * events, done))
+        for index in range(subscribers)
+    ]
+    while hub.stats()['subscribers'] < subscribers:
+        await asyncio.sleep(0.05)
+    subscribe_time = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    connection = get_redis_connection('default')
+    latencies = []
+    for _ in range(events):
+        expected = received[0] + subscribers
+        started = time.perf_counter()
+        pipeline = connection.pipeline(transaction=False)
+        for ticker in tickers:
+            publish_live_event(pipeline, ticker, 'trades', [{**TRADE, 'SECID': ticker}])
+        await asyncio.to_thread(pipeline.execute)
+        while received[0] < expected:
+            await asyncio.sleep(0.001)
+        latencies.append(time.perf_counter() - started)
+    await asyncio.wait_for(done.wait(), timeout=30)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    latencies.sort()
+    print(
+        f'{subscribers:>7} подписчиков: подписка {subscribe_time:6.2f} с, '
+        f'{memory / subscribers / 1024:5.1f} КБ на подписчика, доставка события всем: '
+        f'медиана {latencies[len(latencies) // 2] * 1000:7.1f} мс, максимум {latencies[-1] * 1000:7.1f} мс',
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', default='1000,5000,10000')
+    parser.add_argument('--tickers', type=int, default=50)
+    parser.add_argument('--events', type=int, default=20)
+    args = parser.parse_args()
+
+    tickers = [f'T{index:03}' for index in range(args.tickers)]
+    for subscribers in map(int, args.subscribers.split(',')):
+        await run(subscribers, tickers, args.events)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
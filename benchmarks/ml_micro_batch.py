@@ -0,0 +1,117 @@
+"""Бенчмарк объединения запросов предсказаний в пакеты (MicroBatcher в MLAPIService.predict).
+
+Стаб-сервер модели обрабатывает запросы по одному, как модель на одном устройстве: каждый запрос стоит
+фиксированные накладные расходы плюс время на каждый элемент пакета. Заданное число одновременных клиентов
+(потоков, как в воркере gunicorn, или задач событийного цикла, как в uvicorn) запрашивает предсказания
+по разным акциям; для каждой пары (max_size, max_wait) измеряются пропускная способность и задержка
+вызова predict. max_size=1 - запрос на каждую акцию без объединения. Запуск из корня проекта::
+
+    python -m benchmarks.ml_micro_batch --clients 32 --requests 2000 --configs 1:0,8:0.002,32:0.005,32:0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+from benchmarks.stub_server import StubHandler, server_url, start_stub_server  # noqa: E402
+from common_utils.micro_batcher import MicroBatcher  # noqa: E402
+from services.ml_fastapi import AsyncMLAPIService, MLAPIService  # noqa: E402
+
+DATA = {'last_date_end': '2025-03-03 18:59:59', 'data': [310.0 + index / 10 for index in range(20)]}
+
+
+class ModelStubHandler(StubHandler):
+    """Стаб модели: запросы выполняются по одному, время - накладные расходы плюс время на элемент."""
+    request_overhead = 0.004
+    item_cost = 0.0002
+    model_lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        count = len(body['items']) if self.path.endswith('/batch') else 1
+        with self.model_lock:
+            time.sleep(self.request_overhead + self.item_cost * count)
+        prediction = [311.0] * 20
+        payload = json.dumps([prediction] * count if self.path.endswith('/batch') else prediction).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def report(label, latencies, elapsed, batcher):
+    latencies.sort()
+    stats = batcher.stats()
+    print(
+        f'{label:<18} {len(latencies) / elapsed:8.0f} req/s  p50 {latencies[len(latencies) // 2] * 1000:7.1f} мс  '
+        f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} мс  средний пакет {stats["average_size"]}',
+    )
+
+
+def run_sync(label, clients, total, batcher):
+    def call(index):
+        started = time.perf_counter()
+        response = MLAPIService.predict(f'T{index % 500:03}', DATA)
+        response.raise_for_status()
+        assert len(response.json()) == 20
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = list(executor.map(call, range(total)))
+    report(label, latencies, time.perf_counter() - started, batcher)
+
+
+async def run_async(label, clients, total, batcher):
+    semaphore = asyncio.Semaphore(clients)
+
+    async def call(index):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await AsyncMLAPIService.predict(f'T{index % 500:03}', DATA)
+            response.raise_for_status()
+            assert len(response.json()) == 20
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(call(index) for index in range(total)))
+    report(label, list(latencies), time.perf_counter() - started, batcher)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--configs', default='1:0,8:0.002,32:0.005,32:0.02')
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    args = parser.parse_args()
+
+    server = start_stub_server(ModelStubHandler)
+    MLAPIService.host = AsyncMLAPIService.host = server_url(server)
+    MLAPIService.pool_size = AsyncMLAPIService.async_pool_size = args.clients
+    try:
+        for config in args.configs.split(','):
+            max_size, max_wait = config.split(':')
+            batcher = MicroBatcher(f'benchmark_{config}', max_size=int(max_size), max_wait=float(max_wait))
+            MLAPIService.micro_batcher = AsyncMLAPIService.micro_batcher = batcher
+            label = f'size {max_size}, {float(max_wait) * 1000:g} мс'
+            if args.mode == 'sync':
+                run_sync(label, args.clients, args.requests, batcher)
+            else:
+                asyncio.run(run_async(label, args.clients, args.requests, batcher))
+    finally:
+        MLAPIService.close_session()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
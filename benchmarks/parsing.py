@@ -0,0 +1,53 @@
+"""Бенчмарк парсинга блоков MOEX ISS: словарь на каждую строку против выборки нужных столбцов.
+
+Сравнивает parse_start_structure по всем столбцам, parse_start_structure с полями сериализатора
+и parse_columns (списки и массивы NumPy) на синтетическом блоке. Запуск из корня проекта::
+
+    python -m benchmarks.parsing --rows 5000 --columns 60 --fields 8
+"""
+import argparse
+import time
+
+from moex.create_functions import parse_columns, parse_start_structure
+
+
+def make_block(rows: int, columns: int) -> dict:
+    """Блок в формате MOEX ISS: чередующиеся дробные, целые и строковые столбцы."""
+    types = ('double', 'int64', 'string')
+    names = [f'COLUMN{index}' for index in range(columns)]
+    metadata = {name: {'type': types[index % 3]} for index, name in enumerate(names)}
+    values = {'double': 310.5, 'int64': 100, 'string': 'TQBR'}
+    return {
+        'metadata': metadata,
+        'columns': names,
+        'data': [[values[types[index % 3]] for index in range(columns)] for _ in range(rows)],
+    }
+
+
+def measure(label, call, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{label:<28} {elapsed * 1000:8.2f} мс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--columns', type=int, default=60)
+    parser.add_argument('--fields', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    block = make_block(args.rows, args.columns)
+    fields = block['columns'][:args.fields]
+    print(f'{args.rows} строк, {args.columns} столбцов, нужно {len(fields)}')
+    measure('все столбцы', lambda: parse_start_structure(block), args.repeat)
+    measure('projection', lambda: parse_start_structure(block, fields), args.repeat)
+    measure('по столбцам', lambda: parse_columns(block, fields), args.repeat)
+    measure('по столбцам, NumPy', lambda: parse_columns(block, fields, as_arrays=True), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Бенчмарк построения свечей произвольной длительности из минутных свечей за год.
+
+Сравнивает векторизованный moex.resampling.resample_candles с группировкой в цикле Python
+на синтетических минутных свечах (252 торговых дня по 1050 минут). Запуск из корня проекта::
+
+    python -m benchmarks.resample --intervals 5m,15m,4h
+"""
+import argparse
+import datetime
+import os
+import time
+
+import django
+import numpy as np
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+from moex.resampling import parse_resample_interval, resample_candles  # noqa: E402
+
+
+def make_minute_candles(days: int = 252, minutes_per_day: int = 1050, seed: int = 0) -> dict[str, np.ndarray]:
+    """Минутные свечи рабочих дней с 07:00 со случайным блужданием цены."""
+    rng = np.random.default_rng(seed)
+    trading_days = np.busday_offset(np.datetime64('2024-01-01'), np.arange(days), roll='forward')
+    begin = (
+        trading_days.astype('datetime64[m]')[:, None]
+        + np.timedelta64(7 * 60, 'm')
+        + np.arange(minutes_per_day).astype('timedelta64[m]')
+    ).ravel()
+    close = 300 + np.cumsum(rng.normal(0, 0.1, len(begin)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.05, len(begin)))
+    volume = rng.integers(1, 1000, len(begin))
+    return {
+        'open': open_,
+        'close': close,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'value': close * volume,
+        'volume': volume,
+        'begin': begin.astype('datetime64[s]'),
+        'end': (begin + np.timedelta64(59, 's')).astype('datetime64[s]'),
+    }
+
+
+def resample_python(candles: list[dict], minutes: int) -> list[dict]:
+    """Та же группировка свечей в цикле Python, для сравнения."""
+    result = []
+    size = datetime.timedelta(minutes=minutes)
+    for candle in candles:
+        day_start = datetime.datetime.combine(candle['begin'].date(), datetime.time())
+        session_start = day_start + datetime.timedelta(hours=9 if candle['begin'].weekday() >= 5 else 6)
+        offset = max(candle['begin'] - session_start, datetime.timedelta())
+        bucket_start = session_start + offset // size * size
+        if result and result[-1]['begin'] == bucket_start:
+            bar = result[-1]
+            bar['high'] = max(bar['high'], candle['high'])
+            bar['low'] = min(bar['low'], candle['low'])
+            bar['close'] = candle['close']
+            bar['value'] += candle['value']
+            bar['volume'] += candle['volume']
+        else:
+            result.append({**candle, 'begin': bucket_start})
+    return result
+
+
+def measure(label, call, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{label:<24} {elapsed * 1000:9.1f} мс')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--intervals', default='5m,15m,4h')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    columns = make_minute_candles()
+    rows = [dict(zip(columns, values)) for values in zip(*(values.tolist() for values in columns.values()))]
+    print(f'{len(rows)} минутных свечей')
+
+    for interval in args.intervals.split(','):
+        minutes = parse_resample_interval(interval)
+        print(f'\n{interval}:')
+        vectorized = measure('numpy', lambda: resample_candles(columns, minutes), args.repeat)
+        python = measure('python', lambda: resample_python(rows, minutes), 1)
+        assert len(vectorized['begin']) == len(python)
+        assert np.allclose(vectorized['high'], [bar['high'] for bar in python])
+        assert np.array_equal(vectorized['volume'], [bar['volume'] for bar in python])
+
+
+if __name__ == '__main__':
+    main()
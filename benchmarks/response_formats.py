@@ -0,0 +1,132 @@
+"""Бенчмарк размера и времени кодирования форматов ответа со свечами и сделками.
+
+Сравнивает текущий JSON (RowEncoder) с табличными форматами common_utils.encoders: JSON со столбцами,
+CSV, MessagePack и Apache Arrow IPC. Для каждого формата измеряются время кодирования, размер тела,
+размер и время сжатия gzip (как в GZipMiddleware) и brotli (RESPONSE_COMPRESSION), а также время
+разбора тела на стороне клиента. Запуск из корня проекта::
+
+    python -m benchmarks.response_formats --candles 100000 --trades 50000
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+import brotli  # noqa: E402
+import msgpack  # noqa: E402
+import orjson  # noqa: E402
+import pyarrow  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from benchmarks.serialization import make_trades  # noqa: E402
+from common_utils.encoders import ArrowStreamFormat, ColumnsJSONFormat, CSVFormat, MessagePackFormat, \
+    RowEncoder  # noqa: E402
+from moex.serializers import ActionCandlesResponseSerializer, ActionTradesResponseSerializer  # noqa: E402
+
+PAGE_SIZE = 500
+
+
+def make_candle_history(count: int, seed: int = 0) -> list[dict]:
+    """Минутные свечи со случайным блужданием цены, чтобы сжатие не было нереалистично хорошим."""
+    rng = random.Random(seed)
+    candles = []
+    price = 310.0
+    for index in range(count):
+        day, minute = divmod(index, 840)
+        hour, minute = divmod(600 + minute, 60)
+        open_price = price
+        price = round(price + rng.gauss(0, 0.2), 2)
+        high = round(max(open_price, price) + abs(rng.gauss(0, 0.1)), 2)
+        low = round(min(open_price, price) - abs(rng.gauss(0, 0.1)), 2)
+        volume = rng.randint(1, 5000)
+        timestamp = f'2025-{1 + day // 28 % 12:02}-{1 + day % 28:02} {hour:02}:{minute:02}'
+        candles.append({
+            'open': open_price, 'close': price, 'high': high, 'low': low, 'value': round(volume * price * 10, 1),
+            'volume': volume, 'begin': f'{timestamp}:00', 'end': f'{timestamp}:59',
+        })
+    return candles
+
+
+def encode_pages(row_format, rows: list[dict]) -> bytes:
+    """Тело ответа по страницам, как его отдает поток свечей."""
+    chunks = [row_format.start()]
+    for offset in range(0, len(rows), PAGE_SIZE):
+        chunks.append(row_format.page(rows[offset:offset + PAGE_SIZE]))
+    chunks.append(row_format.end())
+    return b''.join(chunks)
+
+
+def timed(call, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def compare(title, serializer_class, rows, repeat):
+    encoder = RowEncoder.for_serializer(serializer_class)
+    quality = settings.RESPONSE_COMPRESSION['BROTLI_QUALITY']
+    formats = {
+        'JSON (текущий)': (lambda: encoder.encode(rows), orjson.loads),
+        'JSON, столбцы': (
+            lambda: encode_pages(ColumnsJSONFormat.for_encoder(encoder), rows),
+            orjson.loads,
+        ),
+        'CSV': (
+            lambda: encode_pages(CSVFormat.for_encoder(encoder), rows),
+            lambda body: list(csv.reader(io.StringIO(body.decode()))),
+        ),
+        'MessagePack': (
+            lambda: encode_pages(MessagePackFormat.for_encoder(encoder), rows),
+            msgpack.unpackb,
+        ),
+        'Arrow IPC': (
+            lambda: encode_pages(ArrowStreamFormat.for_encoder(encoder), rows),
+            lambda body: pyarrow.ipc.open_stream(body).read_all(),
+        ),
+    }
+
+    print(f'\n{title}: {len(rows)} строк')
+    print(
+        f'{"формат":<16} {"кодир., мс":>10} {"размер, КБ":>11} {"gzip, КБ":>9} {"gzip, мс":>9} '
+        f'{"br, КБ":>8} {"br, мс":>7} {"разбор, мс":>11}',
+    )
+    for label, (encode, decode) in formats.items():
+        body, encode_time = timed(encode, repeat)
+        gzipped, gzip_time = timed(lambda: gzip.compress(body, compresslevel=6), repeat)
+        compressed, brotli_time = timed(lambda: brotli.compress(body, quality=quality), repeat)
+        _, decode_time = timed(lambda: decode(body), repeat)
+        print(
+            f'{label:<16} {encode_time:10.1f} {len(body) / 1024:11.0f} {len(gzipped) / 1024:9.0f} '
+            f'{gzip_time:9.1f} {len(compressed) / 1024:8.0f} {brotli_time:7.1f} {decode_time:11.1f}',
+        )
+
+    expected = json.loads(encoder.encode(rows))
+    table = pyarrow.ipc.open_stream(encode_pages(ArrowStreamFormat.for_encoder(encoder), rows)).read_all()
+    assert table.to_pylist() == expected
+    columns = msgpack.unpackb(encode_pages(MessagePackFormat.for_encoder(encoder), rows))
+    assert [dict(zip(columns['columns'], row)) for row in columns['data']] == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--candles', type=int, default=100000)
+    parser.add_argument('--trades', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    compare('Свечи', ActionCandlesResponseSerializer, make_candle_history(args.candles), args.repeat)
+    compare('Сделки', ActionTradesResponseSerializer, make_trades(args.trades), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Бенчмарк кодирования списков рыночных данных в JSON.
+
+Сравнивает текущий путь DRF (``serializer_class(rows, many=True).data`` + JSONRenderer)
+с common_utils.encoders.RowEncoder на сделках и свечах в формате parse_start_structure
+и проверяет, что результаты совпадают. Запуск из корня проекта::
+
+    python -m benchmarks.serialization --trades 5000 --candles 500
+"""
+import argparse
+import json
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from common_utils.encoders import RowEncoder  # noqa: E402
+from moex.serializers import ActionCandlesResponseSerializer, ActionTradesResponseSerializer  # noqa: E402
+
+
+def make_trades(count: int) -> list[dict]:
+    return [
+        {
+            'TRADENO': 12000000000 + index, 'TRADETIME': '10:00:01', 'BOARDID': 'TQBR', 'SECID': 'SBER',
+            'PRICE': 310.5 + index % 100 / 100, 'QUANTITY': index % 50 + 1, 'VALUE': 3105.0 * (index % 50 + 1),
+            'PERIOD': 'N', 'TRADETIME_GRP': 1000, 'SYSTIME': '2025-01-01 10:00:01', 'BUYSELL': 'B' if index % 2 else 'S',
+            'DECIMALS': 2, 'TRADINGSESSION': '1',
+        }
+        for index in range(count)
+    ]
+
+
+def make_candles(count: int) -> list[dict]:
+    return [
+        {
+            'open': 310.5, 'close': 311.2, 'high': 311.9, 'low': 310.1, 'value': 125000.0, 'volume': 400,
+            'begin': '2025-01-01 10:00:00', 'end': '2025-01-01 10:09:59',
+        }
+        for _ in range(count)
+    ]
+
+
+def measure(label, call, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{label:<12} {elapsed * 1000:8.2f} мс')
+    return result
+
+
+def compare(title, serializer_class, rows, repeat):
+    print(f'\n{title}: {len(rows)} строк')
+    drf = measure('DRF', lambda: JSONRenderer().render(serializer_class(rows, many=True).data), repeat)
+    encoder = RowEncoder.for_serializer(serializer_class)
+    fast = measure('RowEncoder', lambda: encoder.encode(rows), repeat)
+    assert json.loads(drf) == json.loads(fast)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trades', type=int, default=5000)
+    parser.add_argument('--candles', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    compare('Сделки', ActionTradesResponseSerializer, make_trades(args.trades), args.repeat)
+    compare('Свечи', ActionCandlesResponseSerializer, make_candles(args.candles), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
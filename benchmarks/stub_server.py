@@ -0,0 +1,49 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Обработчик локального стаб-сервера, отвечающий фиксированным JSON с поддержкой keep-alive."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    payload = json.dumps({
+        'candles': {
+            'columns': ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end'],
+            'data': [[310.5, 311.2, 311.9, 310.1, 125000.0, 400, '2025-01-01 10:00:00', '2025-01-01 10:09:59']] * 50,
+        },
+    }).encode()
+
+    def _send_payload(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    do_GET = _send_payload
+    do_POST = _send_payload
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь соединений на случай десятков одновременных клиентов, по умолчанию 5
+    request_queue_size = 128
+
+
+def start_stub_server(handler_class=StubHandler) -> ThreadingHTTPServer:
+    """Запустить стаб-сервер на свободном локальном порту в фоновом потоке."""
+    server = StubServer(('127.0.0.1', 0), handler_class)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}/'
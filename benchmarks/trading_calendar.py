@@ -0,0 +1,67 @@
+"""Бенчмарк торгового календаря (moex.trading_calendar) на горизонтах прогноза.
+
+Сравнивает подбор времени свечей прогноза set_appropriate_datetime по массиву торговых часов с перебором
+часов по одному, как это делалось до торгового календаря, и измеряет проверку большого массива моментов
+времени is_session. Запуск из корня проекта::
+
+    python -m benchmarks.trading_calendar --horizons 24,1000,5000
+"""
+import argparse
+import datetime
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from moex.create_functions import set_appropriate_datetime  # noqa: E402
+from moex.trading_calendar import TradingCalendar  # noqa: E402
+
+START = '2025-03-01 12:00:00'
+
+
+def hour_by_hour(count: int, start: datetime.datetime) -> list[datetime.datetime]:
+    """Торговые часы перебором по одному часу с проверкой каждого часа, без особых дней."""
+    calendar = TradingCalendar.get()
+    hours, hour = [], start.replace(minute=0, second=0)
+    while len(hours) < count:
+        if calendar.is_trading_time(hour):
+            hours.append(hour)
+        hour += datetime.timedelta(hours=1)
+    return hours
+
+
+def timed(call, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--horizons', default='24,1000,5000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    _, load_time = timed(TradingCalendar.load, args.repeat)
+    print(f'Построение календаря: {load_time:.1f} мс, {len(TradingCalendar.get().slots)} торговых часов')
+    start = datetime.datetime.strptime(START, '%Y-%m-%d %H:%M:%S')
+    for count in map(int, args.horizons.split(',')):
+        costs = [310.0] * count
+        result, calendar_time = timed(lambda: set_appropriate_datetime(costs, START, False), args.repeat)
+        expected, loop_time = timed(lambda: hour_by_hour(count, start), args.repeat)
+        assert [row['begin'] for row in result] == [hour.strftime('%Y-%m-%d %H:%M:%S') for hour in expected]
+        print(f'{count:>6} часов: календарь {calendar_time:7.2f} мс, перебор по часу {loop_time:8.1f} мс')
+
+    timestamps = np.arange(np.datetime64('2025-01-01T00:00'), np.datetime64('2026-01-01T00:00'), np.timedelta64(1, 'm'))
+    _, session_time = timed(lambda: TradingCalendar.get().is_session(timestamps), args.repeat)
+    print(f'is_session: {len(timestamps)} минут за {session_time:.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,45 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import os
+import threading
+import time
+import weakref
 from urllib.parse import urljoin
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common_utils.circuit_breaker import CircuitOpenError
 
 
 class BaseAPIService:
+    # Параметры пула соединений, таймаутов и повторов, переопределяются в наследниках
+    pool_size = 10
+    async_pool_size = 100
+    connect_timeout = 3.05
+    read_timeout = 10
+    max_retries = 3
+    backoff_factor = 0.3
+    retry_statuses = (429, 500, 502, 503, 504)
+    retry_methods = frozenset({'GET', 'HEAD', 'OPTIONS'})
+    # Объединение одинаковых одновременных GET-запросов (common_utils.single_flight.SingleFlight)
+    single_flight = None
+    # Кэш успешных ответов на GET-запросы (common_utils.cache.TieredCache)
+    response_cache = None
+    # Выключатель запросов при сбоях сервиса (common_utils.circuit_breaker.CircuitBreaker)
+    circuit_breaker = None
+    # Ограничение частоты запросов к сервису (common_utils.rate_limiter.RateLimiter)
+    rate_limiter = None
+    # Ошибки транспорта, после которых GET-запрос может быть обслужен устаревшим ответом из кэша
+    transport_errors = (requests.RequestException,)
+
+    _sessions = {}
+    _sessions_lock = threading.Lock()
 
     @property
     def host(self):
@@ -17,13 +53,64 @@ class BaseAPIService:
     def api_path(self):
         raise NotImplementedError
 
+    @classmethod
+    def _build_session(cls) -> requests.Session:
+        """Создать сессию с keep-alive пулом соединений и повторами для идемпотентных запросов."""
+        retry = Retry(
+            total=cls.max_retries,
+            connect=cls.max_retries,
+            read=cls.max_retries,
+            status=cls.max_retries,
+            backoff_factor=cls.backoff_factor,
+            status_forcelist=cls.retry_statuses,
+            allowed_methods=cls.retry_methods,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Сессия текущего класса сервиса в текущем процессе.
+
+        Ключ содержит pid, поэтому после fork воркера gunicorn сокеты родителя не переиспользуются.
+        """
+        key = (cls, os.getpid())
+        session = cls._sessions.get(key)
+        if session is None:
+            with cls._sessions_lock:
+                session = cls._sessions.get(key)
+                if session is None:
+                    session = cls._sessions[key] = cls._build_session()
+        return session
+
+    @classmethod
+    def close_session(cls):
+        """Закрыть сессию текущего класса сервиса в текущем процессе."""
+        with cls._sessions_lock:
+            session = cls._sessions.pop((cls, os.getpid()), None)
+        if session is not None:
+            session.close()
+
     def _get_headers(self):
         headers = {}
         if self.token:
             headers['Authorization'] = f'Bearer {self.token}'
         return headers
 
-    def _request(self, method, endpoint, **kwargs):
+    def _make_request_key(self, url, params=None):
+        return hashlib.sha1(repr((type(self).__name__, url, params)).encode()).hexdigest()
+
+    def _request(self, method, endpoint, cache_timeout=0, **kwargs):
+        """Выполнить запрос к сервису.
+
+        :param cache_timeout: Время хранения успешного ответа на GET-запрос в response_cache, сек;
+            None - бессрочно, 0 - не кэшировать
+        """
         url = urljoin(self.host, f'{self.api_path}/{endpoint}')
         headers = self._get_headers()
 
@@ -31,13 +118,80 @@ class BaseAPIService:
             headers.update(kwargs['headers'])
             del kwargs['headers']
 
-        response = requests.request(method, url, headers=headers, **kwargs)
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        # Потоковый ответ читается один раз, поэтому он не кэшируется и не разделяется через single_flight
+        if method != 'GET' or kwargs.get('stream'):
+            return self._send(method, url, headers, **kwargs)
+
+        key = self._make_request_key(url, kwargs.get('params'))
+        use_cache = self.response_cache is not None and cache_timeout != 0
+        if use_cache:
+            response = self.response_cache.get(key)
+            if response is not None:
+                return response
+
+        def fetch():
+            try:
+                response = self._send(method, url, headers, **kwargs)
+            except (CircuitOpenError, *self.transport_errors):
+                stale_response = self._get_stale_response(key) if use_cache else None
+                if stale_response is None:
+                    raise
+                return stale_response
+            if use_cache and response.status_code == 200:
+                self.response_cache.set(key, response, cache_timeout)
+            elif use_cache and response.status_code >= 500:
+                stale_response = self._get_stale_response(key)
+                if stale_response is not None:
+                    return stale_response
+            return response
+
+        if self.single_flight is not None:
+            return self.single_flight.do(key, fetch)
+        return fetch()
+
+    def _get_stale_response(self, key):
+        """Копия истекшего ответа из response_cache с признаком is_stale или None."""
+        response = self.response_cache.get_stale(key)
+        if response is None:
+            return None
+        response = copy.copy(response)
+        response.is_stale = True
+        return response
+
+    def _send(self, method, url, headers, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.circuit_breaker is None:
+            return self.get_session().request(method, url, headers=headers, **kwargs)
+
+        is_probe = self.circuit_breaker.before_call()
+        started_at = time.monotonic()
+        try:
+            response = self.get_session().request(method, url, headers=headers, **kwargs)
+        except requests.RequestException:
+            self.circuit_breaker.record(is_probe, failed=True)
+            raise
+        self.circuit_breaker.record(is_probe, response.status_code >= 500, time.monotonic() - started_at)
         return response
 
     @classmethod
     def get(cls, endpoint, **kwargs):
         return cls()._request('GET', endpoint, **kwargs)
 
+    @classmethod
+    @contextlib.contextmanager
+    def get_stream(cls, endpoint, **kwargs):
+        """GET-запрос, тело ответа которого читается из сокета по мере разбора, см. iter_response_chunks.
+
+        Ответ не кэшируется; соединение возвращается в пул при выходе из блока with.
+        """
+        response = cls()._request('GET', endpoint, stream=True, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+
     @classmethod
     def post(cls, endpoint, **kwargs):
         return cls()._request('POST', endpoint, **kwargs)
@@ -49,3 +203,144 @@ class BaseAPIService:
     @classmethod
     def delete(cls, endpoint, **kwargs):
         return cls()._request('DELETE', endpoint, **kwargs)
+
+
+class AsyncBaseAPIService(BaseAPIService):
+    """Асинхронный вариант BaseAPIService на httpx.
+
+    Один AsyncClient на класс сервиса и событийный цикл, поэтому под uvicorn все запросы воркера
+    используют общий пул из ``async_pool_size`` соединений. Наследник синхронного сервиса
+    (``class AsyncX(AsyncBaseAPIService, X)``) получает его методы, возвращающие корутины.
+    """
+    transport_errors = (httpx.TransportError,)
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """AsyncClient текущего класса сервиса для текущего событийного цикла."""
+        clients = cls._clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(cls)
+        if client is None:
+            client = clients[cls] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=cls.async_pool_size,
+                    max_keepalive_connections=cls.async_pool_size,
+                ),
+                timeout=httpx.Timeout(cls.read_timeout, connect=cls.connect_timeout),
+            )
+        return client
+
+    @classmethod
+    async def close_client(cls):
+        """Закрыть AsyncClient текущего класса сервиса для текущего событийного цикла."""
+        client = cls._clients.get(asyncio.get_running_loop(), {}).pop(cls, None)
+        if client is not None:
+            await client.aclose()
+
+    async def _request(self, method, endpoint, cache_timeout=0, **kwargs):
+        url = urljoin(self.host, f'{self.api_path}/{endpoint}')
+        headers = self._get_headers()
+
+        if kwargs.get('headers'):
+            headers.update(kwargs['headers'])
+            del kwargs['headers']
+
+        if method != 'GET':
+            return await self._send(method, url, headers, **kwargs)
+
+        key = self._make_request_key(url, kwargs.get('params'))
+        use_cache = self.response_cache is not None and cache_timeout != 0
+        if use_cache:
+            response = await self.response_cache.aget(key)
+            if response is not None:
+                return response
+
+        async def fetch():
+            try:
+                response = await self._send(method, url, headers, **kwargs)
+            except (CircuitOpenError, *self.transport_errors):
+                stale_response = await self._aget_stale_response(key) if use_cache else None
+                if stale_response is None:
+                    raise
+                return stale_response
+            if use_cache and response.status_code == 200:
+                await self.response_cache.aset(key, response, cache_timeout)
+            elif use_cache and response.status_code >= 500:
+                stale_response = await self._aget_stale_response(key)
+                if stale_response is not None:
+                    return stale_response
+            return response
+
+        if self.single_flight is not None:
+            return await self.single_flight.ado(key, fetch)
+        return await fetch()
+
+    async def _aget_stale_response(self, key):
+        return await sync_to_async(self._get_stale_response, thread_sensitive=False)(key)
+
+    async def _send(self, method, url, headers, **kwargs):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.aacquire()
+        if self.circuit_breaker is None:
+            return await self._send_with_retries(method, url, headers, **kwargs)
+
+        is_probe = await sync_to_async(self.circuit_breaker.before_call, thread_sensitive=False)()
+        started_at = time.monotonic()
+        try:
+            response = await self._send_with_retries(method, url, headers, **kwargs)
+        except httpx.TransportError:
+            await sync_to_async(self.circuit_breaker.record, thread_sensitive=False)(is_probe, True)
+            raise
+        await sync_to_async(self.circuit_breaker.record, thread_sensitive=False)(
+            is_probe, response.status_code >= 500, time.monotonic() - started_at,
+        )
+        return response
+
+    async def _send_with_retries(self, method, url, headers, **kwargs):
+        client = self.get_client()
+        retries = self.max_retries if method in self.retry_methods else 0
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                response = await client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+                continue
+            if response.status_code not in self.retry_statuses or attempt == retries:
+                return response
+
+    @classmethod
+    async def get(cls, endpoint, **kwargs):
+        return await cls()._request('GET', endpoint, **kwargs)
+
+    @classmethod
+    async def post(cls, endpoint, **kwargs):
+        return await cls()._request('POST', endpoint, **kwargs)
+
+    @classmethod
+    async def put(cls, endpoint, **kwargs):
+        return await cls()._request('PUT', endpoint, **kwargs)
+
+    @classmethod
+    async def delete(cls, endpoint, **kwargs):
+        return await cls()._request('DELETE', endpoint, **kwargs)
+
+
+# Ошибки статуса ответа синхронного (requests) и асинхронного (httpx) клиентов
+UPSTREAM_HTTP_ERRORS = (requests.HTTPError, httpx.HTTPStatusError)
+
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+def iter_response_chunks(response, chunk_size: int = RESPONSE_CHUNK_SIZE):
+    """Тело ответа requests или httpx кусками для инкрементального разбора JSON.
+
+    Тело потокового ответа (get_stream) читается из сокета с распаковкой gzip,
+    уже прочитанное тело (в том числе ответа из кэша) отдается срезами: оно остается в памяти целиком,
+    и такой ответ быстрее разобрать целиком (moex.create_functions.parse_response_block).
+    """
+    if isinstance(response, httpx.Response):
+        return response.iter_bytes(chunk_size)
+    return response.iter_content(chunk_size)
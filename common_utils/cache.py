@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from common_utils.single_flight import REDIS_ERRORS
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш процесса со временем жизни записей."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Вернуть кортеж (найдено ли значение, значение)."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """Двухуровневый кэш: L1 - LRU в памяти процесса, L2 - общий кэш Django (django-redis).
+
+    В L2 вместе со значением хранится момент истечения, чтобы L1, заполненный из L2,
+    не пережил запись в Redis. После истечения запись еще ``stale_timeout`` секунд хранится в L2
+    как устаревшая и доступна через get_stale(), например, пока внешний сервис недоступен.
+    Недоступность Redis считается промахом L2. Счетчики попаданий и промахов ведутся в пределах процесса.
+    """
+    instances = {}
+
+    def __init__(self, namespace: str, l1_max_size: int = 1024, alias: str = 'default', stale_timeout: int = 0):
+        self.namespace = namespace
+        self.alias = alias
+        self.stale_timeout = stale_timeout
+        self.l1 = LRUCache(l1_max_size)
+        self._counters = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'sets': 0, 'stale_hits': 0}
+        self._counters_lock = threading.Lock()
+        TieredCache.instances[namespace] = self
+
+    def _make_key(self, key):
+        return f'tiered:{self.namespace}:{key}'
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def get(self, key, default=None):
+        found, value = self.l1.get(key)
+        if found:
+            self._count('l1_hits')
+            return value
+
+        try:
+            item = caches[self.alias].get(self._make_key(key))
+        except REDIS_ERRORS:
+            item = None
+        if item is None or (item[0] is not None and item[0] <= time.time()):
+            self._count('misses')
+            return default
+
+        expires_at, value = item
+        self.l1.set(key, value, expires_at)
+        self._count('l2_hits')
+        return value
+
+    def set(self, key, value, timeout):
+        """Сохранить значение на timeout секунд, None - бессрочно, 0 - не сохранять."""
+        if timeout is not None and timeout <= 0:
+            return
+        expires_at = time.time() + timeout if timeout is not None else None
+        self.l1.set(key, value, expires_at)
+        try:
+            caches[self.alias].set(
+                self._make_key(key),
+                (expires_at, value),
+                timeout + self.stale_timeout if timeout is not None else None,
+            )
+        except REDIS_ERRORS:
+            pass
+        self._count('sets')
+
+    def get_stale(self, key, default=None):
+        """Получить последнее сохраненное значение, в том числе истекшее."""
+        try:
+            item = caches[self.alias].get(self._make_key(key))
+        except REDIS_ERRORS:
+            item = None
+        if item is None:
+            return default
+        self._count('stale_hits')
+        return item[1]
+
+    def delete(self, key):
+        self.l1.delete(key)
+        try:
+            caches[self.alias].delete(self._make_key(key))
+        except REDIS_ERRORS:
+            pass
+
+    async def aget(self, key, default=None):
+        found, value = self.l1.get(key)
+        if found:
+            self._count('l1_hits')
+            return value
+        return await sync_to_async(self.get, thread_sensitive=False)(key, default)
+
+    async def aset(self, key, value, timeout):
+        await sync_to_async(self.set, thread_sensitive=False)(key, value, timeout)
+
+    async def aget_stale(self, key, default=None):
+        return await sync_to_async(self.get_stale, thread_sensitive=False)(key, default)
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            stats = dict(self._counters)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 4) if lookups else None
+        stats['l1_size'] = len(self.l1)
+        return stats
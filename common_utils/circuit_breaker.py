@@ -0,0 +1,146 @@
+import threading
+import time
+
+from django_redis import get_redis_connection
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from common_utils.single_flight import REDIS_ERRORS
+
+
+class CircuitOpenError(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Внешний сервис временно недоступен, повторите запрос позже'
+    default_code = 'service_unavailable'
+
+
+class CircuitBreaker:
+    """Автоматический выключатель запросов к внешнему сервису, общий для всех воркеров через Redis.
+
+    - closed: запросы проходят, ошибки и медленные ответы считаются в окне ``window`` секунд;
+    - open: после ``failure_threshold`` ошибок в окне запросы ``recovery_timeout`` секунд
+      сразу завершаются CircuitOpenError;
+    - half_open: пропускается один пробный запрос, его успех закрывает выключатель, ошибка - снова открывает.
+
+    Состояние из Redis кэшируется в процессе на ``refresh_interval`` секунд, поэтому успешные
+    запросы почти не обращаются к Redis. При недоступности Redis выключатель считается закрытым.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    instances = {}
+
+    def __init__(self, name: str, failure_threshold: int = 5, window: int = 30, slow_call_threshold: float = 5,
+                 recovery_timeout: int = 30, refresh_interval: float = 0.5):
+        """
+        :param name: Имя внешнего сервиса, префикс ключей в Redis
+        :param failure_threshold: Число ошибок в окне, после которого выключатель открывается
+        :param window: Длина окна подсчета ошибок, сек
+        :param slow_call_threshold: Время ответа, после которого запрос считается ошибкой, сек
+        :param recovery_timeout: Время в открытом состоянии до пробного запроса, сек
+        :param refresh_interval: Время кэширования состояния из Redis в процессе, сек
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.slow_call_threshold = slow_call_threshold
+        self.recovery_timeout = recovery_timeout
+        self.refresh_interval = refresh_interval
+        self._state = self.CLOSED
+        self._state_checked_at = 0
+        self._lock = threading.Lock()
+        self._counters = {'rejected': 0, 'failures': 0, 'trips': 0}
+        CircuitBreaker.instances[name] = self
+
+    def _key(self, suffix):
+        return f'circuit_breaker:{self.name}:{suffix}'
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _read_state(self, connection) -> str:
+        pipeline = connection.pipeline().exists(self._key('open')).exists(self._key('half_open'))
+        is_open, is_half_open = pipeline.execute()
+        if is_open:
+            return self.OPEN
+        return self.HALF_OPEN if is_half_open else self.CLOSED
+
+    def get_state(self) -> str:
+        now = time.monotonic()
+        if now - self._state_checked_at < self.refresh_interval:
+            return self._state
+        try:
+            state = self._read_state(get_redis_connection('default'))
+        except REDIS_ERRORS:
+            state = self.CLOSED
+        self._state, self._state_checked_at = state, now
+        return state
+
+    def before_call(self) -> bool:
+        """Проверить, можно ли выполнить запрос.
+
+        :return: True, если запрос пробный (half_open)
+        :raises CircuitOpenError: Выключатель открыт или пробный запрос уже выполняется другим вызывающим
+        """
+        state = self.get_state()
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN:
+            try:
+                probe_acquired = get_redis_connection('default').set(
+                    self._key('probe'), 1, nx=True, px=int(self.recovery_timeout * 1000),
+                )
+            except REDIS_ERRORS:
+                return False
+            if probe_acquired:
+                return True
+        self._count('rejected')
+        raise CircuitOpenError()
+
+    def record(self, is_probe: bool, failed: bool, duration: float = 0):
+        """Учесть результат запроса: ошибку, медленный ответ или успех."""
+        failed = failed or duration > self.slow_call_threshold
+        try:
+            connection = get_redis_connection('default')
+            if not failed:
+                if is_probe:
+                    connection.delete(self._key('half_open'), self._key('failures'), self._key('probe'))
+                    self._set_local_state(self.CLOSED)
+                return
+
+            self._count('failures')
+            if is_probe:
+                self._trip(connection)
+                return
+            failures_key = self._key('failures')
+            pipeline = connection.pipeline().incr(failures_key).expire(failures_key, self.window, nx=True)
+            failures, _ = pipeline.execute()
+            if failures >= self.failure_threshold:
+                self._trip(connection)
+        except REDIS_ERRORS:
+            pass
+
+    def _trip(self, connection):
+        pipeline = connection.pipeline()
+        pipeline.set(self._key('open'), 1, px=int(self.recovery_timeout * 1000))
+        pipeline.set(self._key('half_open'), 1)
+        pipeline.delete(self._key('failures'), self._key('probe'))
+        pipeline.execute()
+        self._count('trips')
+        self._set_local_state(self.OPEN)
+
+    def _set_local_state(self, state):
+        self._state, self._state_checked_at = state, time.monotonic()
+
+    def stats(self) -> dict:
+        try:
+            connection = get_redis_connection('default')
+            state = self._read_state(connection)
+            window_failures = int(connection.get(self._key('failures')) or 0)
+        except REDIS_ERRORS:
+            state, window_failures = None, None
+        with self._lock:
+            counters = dict(self._counters)
+        return {'state': state, 'window_failures': window_failures, **counters}
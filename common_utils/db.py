@@ -0,0 +1,24 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+
+def run_in_thread(func):
+    """Обертка синхронной функции с запросами к БД для вызова из асинхронного кода.
+
+    В отличие от ``sync_to_async(func)`` с thread_sensitive=True вызовы выполняются в пуле потоков
+    событийного цикла, а не по очереди в одном общем потоке, поэтому долгий запрос (например,
+    загрузка свечей из MOEX ISS) не задерживает остальные. Соединения с БД потока пула закрываются
+    после вызова: сам поток их не закроет.
+
+    :return: Корутинная функция с теми же аргументами
+    """
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return sync_to_async(call, thread_sensitive=False)
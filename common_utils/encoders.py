@@ -0,0 +1,288 @@
+import csv
+import functools
+import io
+
+import msgpack
+import orjson
+import pyarrow
+from rest_framework import serializers
+
+# Поля, представление которых совпадает с приведением к встроенному типу
+BUILTIN_CONVERTERS = {
+    serializers.FloatField: 'float',
+    serializers.IntegerField: 'int',
+    serializers.CharField: 'str',
+    serializers.BooleanField: 'bool',
+}
+# Поля даты и времени, которые возвращают непустую строку без изменений (как в ответах MOEX ISS)
+TEMPORAL_FIELDS = (serializers.DateTimeField, serializers.DateField, serializers.TimeField)
+# Типы столбцов Arrow для полей сериализатора; дата и время передаются строками, как в ответах MOEX ISS
+ARROW_TYPES = {
+    serializers.FloatField: pyarrow.float64(),
+    serializers.IntegerField: pyarrow.int64(),
+    serializers.CharField: pyarrow.string(),
+    serializers.BooleanField: pyarrow.bool_(),
+    serializers.DateTimeField: pyarrow.string(),
+    serializers.DateField: pyarrow.string(),
+    serializers.TimeField: pyarrow.string(),
+}
+
+
+class RowEncoder:
+    """Кодирование списков словарей в JSON по полям DRF-сериализатора без создания объектов на каждое значение.
+
+    Для сериализатора один раз генерируется функция, собирающая словарь представления строки
+    с теми же приведениями типов, что и to_representation полей, после чего список кодируется orjson.
+    Результат совпадает с ``JSONRenderer().render(serializer_class(rows, many=True).data)``.
+    Для табличных форматов (ColumnarFormat) генерируется такая же функция, возвращающая кортеж значений.
+    """
+
+    def __init__(self, serializer_class, fields: tuple[str, ...] | None = None):
+        self.serializer_class = serializer_class
+        self.fields = fields
+        serializer = serializer_class()
+        self.column_fields = {
+            name: field for name, field in serializer.fields.items()
+            if not field.write_only and (fields is None or name in fields)
+        }
+        self.columns = list(self.column_fields)
+        self.encode_row = self._compile(serializer, fields)
+        self.encode_values = self._compile(serializer, fields, as_tuple=True)
+
+    @classmethod
+    @functools.cache
+    def for_serializer(cls, serializer_class, fields: tuple[str, ...] | None = None) -> 'RowEncoder':
+        """Кодировщик для сериализатора и набора полей верхнего уровня (None - все поля), создается один раз."""
+        return cls(serializer_class, fields)
+
+    @classmethod
+    def _compile(cls, serializer, fields=None, as_tuple=False):
+        converters = {}
+        items = []
+        for index, (name, field) in enumerate(serializer.fields.items()):
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            converter = cls._get_converter(field)
+            if converter not in BUILTIN_CONVERTERS.values():
+                converters[f'_c{index}'] = converter
+                converter = f'_c{index}'
+            value = f'None if (v := row[{field.source!r}]) is None else {converter}(v)'
+            items.append(value if as_tuple else f'{name!r}: {value}')
+
+        arguments = ''.join(f', {argument}={argument}' for argument in converters)
+        body = f'({"".join(f"{item}, " for item in items)})' if as_tuple else f'{{{", ".join(items)}}}'
+        source = f'def encode_row(row{arguments}):\n    return {body}\n'
+        namespace = dict(converters)
+        exec(compile(source, f'<RowEncoder {type(serializer).__name__}>', 'exec'), namespace)
+        return namespace['encode_row']
+
+    @classmethod
+    def _get_converter(cls, field):
+        if isinstance(field, serializers.ListSerializer):
+            encode_child = cls._compile(field.child)
+            return lambda value: [encode_child(item) for item in value]
+        if isinstance(field, serializers.Serializer):
+            return cls._compile(field)
+        if type(field) in BUILTIN_CONVERTERS:
+            return BUILTIN_CONVERTERS[type(field)]
+        if isinstance(field, TEMPORAL_FIELDS):
+            to_representation = field.to_representation
+            return lambda value: value if value.__class__ is str and value else to_representation(value)
+        return field.to_representation
+
+    def encode(self, rows) -> bytes:
+        """Закодировать список строк в JSON-массив."""
+        encode_row = self.encode_row
+        return orjson.dumps([encode_row(row) for row in rows])
+
+
+class RowFormat:
+    """Формат тела ответа со списком строк.
+
+    Тело собирается из начала, страниц строк и конца, поэтому длинные списки (свечи за годы)
+    можно отдавать потоком по страницам: ``start() + page(rows1) + page(rows2) + ... + end()``.
+    """
+    media_type = None
+    charset = None
+
+    @property
+    def content_type(self) -> str:
+        return f'{self.media_type}; charset={self.charset}' if self.charset else self.media_type
+
+    def start(self) -> bytes:
+        return b''
+
+    def page(self, rows: list) -> bytes:
+        raise NotImplementedError
+
+    def end(self) -> bytes:
+        return b''
+
+    def encode(self, rows: list) -> bytes:
+        """Тело ответа целиком."""
+        return self.start() + self.page(rows) + self.end()
+
+
+class JSONArrayFormat(RowFormat):
+    """JSON-массив объектов, склеенный из JSON-массивов страниц."""
+    media_type = 'application/json'
+
+    def __init__(self, encode_rows):
+        """:param encode_rows: Функция, кодирующая список строк в JSON-массив, например RowEncoder.encode"""
+        self.encode_rows = encode_rows
+        self.separator = b''
+
+    def start(self) -> bytes:
+        return b'['
+
+    def page(self, rows: list) -> bytes:
+        if not rows:
+            return b''
+        chunk = self.separator + self.encode_rows(rows)[1:-1]
+        self.separator = b','
+        return chunk
+
+    def end(self) -> bytes:
+        return b']'
+
+
+class ColumnarFormat(RowFormat):
+    """Табличный формат: имена столбцов один раз, затем значения строк без имен полей.
+
+    :param columns: Имена столбцов
+    :param encode_values: Функция, возвращающая кортеж значений строки в порядке столбцов
+    :param column_fields: Поля сериализатора по именам столбцов, по ним выбираются типы столбцов
+    """
+
+    def __init__(self, columns: list[str], encode_values, column_fields: dict | None = None):
+        self.columns = columns
+        self.encode_values = encode_values
+        self.column_fields = column_fields
+
+    @classmethod
+    def for_encoder(cls, encoder: RowEncoder) -> 'ColumnarFormat':
+        """Формат для строк, представление которых строит RowEncoder."""
+        return cls(encoder.columns, encoder.encode_values, encoder.column_fields)
+
+    @classmethod
+    def for_rows(cls, rows: list[dict]) -> 'ColumnarFormat':
+        """Формат для готовых словарей, например данных Response: столбцы - ключи первой строки."""
+        columns = list(rows[0]) if rows else []
+        return cls(columns, lambda row: tuple(row.get(column) for column in columns))
+
+
+class ColumnsJSONFormat(ColumnarFormat):
+    """JSON в виде блока MOEX ISS: ``{"columns": [...], "data": [[...], ...]}``."""
+    media_type = 'application/vnd.finance.columns+json'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.separator = b''
+
+    def start(self) -> bytes:
+        return b'{"columns":%s,"data":[' % orjson.dumps(self.columns)
+
+    def page(self, rows: list) -> bytes:
+        if not rows:
+            return b''
+        encode_values = self.encode_values
+        chunk = self.separator + orjson.dumps([encode_values(row) for row in rows])[1:-1]
+        self.separator = b','
+        return chunk
+
+    def end(self) -> bytes:
+        return b']}'
+
+
+class CSVFormat(ColumnarFormat):
+    """CSV с заголовком; пустое значение - None."""
+    media_type = 'text/csv'
+    charset = 'utf-8'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+
+    def _drain(self) -> bytes:
+        chunk = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+    def start(self) -> bytes:
+        self.writer.writerow(self.columns)
+        return self._drain()
+
+    def page(self, rows: list) -> bytes:
+        self.writer.writerows(map(self.encode_values, rows))
+        return self._drain()
+
+
+class MessagePackFormat(ColumnarFormat):
+    """MessagePack с той же структурой, что и ColumnsJSONFormat.
+
+    Длина массива MessagePack записывается перед элементами, поэтому тело собирается в конце, а не потоком.
+    """
+    media_type = 'application/msgpack'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data = []
+
+    def page(self, rows: list) -> bytes:
+        self.data.extend(map(self.encode_values, rows))
+        return b''
+
+    def end(self) -> bytes:
+        return msgpack.packb({'columns': self.columns, 'data': self.data})
+
+
+class ArrowStreamFormat(ColumnarFormat):
+    """Apache Arrow IPC (streaming format): схема, затем по одному RecordBatch на страницу."""
+    media_type = 'application/vnd.apache.arrow.stream'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sink = io.BytesIO()
+        self.writer = None
+        self.schema = None
+        if self.column_fields is not None:
+            types = [ARROW_TYPES.get(type(field)) for field in self.column_fields.values()]
+            if None not in types:
+                self.schema = pyarrow.schema(list(zip(self.columns, types)))
+
+    def _drain(self) -> bytes:
+        chunk = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return chunk
+
+    def start(self) -> bytes:
+        # Без типов полей схема выводится по первой странице
+        if self.schema is not None:
+            self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+        return self._drain()
+
+    def page(self, rows: list) -> bytes:
+        if not rows:
+            return b''
+        values = zip(*map(self.encode_values, rows))
+        if self.schema is None:
+            batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(column) for column in values], self.columns)
+            self.schema = batch.schema
+            self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+        else:
+            batch = pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(values, self.schema)],
+                schema=self.schema,
+            )
+        self.writer.write_batch(batch)
+        return self._drain()
+
+    def end(self) -> bytes:
+        if self.writer is None:
+            self.schema = self.schema or pyarrow.schema([(column, pyarrow.null()) for column in self.columns])
+            self.writer = pyarrow.ipc.new_stream(self.sink, self.schema)
+        self.writer.close()
+        return self._drain()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import weakref
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class _AsyncBatch:
+    def __init__(self):
+        self.items = []
+        self.full = asyncio.Event()
+        self.task = None
+
+
+class MicroBatcher:
+    """Объединение одновременных вызовов в пакеты: один запрос к сервису на пакет вместо запроса на вызов.
+
+    Первый вызов открывает пакет и ждет остальные до ``max_wait`` секунд или до ``max_size`` элементов,
+    затем выполняет fn(элементы пакета) и раздает результаты ожидающим по порядку элементов. Ошибка
+    fn получают все вызовы пакета. Фоновых потоков нет: пакет выполняет открывший его вызов.
+    Пакеты собираются внутри процесса (в асинхронном коде - внутри событийного цикла).
+    """
+    instances = {}
+
+    def __init__(self, name: str, max_size: int = 32, max_wait: float = 0.005):
+        """
+        :param name: Имя для счетчиков (см. stats)
+        :param max_size: Наибольшее число элементов в пакете; пакет из max_size элементов выполняется сразу
+        :param max_wait: Наибольшее ожидание других вызовов открывшим пакет вызовом, сек
+        """
+        self.name = name
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._batch = None
+        self._lock = threading.Lock()
+        self._async_batches = weakref.WeakKeyDictionary()
+        self._async_tasks = set()
+        self._counters = {'batches': 0, 'items': 0, 'full_batches': 0}
+        MicroBatcher.instances[name] = self
+
+    def _count(self, size, is_full):
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['items'] += size
+            self._counters['full_batches'] += is_full
+
+    @staticmethod
+    def _check_results(results, items):
+        if len(results) != len(items):
+            raise ValueError(f'Получено {len(results)} результатов на пакет из {len(items)} элементов')
+        return results
+
+    def submit(self, item, fn):
+        """Добавить элемент в пакет и дождаться его результата.
+
+        :param item: Элемент пакета
+        :param fn: Функция, принимающая список элементов и возвращающая список результатов того же порядка
+        :return: Результат для item
+        """
+        with self._lock:
+            batch = self._batch
+            is_leader = batch is None
+            if is_leader:
+                batch = self._batch = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                self._batch = None
+                batch.full.set()
+
+        if not is_leader:
+            batch.done.wait()
+        else:
+            is_full = batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._count(len(batch.items), is_full)
+            try:
+                batch.results = self._check_results(fn(batch.items), batch.items)
+            except Exception as exc:
+                batch.error = exc
+            finally:
+                batch.done.set()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    async def asubmit(self, item, fn):
+        """Асинхронный вариант submit(), fn - функция, возвращающая корутину.
+
+        Пакет выполняется отдельной задачей, которую открывший его вызов только запускает: отмена любого
+        из вызовов (в том числе открывшего пакет) не отменяет пакет для остальных.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._async_batches.get(loop)
+        if batch is None:
+            batch = self._async_batches[loop] = _AsyncBatch()
+            batch.task = asyncio.ensure_future(self._run_async_batch(loop, batch, fn))
+            # Событийный цикл хранит только слабые ссылки на задачи
+            self._async_tasks.add(batch.task)
+            batch.task.add_done_callback(self._finish_async_batch)
+        index = len(batch.items)
+        batch.items.append(item)
+        if len(batch.items) >= self.max_size:
+            del self._async_batches[loop]
+            batch.full.set()
+        return (await asyncio.shield(batch.task))[index]
+
+    async def _run_async_batch(self, loop, batch, fn):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._async_batches.get(loop) is batch:
+                del self._async_batches[loop]
+        self._count(len(batch.items), batch.full.is_set())
+        return self._check_results(await fn(batch.items), batch.items)
+
+    def _finish_async_batch(self, task):
+        self._async_tasks.discard(task)
+        # Ошибку пакета получают ожидающие вызовы, но все они могли быть отменены
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters['average_size'] = round(counters['items'] / counters['batches'], 2) if counters['batches'] else None
+        return {'max_size': self.max_size, 'max_wait': self.max_wait, **counters}
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Ограничение частоты запросов процесса: не более ``rate`` запросов в секунду, равномерно.
+
+    Каждый вызывающий резервирует ближайший свободный слот под блокировкой и ждет его уже без нее,
+    поэтому ожидающие потоки не мешают друг другу.
+    """
+
+    def __init__(self, rate: float):
+        """
+        :param rate: Допустимое число запросов в секунду
+        """
+        self.interval = 1 / rate
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Зарезервировать слот и вернуть время ожидания до него, сек."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        return slot - now
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,57 @@
+from rest_framework.renderers import BaseRenderer
+
+from common_utils.encoders import ArrowStreamFormat, ColumnsJSONFormat, CSVFormat, MessagePackFormat
+
+
+class RowFormatRenderer(BaseRenderer):
+    """Рендерер DRF для табличного формата ответа (ColumnarFormat).
+
+    Списки строк представления с RowEncodingMixin кодируются форматом напрямую, минуя рендерер
+    (см. RowEncodingMixin.get_row_format). Рендерер выбирается согласованием по заголовку Accept
+    или параметру ``?format=`` и кодирует остальные ответы, например ошибки: словарь - одна строка.
+    """
+    row_format = None
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = [data] if isinstance(data, dict) else list(data)
+        return self.row_format.for_rows(rows).encode(rows)
+
+
+class ColumnsJSONRenderer(RowFormatRenderer):
+    media_type = ColumnsJSONFormat.media_type
+    format = 'columns'
+    row_format = ColumnsJSONFormat
+
+
+class CSVRenderer(RowFormatRenderer):
+    media_type = CSVFormat.media_type
+    format = 'csv'
+    charset = CSVFormat.charset
+    row_format = CSVFormat
+
+
+class MessagePackRenderer(RowFormatRenderer):
+    media_type = MessagePackFormat.media_type
+    format = 'msgpack'
+    row_format = MessagePackFormat
+
+
+class ArrowStreamRenderer(RowFormatRenderer):
+    media_type = ArrowStreamFormat.media_type
+    format = 'arrow'
+    row_format = ArrowStreamFormat
+
+
+# Табличные форматы, которые представление предлагает в дополнение к рендерерам DRF по умолчанию
+ROW_FORMAT_RENDERERS = [ColumnsJSONRenderer, CSVRenderer, MessagePackRenderer, ArrowStreamRenderer]
+
+ROW_FORMATS_DESCRIPTION = (
+    'Формат ответа выбирается заголовком Accept или параметром format: JSON (по умолчанию), '
+    f'столбцы и массивы значений в JSON ({ColumnsJSONRenderer.media_type}, format=columns), '
+    'CSV (text/csv, format=csv), MessagePack со структурой как у JSON со столбцами '
+    f'({MessagePackRenderer.media_type}, format=msgpack), Apache Arrow IPC '
+    f'({ArrowStreamRenderer.media_type}, format=arrow). Ответ сжимается brotli или gzip по Accept-Encoding.'
+)
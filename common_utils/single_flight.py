@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import LockError, RedisError
+
+REDIS_ERRORS = (RedisError, ConnectionInterrupted)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов: выполняет один вызывающий, остальные ждут его результат.
+
+    Внутри процесса ожидающие блокируются на threading.Event (или asyncio.Future в асинхронном коде),
+    между воркерами gunicorn - на блокировке в Redis (CACHES['default']), после снятия которой
+    результат забирается из ключа результата. Результат должен сериализоваться через pickle.
+    """
+
+    def __init__(self, namespace: str, lock_timeout: float = 15, result_timeout: float = 1,
+                 poll_interval: float = 0.02):
+        """
+        :param namespace: Префикс ключей в Redis
+        :param lock_timeout: Время жизни блокировки и максимальное ожидание чужого результата, сек
+        :param result_timeout: Время жизни ключа результата для ожидающих в других процессах, сек
+        :param poll_interval: Интервал опроса ключа результата, сек
+        """
+        self.namespace = namespace
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._calls_lock = threading.Lock()
+        self._async_calls = {}
+
+    def _lock_key(self, key):
+        return f'single_flight:{self.namespace}:{key}:lock'
+
+    def _result_key(self, key):
+        return f'single_flight:{self.namespace}:{key}:result'
+
+    def do(self, key: str, fn):
+        """Выполнить fn() один раз для всех одновременных вызовов с одинаковым ключом."""
+        with self._calls_lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._calls_lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key: str, fn):
+        """Асинхронный вариант do(), fn - функция, возвращающая корутину."""
+        calls = self._async_calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._ado_shared(key, fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Исключение уже получит лидер, ожидающие могут отсутствовать
+            future.exception()
+            raise
+        finally:
+            del calls[key]
+
+    def _acquire(self, key):
+        """Захватить блокировку в Redis или дождаться результата другого процесса.
+
+        :return: Кортеж (блокировка или None, результат другого процесса или None)
+        """
+        try:
+            lock = cache.lock(self._lock_key(key), timeout=self.lock_timeout, thread_local=False)
+            waited = False
+            deadline = time.monotonic() + self.lock_timeout
+            while not lock.acquire(blocking=False):
+                waited = True
+                result = cache.get(self._result_key(key))
+                if result is not None:
+                    return None, result
+                if time.monotonic() > deadline:
+                    return None, None
+                time.sleep(self.poll_interval)
+            if waited:
+                result = cache.get(self._result_key(key))
+                if result is not None:
+                    self._release(lock)
+                    return None, result
+            return lock, None
+        except REDIS_ERRORS:
+            # Без Redis объединяем запросы только внутри процесса
+            return None, None
+
+    def _publish(self, key, lock, result):
+        if lock is None:
+            return
+        try:
+            cache.set(self._result_key(key), result, self.result_timeout)
+        except REDIS_ERRORS:
+            pass
+        finally:
+            self._release(lock)
+
+    @staticmethod
+    def _release(lock):
+        try:
+            lock.release()
+        except (LockError, *REDIS_ERRORS):
+            pass
+
+    def _do_shared(self, key, fn):
+        lock, result = self._acquire(key)
+        if result is not None:
+            return result
+        try:
+            result = fn()
+        except Exception:
+            if lock is not None:
+                self._release(lock)
+            raise
+        self._publish(key, lock, result)
+        return result
+
+    async def _ado_shared(self, key, fn):
+        lock, result = await sync_to_async(self._acquire, thread_sensitive=False)(key)
+        if result is not None:
+            return result
+        try:
+            result = await fn()
+        except Exception:
+            if lock is not None:
+                await sync_to_async(self._release, thread_sensitive=False)(lock)
+            raise
+        await sync_to_async(self._publish, thread_sensitive=False)(key, lock, result)
+        return result
@@ -0,0 +1,181 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from drf_spectacular.utils import OpenApiExample, OpenApiParameter
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from common_utils.encoders import JSONArrayFormat, RowEncoder, RowFormat
+
+
+def extend_schema_from(view_method):
+    """Перенести описание схемы drf-spectacular с обработчика другого представления.
+
+    Нужно асинхронным представлениям, которые переопределяют ``get`` синхронного родителя
+    и иначе теряют его ``@extend_schema``.
+    """
+    def decorator(method):
+        method.kwargs = view_method.kwargs
+        return method
+    return decorator
+
+
+def add_stale_headers(response, is_stale: bool = True):
+    """Пометить ответ, построенный по устаревшим данным внешнего сервиса.
+
+    Добавляет заголовок ``Warning: 110`` и запрещает кэширование ответа, в том числе через cache_page.
+
+    :param response: Ответ представления
+    :param is_stale: Устарели ли данные, например ``getattr(upstream_response, 'is_stale', False)``
+    :return: Тот же ответ
+    """
+    if is_stale:
+        response['Warning'] = '110 - "Response is Stale"'
+        add_never_cache_headers(response)
+    return response
+
+
+def make_etag(request, *versions) -> str:
+    """Сильный ETag ответа: хеш пути запроса с параметрами, выбранного формата и версии данных ответа.
+
+    :param request: Запрос
+    :param versions: Версия данных: тело ответа внешнего сервиса, номер версии снимка и т.п.
+    :return: ETag в кавычках
+    """
+    digest = hashlib.blake2b(request.get_full_path().encode(), digest_size=16)
+    digest.update(b'\0')
+    digest.update(getattr(request, 'accepted_media_type', '').encode())
+    for version in versions:
+        digest.update(b'\0')
+        digest.update(version if isinstance(version, bytes) else str(version).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def get_upstream_validators(request, response) -> tuple[str, float | None]:
+    """ETag по телу ответа внешнего сервиса и Last-Modified по его заголовку Date.
+
+    Читает тело целиком, поэтому подходит только для прочитанного ответа (get), а не для get_stream.
+    """
+    return make_etag(request, response.content), parse_http_date_safe(response.headers.get('Date'))
+
+
+def add_validator_headers(response, etag: str, last_modified: float | None = None):
+    """Добавить к ответу заголовки ETag и Last-Modified.
+
+    :param last_modified: Время изменения данных, timestamp
+    :return: Тот же ответ
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def get_not_modified_response(request, etag: str, last_modified: float | None = None):
+    """Ответ 304 Not Modified, если у клиента актуальная версия данных, иначе None.
+
+    Проверяется до разбора и сериализации данных, поэтому неизменившиеся данные не стоят ни CPU,
+    ни трафика.
+
+    :param request: Запрос с заголовками If-None-Match или If-Modified-Since
+    :param etag: ETag актуальной версии, см. make_etag
+    :param last_modified: Время изменения данных, timestamp
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return add_validator_headers(response, etag, last_modified)
+
+
+def fields_parameter(serializer_class, example: str) -> OpenApiParameter:
+    """Описание параметра запроса ``fields`` для представлений с RowEncodingMixin."""
+    return OpenApiParameter(
+        name='fields',
+        location=OpenApiParameter.QUERY,
+        description=(
+            'Нужные поля ответа через запятую, по умолчанию - все поля. '
+            f'Допустимые значения: {", ".join(serializer_class().fields)}'
+        ),
+        examples=[OpenApiExample(example, value=example)],
+        type=str,
+    )
+
+
+class RowEncodingMixin:
+    """Отдача списков строк в JSON через RowEncoder, минуя serializer_class(many=True).
+
+    Включается в представлении атрибутом ``fast_encoding = True``. Схема drf-spectacular
+    по-прежнему строится по ``serializer_class``. Параметр запроса ``?fields=`` ограничивает
+    поля ответа, см. get_fields. Если в ``renderer_classes`` представления есть рендереры
+    табличных форматов (common_utils.renderers), списки строк кодируются выбранным по Accept форматом.
+    """
+    fast_encoding = False
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if any(getattr(renderer, 'row_format', None) for renderer in self.renderer_classes):
+            patch_vary_headers(response, ('Accept',))
+        return response
+
+    def get_row_format(self, fields: tuple[str, ...] | None = None) -> RowFormat | None:
+        """Табличный формат, выбранный согласованием DRF, или None для JSON."""
+        row_format = getattr(getattr(self.request, 'accepted_renderer', None), 'row_format', None)
+        if row_format is None:
+            return None
+        return row_format.for_encoder(RowEncoder.for_serializer(self.serializer_class, fields))
+
+    def get_page_format(self, fields: tuple[str, ...] | None = None) -> RowFormat:
+        """Формат для отдачи строк потоком по страницам: выбранный табличный формат или JSON-массив."""
+        row_format = self.get_row_format(fields)
+        if row_format is not None:
+            return row_format
+        return JSONArrayFormat(lambda rows: self.encode_rows(rows, fields))
+
+    def get_fields(self, request) -> tuple[str, ...] | None:
+        """Поля ответа из параметра запроса ``fields`` в порядке полей сериализатора.
+
+        :return: Кортеж имен полей или None, если параметр не передан
+        :raises ParseError: Неизвестное поле
+        """
+        fields_string = request.query_params.get('fields')
+        if not fields_string:
+            return None
+        fields = {field.strip() for field in fields_string.split(',') if field.strip()}
+        serializer_fields = self.serializer_class().fields
+        unknown_fields = fields - set(serializer_fields)
+        if unknown_fields:
+            raise ParseError(f'Неизвестные поля: {", ".join(sorted(unknown_fields))}')
+        return tuple(name for name in serializer_fields if name in fields)
+
+    def get_serializer_sources(self, fields: tuple[str, ...] | None) -> tuple[str, ...] | None:
+        """Ключи строк, из которых берутся значения полей, например для projection при парсинге."""
+        if fields is None:
+            return None
+        serializer_fields = self.serializer_class().fields
+        return tuple(serializer_fields[name].source for name in fields)
+
+    def encode_rows(self, rows: list[dict], fields: tuple[str, ...] | None = None) -> bytes:
+        if self.fast_encoding:
+            return RowEncoder.for_serializer(self.serializer_class, fields).encode(rows)
+        return JSONRenderer().render(self.serialize_rows(rows, fields))
+
+    def rows_response(self, rows: list[dict], fields: tuple[str, ...] | None = None):
+        row_format = self.get_row_format(fields)
+        if row_format is not None:
+            return HttpResponse(row_format.encode(rows), content_type=row_format.content_type)
+        if self.fast_encoding:
+            return HttpResponse(self.encode_rows(rows, fields), content_type='application/json')
+        return Response(status=status.HTTP_200_OK, data=self.serialize_rows(rows, fields))
+
+    def serialize_rows(self, rows: list[dict], fields: tuple[str, ...] | None = None):
+        serializer = self.serializer_class(rows, many=True)
+        if fields is not None:
+            for name in set(serializer.child.fields) - set(fields):
+                serializer.child.fields.pop(name)
+        return serializer.data
@@ -13,4 +13,29 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """Приложение Django с обработкой событий lifespan сервера ASGI (uvicorn).
+
+    Сам Django lifespan не поддерживает. При запуске воркера загружается локальная модель,
+    как в post_worker_init под gunicorn (см. gunicorn.conf.py); если ее загрузка невозможна
+    (нет Keras), воркер не запускается.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            from machine_learning.inference import warm_up
+
+            try:
+                warm_up()
+            except Exception as error:
+                await send({'type': 'lifespan.startup.failed', 'message': str(error)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
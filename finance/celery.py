@@ -14,4 +14,32 @@ app.conf.beat_schedule = {
         'task': 'machine_learning.tasks.update_all_predictions_metrics',
         'schedule': crontab(hour=5, minute=0),  # Каждый день в 8:00 утра
     },
+    'precompute-predictions-after-hourly-candle-close': {
+        'task': 'machine_learning.tasks.precompute_predictions',
+        'schedule': crontab(minute=1),  # Каждый час сразу после закрытия часовой свечи
+        'options': {'expires': 60 * 50},
+    },
+    'update-board-snapshot-during-trading': {
+        'task': 'moex.tasks.update_board_snapshot',
+        'schedule': settings.MOEX_BOARD_SNAPSHOT['INTERVAL'],
+        'options': {'expires': settings.MOEX_BOARD_SNAPSHOT['INTERVAL']},
+    },
+    'update-trade-tapes-during-trading': {
+        'task': 'moex.tasks.update_trade_tapes',
+        'schedule': settings.MOEX_TRADE_TAPE['INTERVAL'],
+        'options': {'expires': settings.MOEX_TRADE_TAPE['INTERVAL']},
+    },
+    'update-orderbooks-during-trading': {
+        'task': 'moex.tasks.update_orderbooks',
+        'schedule': settings.MOEX_LIVE['ORDERBOOK_INTERVAL'],
+        'options': {'expires': settings.MOEX_LIVE['ORDERBOOK_INTERVAL']},
+    },
+    'warm-up-market-data-cache-at-working-day-session-start': {
+        'task': 'moex.tasks.warm_up_market_data_cache',
+        'schedule': crontab(hour=3, minute=0, day_of_week='mon-fri'),  # По будням в 6:00 по Москве
+    },
+    'warm-up-market-data-cache-at-day-off-session-start': {
+        'task': 'moex.tasks.warm_up_market_data_cache',
+        'schedule': crontab(hour=6, minute=0, day_of_week='sat,sun'),  # По выходным в 9:00 по Москве
+    },
 }
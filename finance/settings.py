@@ -45,12 +45,15 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'client',
     'moex',
+    'machine_learning',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'common_utils.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -75,6 +78,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'finance.wsgi.application'
+ASGI_APPLICATION = 'finance.asgi.application'
+
+# Асинхронные представления рыночных данных и прогнозов; включать при запуске через uvicorn (ASGI)
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
 
 
 # Database
@@ -157,6 +164,134 @@ SERVICE_TOKENS = {
     'ML_SERVICE_TOKEN': env.str('ML_SERVICE_TOKEN')
 }
 
+# Пул соединений, таймауты (в секундах), повторы и объединение GET-запросов к внешним сервисам
+SERVICE_HTTP_OPTIONS = {
+    'MOEX_SERVICE': {
+        'POOL_SIZE': env.int('MOEX_SERVICE_POOL_SIZE', default=20),
+        'ASYNC_POOL_SIZE': env.int('MOEX_SERVICE_ASYNC_POOL_SIZE', default=200),
+        'CONNECT_TIMEOUT': env.float('MOEX_SERVICE_CONNECT_TIMEOUT', default=3.05),
+        'READ_TIMEOUT': env.float('MOEX_SERVICE_READ_TIMEOUT', default=10),
+        'MAX_RETRIES': env.int('MOEX_SERVICE_MAX_RETRIES', default=3),
+        'BACKOFF_FACTOR': env.float('MOEX_SERVICE_BACKOFF_FACTOR', default=0.3),
+        'SINGLE_FLIGHT': env.bool('MOEX_SERVICE_SINGLE_FLIGHT', default=True),
+        'SINGLE_FLIGHT_LOCK_TIMEOUT': env.float('MOEX_SERVICE_SINGLE_FLIGHT_LOCK_TIMEOUT', default=15),
+        'SINGLE_FLIGHT_RESULT_TIMEOUT': env.float('MOEX_SERVICE_SINGLE_FLIGHT_RESULT_TIMEOUT', default=1),
+        # Число страниц свечей, загружаемых одновременно
+        'CANDLES_MAX_WORKERS': env.int('MOEX_SERVICE_CANDLES_MAX_WORKERS', default=4),
+        'CIRCUIT_BREAKER': {
+            'FAILURE_THRESHOLD': env.int('MOEX_SERVICE_CB_FAILURE_THRESHOLD', default=5),
+            'WINDOW': env.int('MOEX_SERVICE_CB_WINDOW', default=30),
+            'SLOW_CALL_THRESHOLD': env.float('MOEX_SERVICE_CB_SLOW_CALL_THRESHOLD', default=5),
+            'RECOVERY_TIMEOUT': env.int('MOEX_SERVICE_CB_RECOVERY_TIMEOUT', default=30),
+        },
+    },
+    'ML_SERVICE': {
+        'POOL_SIZE': env.int('ML_SERVICE_POOL_SIZE', default=10),
+        'ASYNC_POOL_SIZE': env.int('ML_SERVICE_ASYNC_POOL_SIZE', default=50),
+        'CONNECT_TIMEOUT': env.float('ML_SERVICE_CONNECT_TIMEOUT', default=3.05),
+        'READ_TIMEOUT': env.float('ML_SERVICE_READ_TIMEOUT', default=30),
+        'MAX_RETRIES': env.int('ML_SERVICE_MAX_RETRIES', default=2),
+        'BACKOFF_FACTOR': env.float('ML_SERVICE_BACKOFF_FACTOR', default=0.5),
+        'CIRCUIT_BREAKER': {
+            'FAILURE_THRESHOLD': env.int('ML_SERVICE_CB_FAILURE_THRESHOLD', default=5),
+            'WINDOW': env.int('ML_SERVICE_CB_WINDOW', default=60),
+            'SLOW_CALL_THRESHOLD': env.float('ML_SERVICE_CB_SLOW_CALL_THRESHOLD', default=15),
+            'RECOVERY_TIMEOUT': env.int('ML_SERVICE_CB_RECOVERY_TIMEOUT', default=60),
+        },
+    },
+}
+
+
+# Кэш ответов MOEX ISS: размер L1 (записей в памяти процесса), время хранения по типам данных
+# и время, в течение которого истекший ответ отдается при недоступности MOEX, сек
+MOEX_CACHE = {
+    'L1_MAX_SIZE': env.int('MOEX_CACHE_L1_MAX_SIZE', default=1024),
+    'STALE_TIMEOUT': env.int('MOEX_CACHE_STALE_TIMEOUT', default=60 * 60 * 24),
+    'TIMEOUTS': {
+        'TRADE_STATISTICS': env.int('MOEX_CACHE_TRADE_STATISTICS_TIMEOUT', default=5),
+        'ORDERBOOK': env.int('MOEX_CACHE_ORDERBOOK_TIMEOUT', default=2),
+        'TRADES': env.int('MOEX_CACHE_TRADES_TIMEOUT', default=5),
+        'CANDLES': env.int('MOEX_CACHE_CANDLES_TIMEOUT', default=60),
+        # Свечи за завершившиеся дни не меняются
+        'CANDLES_HISTORY': env.int('MOEX_CACHE_CANDLES_HISTORY_TIMEOUT', default=60 * 60 * 24 * 30),
+    },
+}
+
+
+# Снимок торговой статистики режима торгов TQBR в Redis: период обновления во время торгов
+# и время жизни снимка без обновлений во время торгов, сек (вне торгов - до начала следующей сессии)
+MOEX_BOARD_SNAPSHOT = {
+    'INTERVAL': env.float('MOEX_BOARD_SNAPSHOT_INTERVAL', default=5),
+    'MAX_AGE': env.int('MOEX_BOARD_SNAPSHOT_MAX_AGE', default=30),
+}
+
+# Ленты сделок по акциям в Redis: период обновления во время торгов, время жизни ленты без обновлений
+# во время торгов (вне торгов - до начала следующей сессии) и время отслеживания акции после последнего
+# запроса сделок, сек; максимальное число сделок в ленте
+MOEX_TRADE_TAPE = {
+    'INTERVAL': env.float('MOEX_TRADE_TAPE_INTERVAL', default=2),
+    'MAX_AGE': env.int('MOEX_TRADE_TAPE_MAX_AGE', default=30),
+    'WATCH_TIMEOUT': env.int('MOEX_TRADE_TAPE_WATCH_TIMEOUT', default=600),
+    'MAX_LENGTH': env.int('MOEX_TRADE_TAPE_MAX_LENGTH', default=500000),
+}
+
+# Пакетный запрос рыночных данных: число одновременно загружаемых элементов и максимум элементов в пакете
+MOEX_BATCH = {
+    'MAX_WORKERS': env.int('MOEX_BATCH_MAX_WORKERS', default=8),
+    'MAX_ITEMS': env.int('MOEX_BATCH_MAX_ITEMS', default=100),
+}
+
+# Поток стаканов и сделок (SSE, только ASGI): период опроса стаканов во время торгов, период keep-alive
+# и отметки акций подписчиков, время отслеживания стакана без подписчиков, сек; очередь событий подписчика
+# и максимальное число акций в подписке
+MOEX_LIVE = {
+    'ORDERBOOK_INTERVAL': env.float('MOEX_LIVE_ORDERBOOK_INTERVAL', default=1),
+    'HEARTBEAT': env.int('MOEX_LIVE_HEARTBEAT', default=15),
+    'WATCH_TIMEOUT': env.int('MOEX_LIVE_WATCH_TIMEOUT', default=60),
+    'QUEUE_SIZE': env.int('MOEX_LIVE_QUEUE_SIZE', default=100),
+    'MAX_TICKERS': env.int('MOEX_LIVE_MAX_TICKERS', default=20),
+}
+
+# Торговый календарь (moex.trading_calendar): на сколько лет вперед рассчитываются торговые часы
+# и период перечтения дней с особым расписанием из БД, сек
+TRADING_CALENDAR = {
+    'YEARS_AHEAD': env.int('TRADING_CALENDAR_YEARS_AHEAD', default=3),
+    'RELOAD_INTERVAL': env.int('TRADING_CALENDAR_RELOAD_INTERVAL', default=600),
+}
+
+# Предсказания ML API: модель нейронной сети, предсказания которой отдаются, и время хранения
+# предсказания в кэше, сек (запись устаревает раньше, когда в хранилище появляются новые свечи);
+# предварительный расчет предсказаний по всем акциям: число акций в одном запросе к ML API,
+# таймаут чтения ответа на такой запрос, сек, и число параллельно загружаемых свечей акций;
+# объединение одновременных запросов предсказаний в пакеты: наибольший размер пакета (1 - без объединения)
+# и наибольшее ожидание других запросов, сек; объединять есть смысл только в воркерах с несколькими
+# потоками (gunicorn --threads) или событийным циклом (uvicorn), синхронный воркер ждет max_wait впустую; где выполняются предсказания: 'remote' - ML API,
+# 'local' - модель в процессе (см. ML_LOCAL_INFERENCE)
+ML_PREDICTIONS = {
+    'MODEL_ID': env.int('ML_PREDICTIONS_MODEL_ID', default=1),
+    'BACKEND': env.str('ML_PREDICTIONS_BACKEND', default='remote'),
+    'CACHE_TIMEOUT': env.int('ML_PREDICTIONS_CACHE_TIMEOUT', default=60 * 60 * 24),
+    'BATCH_SIZE': env.int('ML_PREDICTIONS_BATCH_SIZE', default=100),
+    'BATCH_READ_TIMEOUT': env.float('ML_PREDICTIONS_BATCH_READ_TIMEOUT', default=120),
+    'MAX_WORKERS': env.int('ML_PREDICTIONS_MAX_WORKERS', default=8),
+    'MICRO_BATCH_MAX_SIZE': env.int('ML_PREDICTIONS_MICRO_BATCH_MAX_SIZE', default=1),
+    'MICRO_BATCH_MAX_WAIT': env.float('ML_PREDICTIONS_MICRO_BATCH_MAX_WAIT', default=0.005),
+}
+
+# Локальные предсказания: каталог скачанных файлов моделей (по версиям), таймаут скачивания файла, сек,
+# период проверки версии модели в БД, сек, и число потоков, в которых выполняются предсказания
+ML_LOCAL_INFERENCE = {
+    'MODEL_DIR': env.str('ML_LOCAL_INFERENCE_MODEL_DIR', default=os.path.join(BASE_DIR, 'ml_models')),
+    'DOWNLOAD_TIMEOUT': env.float('ML_LOCAL_INFERENCE_DOWNLOAD_TIMEOUT', default=300),
+    'RELOAD_INTERVAL': env.int('ML_LOCAL_INFERENCE_RELOAD_INTERVAL', default=300),
+    'THREADS': env.int('ML_LOCAL_INFERENCE_THREADS', default=2),
+}
+
+# Сжатие ответов (CompressionMiddleware): качество brotli от 0 до 11; gzip сжимает с уровнем 6
+RESPONSE_COMPRESSION = {
+    'BROTLI_QUALITY': env.int('RESPONSE_BROTLI_QUALITY', default=5),
+}
+
 
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
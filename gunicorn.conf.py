@@ -0,0 +1,8 @@
+"""Настройки gunicorn, которые нельзя задать в командной строке; gunicorn читает файл из текущего каталога."""
+
+
+def post_worker_init(worker):
+    """Загрузить локальную модель после запуска воркера: после fork, в процессе, который ее использует."""
+    from machine_learning.inference import warm_up
+
+    warm_up()
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+import orjson
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+from requests import Response
+
+from common_utils.micro_batcher import MicroBatcher
+from machine_learning.models import MLModel
+from services.ml_fastapi import AsyncMLAPIService, MLAPIService
+
+logger = logging.getLogger(__name__)
+
+# Цен закрытия во входных данных модели, см. build_request_to_ml
+INPUT_SIZE = 20
+
+
+class ModelUnavailableError(Exception):
+    """Локальная модель не загружена: предсказаний нет, как при недоступном ML API."""
+
+
+def make_response(result) -> Response:
+    """Результат локальной модели в виде ответа ML API: raise_for_status() и json() работают так же."""
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json'
+    response._content = orjson.dumps(result)
+    return response
+
+
+class LocalModel:
+    """Активная модель нейронной сети (MLModel.is_active), загруженная в процесс.
+
+    Файл модели скачивается по MLModel.path один раз на версию в каталог MODEL_DIR и загружается
+    один раз на процесс; активная модель перечитывается из БД раз в RELOAD_INTERVAL секунд и загружается
+    заново, только если изменились ее путь или версия. Предсказания выполняются в пуле из THREADS
+    потоков (см. ML_LOCAL_INFERENCE): вычисления Keras отпускают GIL, а пул ограничивает число
+    одновременных вычислений на процесс. Пул создается при первом предсказании в каждом процессе,
+    поэтому не наследуется воркерами от родительского процесса.
+    """
+    _executor = None
+    _executor_pid = None
+    _executor_lock = threading.Lock()
+    _model = None
+    _key = None
+    _checked_at = float('-inf')
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_model_file(ml_model: MLModel) -> Path:
+        """Файл модели в каталоге MODEL_DIR, скачанный при первом обращении к этой версии модели.
+
+        Имя каталога включает версию и хеш пути, имя файла - как в пути: по расширению Keras определяет
+        формат. Файл сначала пишется во временный и переименовывается, поэтому процессы, которые
+        скачивают модель одновременно, не читают недописанный файл.
+        """
+        file_name = os.path.basename(urlparse(ml_model.path).path) or 'model.keras'
+        path_hash = hashlib.sha1(ml_model.path.encode()).hexdigest()[:12]
+        model_dir = Path(settings.ML_LOCAL_INFERENCE['MODEL_DIR'])
+        directory = model_dir / str(ml_model.pk) / f'{ml_model.version}-{path_hash}'
+        path = directory / file_name
+        if path.exists():
+            return path
+
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f'.{file_name}.{os.getpid()}.{threading.get_ident()}')
+        try:
+            with requests.get(
+                ml_model.path,
+                stream=True,
+                timeout=settings.ML_LOCAL_INFERENCE['DOWNLOAD_TIMEOUT'],
+            ) as response:
+                response.raise_for_status()
+                with open(temporary, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        file.write(chunk)
+            os.replace(temporary, path)
+        finally:
+            temporary.unlink(missing_ok=True)
+        logger.info(f'Model {ml_model.name} {ml_model.version} downloaded to {path}')
+        return path
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """Пул потоков предсказаний текущего процесса."""
+        if cls._executor_pid != os.getpid():
+            with cls._executor_lock:
+                if cls._executor_pid != os.getpid():
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=settings.ML_LOCAL_INFERENCE['THREADS'],
+                        thread_name_prefix='ml_inference',
+                    )
+                    cls._executor_pid = os.getpid()
+        return cls._executor
+
+    @classmethod
+    def load(cls):
+        """Перечитать активную MLModel и загрузить модель, если изменились ее путь или версия.
+
+        Вызывается в потоках пула, поэтому закрывает соединения с БД своего потока. Если модель
+        загрузить не удалось, остается загруженная ранее.
+
+        :raises ModelUnavailableError: Активной модели нет
+        """
+        try:
+            ml_model = MLModel.objects.filter(is_active=True).order_by('-updated_at').first()
+        except DatabaseError:
+            logger.warning('Active model record is not loaded', exc_info=True)
+            return
+        finally:
+            connections.close_all()
+        if ml_model is None:
+            cls._model = cls._key = None
+            raise ModelUnavailableError('Нет активной модели')
+        if ml_model.pk != settings.ML_PREDICTIONS['MODEL_ID']:
+            logger.warning(
+                f'Active model {ml_model.pk} differs from ML_PREDICTIONS_MODEL_ID '
+                f'{settings.ML_PREDICTIONS["MODEL_ID"]}, predictions are saved under the latter',
+            )
+
+        key = (ml_model.path, ml_model.version)
+        if key == cls._key:
+            return
+        try:
+            # Keras импортируется только при локальных предсказаниях: с ML API он процессу не нужен
+            import keras
+
+            cls._model = keras.saving.load_model(cls.get_model_file(ml_model), compile=False)
+            cls._key = key
+            logger.info(f'Model {ml_model.name} {ml_model.version} loaded')
+        except (ImportError, requests.RequestException, OSError, ValueError):
+            logger.warning(f'Model {ml_model.name} {ml_model.version} is not loaded', exc_info=True)
+
+    @classmethod
+    def get(cls):
+        """Модель процесса, проверенная по MLModel не раньше RELOAD_INTERVAL секунд назад.
+
+        Пока модель загружается в другом потоке, используется загруженная ранее: вызовы не ждут
+        скачивания файла модели.
+
+        :raises ModelUnavailableError: Модель еще не загружена, загрузить ее не удалось или активной модели нет
+        """
+        if time.monotonic() - cls._checked_at > settings.ML_LOCAL_INFERENCE['RELOAD_INTERVAL'] \
+                and cls._lock.acquire(blocking=False):
+            try:
+                cls.load()
+            finally:
+                cls._checked_at = time.monotonic()
+                cls._lock.release()
+        if cls._model is None:
+            raise ModelUnavailableError('Модель не загружена')
+        return cls._model
+
+    @classmethod
+    def predict(cls, inputs: list[list[float]]) -> list[list[float]]:
+        """Предсказать цены закрытия по пакету входных данных одним вызовом модели в текущем потоке.
+
+        :param inputs: Цены закрытия свечей за предыдущие 20 часов по каждой акции пакета
+        :return: Предсказанные цены по каждому элементу inputs в том же порядке
+        """
+        model = cls.get()
+        batch = np.asarray(inputs, dtype=np.float32)
+        batch = batch.reshape((len(batch), *(-1 if dim is None else dim for dim in model.input_shape[1:])))
+        return np.asarray(model.predict_on_batch(batch), dtype=np.float64).reshape(len(batch), -1).tolist()
+
+    @classmethod
+    def submit(cls, inputs: list[list[float]]) -> Future:
+        """Предсказать в пуле потоков, см. predict."""
+        return cls.get_executor().submit(cls.predict, inputs)
+
+    @classmethod
+    def warm_up(cls):
+        """Загрузить модель и выполнить пробное предсказание в потоке пула, чтобы первые запросы
+        не ждали загрузки и инициализации модели."""
+        started = time.monotonic()
+        try:
+            cls.submit([[1.0] * INPUT_SIZE]).result()
+        except ModelUnavailableError as error:
+            logger.warning(f'Model warm-up failed: {error}')
+            return
+        logger.info(f'Model warmed up in {time.monotonic() - started:.1f}s')
+
+
+class LocalMLService:
+    """Предсказания локальной моделью (LocalModel) с теми же методами и ответами, что у MLAPIService.
+
+    Одновременные вызовы predict объединяются micro_batcher в один вызов модели, если
+    MICRO_BATCH_MAX_SIZE больше 1. Пока модель не загружена, predict вызывает ModelUnavailableError
+    из transport_errors - как ошибку соединения с ML API.
+    """
+    transport_errors = (ModelUnavailableError,)
+    micro_batcher = MicroBatcher(
+        'ml_local_predict',
+        max_size=settings.ML_PREDICTIONS['MICRO_BATCH_MAX_SIZE'],
+        max_wait=settings.ML_PREDICTIONS['MICRO_BATCH_MAX_WAIT'],
+    )
+
+    @classmethod
+    def predict(cls, ticker, data) -> Response:
+        """Предсказать цены закрытия свечей на следующие 20 часов, см. MLAPIService.predict."""
+        if cls.micro_batcher.max_size <= 1:
+            return make_response(LocalModel.submit([data['data']]).result()[0])
+        return cls.micro_batcher.submit(data['data'], cls.predict_micro_batch)
+
+    @classmethod
+    def predict_micro_batch(cls, inputs: list[list[float]]) -> list[Response]:
+        return [make_response(result) for result in LocalModel.submit(inputs).result()]
+
+    @classmethod
+    def predict_batch(cls, items: list[dict]) -> Response:
+        """Предсказать цены по нескольким акциям одним вызовом модели, см. MLAPIService.predict_batch."""
+        return make_response(LocalModel.submit([item['data'] for item in items]).result())
+
+
+class AsyncLocalMLService(LocalMLService):
+    """Асинхронный LocalMLService: модель выполняется в том же пуле потоков, событийный цикл не блокируется."""
+
+    @classmethod
+    async def predict(cls, ticker, data):
+        if cls.micro_batcher.max_size <= 1:
+            return make_response((await asyncio.wrap_future(LocalModel.submit([data['data']])))[0])
+        return await cls.micro_batcher.asubmit(data['data'], cls.predict_micro_batch)
+
+    @classmethod
+    async def predict_micro_batch(cls, inputs: list[list[float]]) -> list[Response]:
+        return [make_response(result) for result in await asyncio.wrap_future(LocalModel.submit(inputs))]
+
+    @classmethod
+    async def predict_batch(cls, items: list[dict]):
+        return make_response(await asyncio.wrap_future(LocalModel.submit([item['data'] for item in items])))
+
+
+def get_ml_service(is_async: bool = False):
+    """Сервис предсказаний по ML_PREDICTIONS['BACKEND']: 'remote' - ML API, 'local' - модель в процессе."""
+    if settings.ML_PREDICTIONS['BACKEND'] == 'local':
+        return AsyncLocalMLService if is_async else LocalMLService
+    return AsyncMLAPIService if is_async else MLAPIService
+
+
+def warm_up():
+    """Загрузить локальную модель в фоновом потоке, если предсказания выполняются локально.
+
+    Вызывается после запуска воркера (см. gunicorn.conf.py и finance/asgi.py): воркер принимает запросы сразу,
+    а до загрузки модели предсказания недоступны так же, как при недоступном ML API. Keras с бэкендом
+    импортируется до запуска потока: без него локальных предсказаний не будет никогда.
+
+    :raises ImproperlyConfigured: Предсказания выполняются локально, а Keras или его бэкенд не установлен
+    """
+    if settings.ML_PREDICTIONS['BACKEND'] != 'local':
+        return
+    try:
+        import keras  # noqa: F401
+    except ImportError as error:
+        raise ImproperlyConfigured(
+            'ML_PREDICTIONS_BACKEND=local requires keras and its backend (tensorflow-cpu)',
+        ) from error
+    threading.Thread(target=LocalModel.warm_up, name='ml_warm_up', daemon=True).start()
@@ -0,0 +1,107 @@
+import datetime
+
+from django.conf import settings
+
+from common_utils.cache import TieredCache
+from machine_learning.models import Prediction
+from moex.candle_store import get_candles_version, get_last_candle_end, parse_candle_datetime
+from moex.models import Asset
+
+# Период свечей (час), по которым строятся предсказания
+PREDICTION_INTERVAL = 60
+
+predictions_cache = TieredCache('predictions', l1_max_size=256)
+
+
+def get_candles_params(interval: int) -> dict:
+    """Период свечей, по последним из которых строится предсказание."""
+    date_today = datetime.date.today()
+    return {
+        'dt_from': str(date_today-datetime.timedelta(days=7)),
+        'dt_till': str(date_today+datetime.timedelta(days=-3)),
+        'interval': interval,
+    }
+
+
+def build_request_to_ml(parsed_data_from_moex):
+    """Выбрать из свечей цены закрытия последних 20 часовых свечей для запроса к ML API."""
+    if datetime.datetime.strptime(parsed_data_from_moex[-1]['end'], '%Y-%m-%d %H:%M:%S').time().minute > 30:
+        start_index, end_index, predict_starting_with_next_hour = -21, None, True
+    else:
+        start_index, end_index, predict_starting_with_next_hour = -22, -1, False
+    parsed_data_from_moex = parsed_data_from_moex[start_index:end_index]
+
+    last_date_end = parsed_data_from_moex[-1]['end']
+    request_data_to_ml = {'last_date_end': last_date_end, 'data': [data['close'] for data in parsed_data_from_moex]}
+    return request_data_to_ml, predict_starting_with_next_hour
+
+
+def get_cache_key(ticker: str, interval: int, dt_till: str) -> str | None:
+    """Ключ предсказания в кэше по периоду входных свечей и версии хранимых свечей акции.
+
+    Новые свечи в хранилище (bump_candles_version) меняют ключ, поэтому запись кэша устаревает
+    вместе с данными, а не по таймеру. None - Redis недоступен и версия неизвестна.
+    """
+    version = get_candles_version(ticker, interval)
+    if version is None:
+        return None
+    return f'{ticker}:{interval}:{dt_till}:{version}'
+
+
+def get_stored_prediction(ticker: str, interval: int, last_date_end: str) -> list[dict] | None:
+    """Сохраненное предсказание модели по свечам, последняя из которых закрылась в last_date_end."""
+    return Prediction.objects.filter(
+        model_id=settings.ML_PREDICTIONS['MODEL_ID'],
+        asset__ticker=ticker,
+        last_prediction_date=parse_candle_datetime(last_date_end),
+        interval_of_predictions=interval,
+    ).values_list('predicted_values', flat=True).first()
+
+
+def find_prediction(ticker: str, interval: int, dt_from: str, dt_till: str) -> tuple[str, list[dict]] | None:
+    """Готовое предсказание по последней закрытой свече периода без запросов к MOEX и ML API.
+
+    :return: Пара (окончание последней свечи, предсказанные свечи) или None, если предсказания нет
+        или последнюю свечу нельзя определить по хранилищу
+    """
+    key = get_cache_key(ticker, interval, dt_till)
+    prediction = predictions_cache.get(key) if key is not None else None
+    if prediction is not None:
+        return prediction
+
+    last_date_end = get_last_candle_end(ticker, dt_from, dt_till, interval)
+    predicted_values = get_stored_prediction(ticker, interval, last_date_end) if last_date_end else None
+    if predicted_values is None:
+        return None
+    prediction = (last_date_end, predicted_values)
+    if key is not None:
+        predictions_cache.set(key, prediction, settings.ML_PREDICTIONS['CACHE_TIMEOUT'])
+    return prediction
+
+
+def save_predictions(interval: int, dt_till: str, predictions: dict[str, tuple[str, list[dict]]]):
+    """Сохранить предсказания одним запросом идемпотентно (INSERT ... ON CONFLICT DO UPDATE) и положить их в кэш.
+
+    :param predictions: Словарь «тикер -> (окончание последней свечи, предсказанные свечи)»
+    """
+    assets = dict(Asset.objects.filter(ticker__in=predictions).values_list('ticker', 'id'))
+    Prediction.objects.bulk_create(
+        [
+            Prediction(
+                model_id=settings.ML_PREDICTIONS['MODEL_ID'],
+                asset_id=assets[ticker],
+                last_prediction_date=parse_candle_datetime(last_date_end),
+                interval_of_predictions=interval,
+                predicted_values=predicted_values,
+            )
+            for ticker, (last_date_end, predicted_values) in predictions.items()
+            if ticker in assets
+        ],
+        update_conflicts=True,
+        unique_fields=['model', 'asset', 'last_prediction_date', 'interval_of_predictions'],
+        update_fields=['predicted_values', 'updated_at'],
+    )
+    for ticker, prediction in predictions.items():
+        key = get_cache_key(ticker, interval, dt_till)
+        if key is not None:
+            predictions_cache.set(key, prediction, settings.ML_PREDICTIONS['CACHE_TIMEOUT'])
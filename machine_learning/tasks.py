@@ -1,11 +1,21 @@
 import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from celery import shared_task
+from django.conf import settings
+from django.db import connections
 from django.utils import timezone
 
-from moex.create_functions import parse_start_structure
-from services.moex import MOEXAPIService
+from common_utils.api import UPSTREAM_HTTP_ERRORS
+from common_utils.circuit_breaker import CircuitOpenError
+from machine_learning.inference import get_ml_service
+from machine_learning.predictions import PREDICTION_INTERVAL, build_request_to_ml, find_prediction, \
+    get_candles_params, get_stored_prediction, save_predictions
+from moex.candle_store import get_candles, iter_candles
+from moex.create_functions import get_moscow_now, is_trading_time, set_appropriate_datetime
+from moex.models import Asset
+from services.ml_fastapi import parse_batch_results
 from .models import Prediction
 import numpy as np
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
@@ -34,14 +44,16 @@ def update_all_predictions_metrics():
             min_date = min(begin_dates)
             max_date = max(end_dates)
 
-            info_from_moex = MOEXAPIService.get_candles_for_action(
+            # 3. Свечи разбираются постранично, от каждой хранится только цена закрытия
+            actual_closes = {}
+            pages = iter_candles(
                 ticker=prediction.asset.ticker,
                 dt_from=min_date.strftime('%Y-%m-%d'),
                 dt_till=max_date.strftime('%Y-%m-%d'),
                 interval=prediction.interval_of_predictions,
-            ).json()
-
-            actual_candles = parse_start_structure(info_from_moex['candles'])
+            )
+            for page in pages:
+                actual_closes.update(((item['begin'], item['end']), item['close']) for item in page)
 
             # 4. Сопоставляем данные и вычисляем метрики
             y_pred = []
@@ -49,17 +61,11 @@ def update_all_predictions_metrics():
 
             for pred_item in predicted_data:
                 # Находим соответствующую актуальную свечу
-                actual_item = next(
-                    (
-                        item for item in actual_candles
-                        if item['begin'] == pred_item['begin'] and item['end'] == pred_item['end']
-                    ),
-                    None,
-                )
-
-                if actual_item:
+                actual_close = actual_closes.get((pred_item['begin'], pred_item['end']))
+
+                if actual_close is not None:
                     y_pred.append(pred_item['close'])
-                    y_true.append(actual_item['close'])
+                    y_true.append(actual_close)
 
             # Если нет совпадающих данных, пропускаем
             if not y_true:
@@ -76,8 +82,7 @@ def update_all_predictions_metrics():
 
             # 6. Сохраняем актуальные значения и метрики
             actual_values = [
-                {'end': value['end'], 'begin': value['begin'], 'close': value['close']}
-                for value in actual_candles
+                {'end': end, 'begin': begin, 'close': close} for (begin, end), close in actual_closes.items()
             ]
             prediction.actual_values = actual_values  # Сохраняем полученные данные
             prediction.metrics = metrics
@@ -87,3 +92,69 @@ def update_all_predictions_metrics():
             logger.info(f"Error updating prediction {prediction.id}: {str(e)}")
 
     Prediction.objects.bulk_update(predictions_to_be_updated, fields=['actual_values', 'metrics'])
+
+
+@shared_task(ignore_result=True)
+def precompute_predictions():
+    """Задача для предварительного расчета предсказаний по всем активным акциям после закрытия часовой свечи.
+
+    Входные свечи акций собираются параллельно, предсказания запрашиваются у ML API (или локальной модели) пакетами
+    по BATCH_SIZE акций и сохраняются одним запросом на пакет, поэтому MLPredictTickerAPIView только
+    читает готовые предсказания. Акции, по последней свече которых предсказание уже есть, пропускаются.
+    """
+    closed_candle_begin = get_moscow_now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=1)
+    if not is_trading_time(closed_candle_begin):
+        return
+
+    candles_params = get_candles_params(PREDICTION_INTERVAL)
+
+    def collect_input(ticker):
+        """Входные данные ML API по акции и признак предсказания со следующего часа или None."""
+        try:
+            if find_prediction(ticker, PREDICTION_INTERVAL, candles_params['dt_from'], candles_params['dt_till']):
+                return None
+            candles = get_candles(ticker=ticker, **candles_params)
+            if not candles:
+                return None
+            request_data_to_ml, predict_starting_with_next_hour = build_request_to_ml(candles)
+            if get_stored_prediction(ticker, PREDICTION_INTERVAL, request_data_to_ml['last_date_end']) is not None:
+                return None
+            return {'ticker': ticker, **request_data_to_ml}, predict_starting_with_next_hour
+        finally:
+            connections.close_all()
+
+    tickers = list(Asset.objects.filter(is_active=True).values_list('ticker', flat=True))
+    with ThreadPoolExecutor(max_workers=settings.ML_PREDICTIONS['MAX_WORKERS']) as executor:
+        futures = {ticker: executor.submit(collect_input, ticker) for ticker in tickers}
+    inputs = []
+    for ticker, future in futures.items():
+        if future.exception() is not None:
+            logger.warning(f'Prediction input for {ticker} failed: {future.exception()}')
+        elif future.result() is not None:
+            inputs.append(future.result())
+
+    ml_service = get_ml_service()
+    saved = 0
+    batch_size = settings.ML_PREDICTIONS['BATCH_SIZE']
+    for offset in range(0, len(inputs), batch_size):
+        batch = inputs[offset:offset + batch_size]
+        try:
+            response = ml_service.predict_batch([item for item, _ in batch])
+            response.raise_for_status()
+        except (CircuitOpenError, *UPSTREAM_HTTP_ERRORS, *ml_service.transport_errors) as error:
+            logger.warning(f'Prediction batch of {len(batch)} tickers failed: {error}')
+            continue
+        results = parse_batch_results(response, len(batch))
+        if results is None:
+            logger.warning(f'Prediction batch of {len(batch)} tickers failed: invalid response body')
+            continue
+        predictions = {
+            item['ticker']: (
+                item['last_date_end'],
+                set_appropriate_datetime(costs, item['last_date_end'], predict_starting_with_next_hour),
+            )
+            for (item, predict_starting_with_next_hour), costs in zip(batch, results)
+        }
+        save_predictions(PREDICTION_INTERVAL, candles_params['dt_till'], predictions)
+        saved += len(predictions)
+    logger.info(f'Predictions precomputed: {saved} saved, {len(tickers) - len(inputs)} up to date or failed')
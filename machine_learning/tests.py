@@ -1,3 +1,112 @@
-from django.test import TestCase
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase
+
+from common_utils.micro_batcher import MicroBatcher
+from services.ml_fastapi import split_batch_response
+
+
+class MicroBatcherTestCase(SimpleTestCase):
+
+    def test_results_are_distributed_by_item(self):
+        batcher = MicroBatcher('test_results', max_size=4, max_wait=0.05)
+        batches = []
+
+        def double(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda item: batcher.submit(item, double), range(10)))
+        self.assertEqual(results, [item * 2 for item in range(10)])
+        self.assertEqual(sorted(item for batch in batches for item in batch), list(range(10)))
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+        self.assertLess(len(batches), 10)
+        self.assertEqual(batcher.stats()['items'], 10)
+        self.assertEqual(batcher.stats()['batches'], len(batches))
+
+    def test_error_is_raised_in_every_caller(self):
+        batcher = MicroBatcher('test_errors', max_size=3, max_wait=0.5)
+        started = threading.Barrier(3)
+
+        def fail(items):
+            raise KeyError('model')
+
+        def submit(item):
+            started.wait()
+            return batcher.submit(item, fail)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(submit, item) for item in range(3)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), KeyError)
+
+    def test_wrong_number_of_results_is_an_error(self):
+        batcher = MicroBatcher('test_count', max_size=2, max_wait=0)
+        with self.assertRaises(ValueError):
+            batcher.submit(1, lambda items: [])
+
+    def test_async_results_and_errors(self):
+        batcher = MicroBatcher('test_async', max_size=4, max_wait=0.05)
+
+        async def increment(items):
+            await asyncio.sleep(0)
+            return [item + 1 for item in items]
+
+        async def fail(items):
+            raise KeyError('model')
+
+        async def main():
+            results = await asyncio.gather(*(batcher.asubmit(item, increment) for item in range(9)))
+            self.assertEqual(results, [item + 1 for item in range(9)])
+            errors = await asyncio.gather(*(batcher.asubmit(item, fail) for item in range(3)), return_exceptions=True)
+            self.assertTrue(all(isinstance(error, KeyError) for error in errors))
+
+        asyncio.run(main())
+        self.assertEqual(batcher.stats()['items'], 12)
+
+    def test_async_leader_cancellation_does_not_cancel_batch(self):
+        batcher = MicroBatcher('test_async_cancel', max_size=4, max_wait=0.05)
+
+        async def increment(items):
+            await asyncio.sleep(0.01)
+            return [item + 1 for item in items]
+
+        async def main():
+            leader = asyncio.ensure_future(batcher.asubmit(0, increment))
+            await asyncio.sleep(0)
+            followers = asyncio.gather(*(batcher.asubmit(item, increment) for item in range(1, 3)))
+            await asyncio.sleep(0)
+            leader.cancel()
+            self.assertEqual(await followers, [2, 3])
+            self.assertTrue(leader.cancelled())
+
+        asyncio.run(main())
+
+
+class SplitBatchResponseTestCase(SimpleTestCase):
+
+    @staticmethod
+    def make_response(status_code, content: bytes):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        response.url = 'http://ml/predict/batch'
+        return response
+
+    def test_split_by_item(self):
+        responses = split_batch_response(self.make_response(200, b'[[1.0, 2.0], [3.0, 4.0]]'), 2)
+        self.assertEqual([response.json() for response in responses], [[1.0, 2.0], [3.0, 4.0]])
+
+    def test_failed_response_is_returned_to_every_item(self):
+        response = self.make_response(503, b'')
+        self.assertEqual(split_batch_response(response, 2), [response, response])
+
+    def test_invalid_body_is_upstream_error(self):
+        for content in (b'{"detail": "ok"}', b'[[1.0]]', b'not json'):
+            for response in split_batch_response(self.make_response(200, content), 2):
+                with self.assertRaises(requests.HTTPError, msg=content):
+                    response.raise_for_status()
@@ -1,20 +1,25 @@
 import datetime
 
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from adrf.views import APIView as AsyncAPIView
+from django.conf import settings
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter, OpenApiExample
-from requests import HTTPError
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from machine_learning.models import Prediction, MLModel
+from common_utils.api import UPSTREAM_HTTP_ERRORS
+from common_utils.circuit_breaker import CircuitOpenError
+from common_utils.db import run_in_thread
+from common_utils.views import add_stale_headers, add_validator_headers, extend_schema_from, \
+    get_not_modified_response, make_etag
+from machine_learning.inference import get_ml_service
+from machine_learning.models import Prediction
+from machine_learning.predictions import PREDICTION_INTERVAL, build_request_to_ml, find_prediction, \
+    get_candles_params, get_stored_prediction, save_predictions
 from machine_learning.serializers import PredictActionCandlesResponseSerializer
-from moex.create_functions import parse_start_structure, set_appropriate_datetime
-from moex.models import Asset
-from services.ml_fastapi import MLAPIService
-from services.moex import MOEXAPIService
+from moex.candle_store import CandlePages
+from moex.create_functions import MOEX_TIMEZONE, set_appropriate_datetime
 
 
 # Create your views here.
@@ -22,6 +27,8 @@ class MLPredictTickerAPIView(APIView):
 
     permission_classes = [IsAuthenticated]
     serializer_class = PredictActionCandlesResponseSerializer
+    interval = PREDICTION_INTERVAL
+    ml_service = get_ml_service()
 
     @extend_schema(
         tags=['Прогнозирование котировок акций'],
@@ -56,7 +63,9 @@ class MLPredictTickerAPIView(APIView):
         summary='Предсказать цены закрытия свечей на следующие 20 рабочих часов Московской Биржи',
         description=(
             f'Возвращает предсказанные цены закрытия свечей по одной указанной акции на следующие 20 рабочих часов'
-            f'Московской Биржи, включая:\n\n{serializer_class.Meta.description}'
+            f'Московской Биржи. Предсказания по активным акциям рассчитываются заранее после закрытия каждой '
+            f'часовой свечи; если по последней закрытой свече уже есть сохраненное предсказание, оно отдается '
+            f'без запроса к ML API. Включает:\n\n{serializer_class.Meta.description}'
         ),
         parameters=[
             OpenApiParameter(
@@ -74,44 +83,132 @@ class MLPredictTickerAPIView(APIView):
             ),
         ],
     )
-    @method_decorator(cache_page(60 * 15))
     def get(self, request, ticker, *args, **kwargs):
-        date_today = datetime.date.today()
-        interval = 60
-        response_from_moex = MOEXAPIService.get_candles_for_action(
-            ticker=ticker,
-            dt_from=str(date_today-datetime.timedelta(days=7)),
-            dt_till=str(date_today+datetime.timedelta(days=-3)),
-            interval=interval,
-        )
+        prepared = self.prepare_request_to_ml(request, ticker)
+        if not isinstance(prepared, tuple):
+            return prepared
+        request_data_to_ml = prepared[0]
+
+        try:
+            response_from_ml = self.ml_service.predict(ticker, request_data_to_ml)
+        except (CircuitOpenError, *self.ml_service.transport_errors):
+            last_prediction = self.get_last_prediction(ticker)
+            if last_prediction is None:
+                raise
+            return self.build_stale_response(last_prediction)
+        try:
+            response_from_ml.raise_for_status()
+        except UPSTREAM_HTTP_ERRORS:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к ML API'})
+
+        return self.build_new_prediction_response(request, ticker, response_from_ml.json(), *prepared)
+
+    def prepare_request_to_ml(self, request, ticker):
+        """Входные данные ML API по последним свечам акции или готовый ответ: сохраненное предсказание,
+        304 или ошибка MOEX API.
+
+        :return: Ответ или тройка (входные данные ML API, признак предсказания со следующего часа,
+            признак устаревших свечей)
+        """
+        candles_params = self.get_candles_params()
+        prediction = find_prediction(ticker, self.interval, candles_params['dt_from'], candles_params['dt_till'])
+        if prediction is not None:
+            return self.build_prediction_response(request, *prediction)
+
+        pages = CandlePages(ticker=ticker, **candles_params)
         try:
-            response_from_moex.raise_for_status()
-        except HTTPError:
+            candles = [candle for page in pages for candle in page]
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
 
-        response_data = response_from_moex.json()['candles']
-        parsed_data_from_moex = parse_start_structure(response_data)
-        if datetime.datetime.strptime(parsed_data_from_moex[-1]['end'], '%Y-%m-%d %H:%M:%S').time().minute > 30:
-            start_index, end_index, predict_starting_with_next_hour = -21, None, True
-        else:
-            start_index, end_index, predict_starting_with_next_hour = -22, -1, False
-        parsed_data_from_moex = parsed_data_from_moex[start_index:end_index]
+        request_data_to_ml, predict_starting_with_next_hour = self.build_request_to_ml(candles)
+        last_date_end = request_data_to_ml['last_date_end']
+        predicted_values = get_stored_prediction(ticker, self.interval, last_date_end)
+        if predicted_values is not None:
+            return self.build_prediction_response(request, last_date_end, predicted_values, pages.is_stale)
+        etag, last_modified = self.get_validators(request, last_date_end)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return request_data_to_ml, predict_starting_with_next_hour, pages.is_stale
+
+    def build_new_prediction_response(self, request, ticker, costs, request_data_to_ml,
+                                      predict_starting_with_next_hour, is_stale):
+        """Сохранить новое предсказание модели и отдать его."""
+        last_date_end = request_data_to_ml['last_date_end']
+        result_data = set_appropriate_datetime(costs, last_date_end, predict_starting_with_next_hour)
+        save_predictions(self.interval, self.get_candles_params()['dt_till'], {ticker: (last_date_end, result_data)})
+        return self.build_prediction_response(request, last_date_end, result_data, is_stale)
+
+    def get_candles_params(self):
+        return get_candles_params(self.interval)
 
-        last_date_end = parsed_data_from_moex[-1]['end']
-        request_data_to_ml = {'last_date_end': last_date_end, 'data': [data['close'] for data in parsed_data_from_moex]}
+    build_request_to_ml = staticmethod(build_request_to_ml)
 
-        response_from_ml = MLAPIService.predict(ticker, request_data_to_ml)
+    @staticmethod
+    def get_validators(request, last_date_end) -> tuple[str, float]:
+        """ETag и Last-Modified предсказания, известные до запроса к ML API.
+
+        Предсказание модели определяется последней закрытой свечой входных данных (свечи за завершившиеся
+        дни не меняются), поэтому 304 отдается без запроса к ML API. Last-Modified - окончание этой свечи.
+        """
+        etag = make_etag(request, settings.ML_PREDICTIONS['MODEL_ID'], last_date_end)
+        last_modified = datetime.datetime.strptime(
+            last_date_end, '%Y-%m-%d %H:%M:%S',
+        ).replace(tzinfo=MOEX_TIMEZONE).timestamp()
+        return etag, last_modified
+
+    def build_prediction_response(self, request, last_date_end, result_data, is_stale=False):
+        etag, last_modified = self.get_validators(request, last_date_end)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return add_stale_headers(
+            add_validator_headers(
+                Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data),
+                etag,
+                last_modified,
+            ),
+            is_stale,
+        )
+
+    def get_last_prediction(self, ticker):
+        """Последнее сохраненное предсказание по акции, которое отдается, пока ML API недоступен."""
+        prediction = Prediction.objects.filter(
+            asset__ticker=ticker,
+            interval_of_predictions=self.interval,
+        ).order_by('-last_prediction_date').first()
+        return prediction.predicted_values if prediction is not None else None
+
+    def build_stale_response(self, result_data):
+        return add_stale_headers(
+            Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data),
+        )
+
+
+class AsyncMLPredictTickerAPIView(AsyncAPIView, MLPredictTickerAPIView):
+    ml_service = get_ml_service(is_async=True)
+
+    @extend_schema_from(MLPredictTickerAPIView.get)
+    async def get(self, request, ticker, *args, **kwargs):
+        # Запросы к БД, MOEX ISS и календарю выполняются в пуле потоков, а не по очереди в одном общем потоке
+        prepared = await run_in_thread(self.prepare_request_to_ml)(request, ticker)
+        if not isinstance(prepared, tuple):
+            return prepared
+        request_data_to_ml = prepared[0]
+
+        try:
+            response_from_ml = await self.ml_service.predict(ticker, request_data_to_ml)
+        except (CircuitOpenError, *self.ml_service.transport_errors):
+            last_prediction = await run_in_thread(self.get_last_prediction)(ticker)
+            if last_prediction is None:
+                raise
+            return self.build_stale_response(last_prediction)
         try:
             response_from_ml.raise_for_status()
-        except HTTPError:
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к ML API'})
 
-        result_data = set_appropriate_datetime(response_from_ml.json(), last_date_end, predict_starting_with_next_hour)
-        Prediction.objects.create(
-            model=MLModel.objects.get(id=1),
-            asset=Asset.objects.get(ticker=ticker),
-            last_prediction_date=last_date_end,
-            interval_of_predictions=interval,
-            predicted_values=result_data,
+        return await run_in_thread(self.build_new_prediction_response)(
+            request, ticker, response_from_ml.json(), *prepared,
         )
-        return Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from moex.models import Asset
+from moex.models import Asset, TradingCalendarDay
 
 # Register your models here.
-admin.site.register(Asset)
\ No newline at end of file
+admin.site.register(Asset)
+admin.site.register(TradingCalendarDay)
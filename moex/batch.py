@@ -0,0 +1,117 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from django.conf import settings
+from django.db import connections
+
+from common_utils.api import UPSTREAM_HTTP_ERRORS
+from common_utils.circuit_breaker import CircuitOpenError
+from common_utils.encoders import RowEncoder
+from moex.candle_store import CandlePages
+from moex.create_functions import parse_response_block, parse_securities_and_marketdata
+from moex.resampling import get_resampled_candle_pages, parse_resample_interval
+from moex.serializers import MARKETDATA_FIELDS, SECURITIES_FIELDS, ActionCandlesResponseSerializer, \
+    ActionOrderBookResponseSerializer, ActionTradesResponseSerializer, ActionTradeStatisticsResponseSerializer
+from moex.snapshots import get_board_snapshot
+from moex.trade_tapes import get_trades_delta
+from services.moex import CANDLES_INTERVAL_MINUTES, MOEXAPIService
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItemError(Exception):
+    """Ошибка получения одного элемента пакета с HTTP-статусом для ответа."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def fetch_orderbook(ticker: str, params: dict) -> tuple[list[dict], bool]:
+    response = MOEXAPIService.get_orderbook_for_action(ticker)
+    response.raise_for_status()
+    return parse_response_block(response, 'orderbook'), getattr(response, 'is_stale', False)
+
+
+def fetch_trades(ticker: str, params: dict) -> tuple[list[dict], bool]:
+    trades = get_trades_delta(ticker)
+    if trades is not None:
+        return trades, False
+    response = MOEXAPIService.get_trades_for_action(ticker)
+    response.raise_for_status()
+    return parse_response_block(response, 'trades'), getattr(response, 'is_stale', False)
+
+
+def fetch_candles(ticker: str, params: dict) -> tuple[list[dict], bool]:
+    interval = params['interval']
+    if interval.isdigit() and int(interval) in CANDLES_INTERVAL_MINUTES:
+        pages = CandlePages(ticker, params['dt_from'], params['dt_till'], interval)
+    elif (minutes := parse_resample_interval(interval)) is not None:
+        pages = get_resampled_candle_pages(ticker, params['dt_from'], params['dt_till'], minutes)
+    else:
+        raise BatchItemError(400, 'Неверный период свечей')
+    return [candle for page in pages for candle in page], pages.is_stale
+
+
+def fetch_trade_statistics(ticker: str, params: dict) -> tuple[list[dict], bool]:
+    board, is_stale = get_board_snapshot([ticker]), False
+    if board is None:
+        response = MOEXAPIService.get_trade_statictics_for_actions(ticker)
+        response.raise_for_status()
+        board = parse_securities_and_marketdata(orjson.loads(response.content), SECURITIES_FIELDS, MARKETDATA_FIELDS)
+        is_stale = getattr(response, 'is_stale', False)
+    return [{'ticker': key, **board[key]} for key in board if key == ticker], is_stale
+
+
+# Виды данных пакета: функция получения строк и сериализатор, по полям которого они кодируются
+BATCH_KINDS = {
+    'orderbook': (fetch_orderbook, ActionOrderBookResponseSerializer),
+    'trades': (fetch_trades, ActionTradesResponseSerializer),
+    'candles': (fetch_candles, ActionCandlesResponseSerializer),
+    'trade_statistics': (fetch_trade_statistics, ActionTradeStatisticsResponseSerializer),
+}
+
+
+def fetch_batch_item(ticker: str, kind: str, params: dict) -> dict:
+    """Получить один элемент пакета; ошибка элемента возвращается в результате, а не выбрасывается.
+
+    :return: Словарь ticker, kind, status и data (готовый JSON, orjson.Fragment) или detail
+    """
+    fetch, serializer_class = BATCH_KINDS[kind]
+    result = {'ticker': ticker, 'kind': kind}
+    try:
+        rows, is_stale = fetch(ticker, params)
+    except BatchItemError as error:
+        return {**result, 'status': error.status_code, 'detail': error.detail}
+    except CircuitOpenError as error:
+        return {**result, 'status': error.status_code, 'detail': str(error.detail)}
+    except (*UPSTREAM_HTTP_ERRORS, *MOEXAPIService.transport_errors):
+        return {**result, 'status': 400, 'detail': 'Ошибка при запросе к MOEX API'}
+    except Exception:
+        logger.exception(f'Batch item {kind} for {ticker} failed')
+        return {**result, 'status': 500, 'detail': 'Внутренняя ошибка сервера'}
+    data = orjson.Fragment(RowEncoder.for_serializer(serializer_class).encode(rows))
+    return {**result, 'status': 200, 'stale': is_stale, 'data': data}
+
+
+def fetch_batch(tickers: list[str], kinds: list[str], params: dict) -> bytes:
+    """Получить все пары (акция, вид данных) в ограниченном пуле потоков и собрать один JSON-ответ.
+
+    :param tickers: Коды ценных бумаг
+    :param kinds: Виды данных из BATCH_KINDS
+    :param params: Параметры свечей dt_from, dt_till, interval
+    :return: JSON ``{"results": [...]}`` в порядке акций и видов данных запроса
+    """
+    def fetch_in_thread(item):
+        try:
+            return fetch_batch_item(*item, params)
+        finally:
+            # Свечи читаются из БД, соединение потока пула закрывается вместе с потоком
+            connections.close_all()
+
+    items = [(ticker, kind) for ticker in tickers for kind in kinds]
+    with ThreadPoolExecutor(max_workers=min(len(items), settings.MOEX_BATCH['MAX_WORKERS'])) as executor:
+        results = list(executor.map(fetch_in_thread, items))
+    return orjson.dumps({'results': results})
@@ -0,0 +1,301 @@
+import datetime
+import itertools
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from common_utils.db import run_in_thread
+from common_utils.single_flight import REDIS_ERRORS
+from moex.create_functions import MOEX_TIMEZONE, get_moscow_now
+from moex.models import Asset, Candle, CandleSyncedDay
+from services.moex import MOEXAPIService
+
+# Периоды свечей, которые хранятся локально: недельные и более длинные свечи меняются до конца периода
+STORED_INTERVALS = (1, 10, 60, 24)
+
+CANDLE_FIELDS = ('open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end')
+BEGIN_INDEX = CANDLE_FIELDS.index('begin')
+CANDLE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Номер версии хранимых свечей акции: увеличивается, когда в хранилище появляются новые свечи
+CANDLES_VERSION_KEY = 'moex:candles:version:{ticker}:{interval}'
+
+
+def find_missing_ranges(asset: Asset, interval: int, date_from: datetime.date,
+                        date_till: datetime.date) -> list[tuple[datetime.date, datetime.date]]:
+    """Найти непрерывные диапазоны дней, свечи за которые еще не загружались.
+
+    :return: Список пар (первый день, последний день) в порядке возрастания
+    """
+    synced_days = set(
+        CandleSyncedDay.objects.filter(
+            asset=asset,
+            interval=interval,
+            date__range=(date_from, date_till),
+        ).values_list('date', flat=True),
+    )
+    ranges = []
+    day = date_from
+    while day <= date_till:
+        if day not in synced_days:
+            if ranges and ranges[-1][1] == day - datetime.timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        day += datetime.timedelta(days=1)
+    return ranges
+
+
+def save_candles(asset: Asset, interval: int, candles: list[dict]) -> int:
+    """Сохранить свечи MOEX ISS (результат parse_start_structure), обновляя уже существующие.
+
+    :return: Число сохраненных свечей
+    """
+    return len(Candle.objects.bulk_create(
+        [
+            Candle(
+                asset=asset,
+                interval=interval,
+                begin=parse_candle_datetime(candle['begin']),
+                end=parse_candle_datetime(candle['end']),
+                open=candle['open'],
+                close=candle['close'],
+                high=candle['high'],
+                low=candle['low'],
+                value=candle['value'],
+                volume=candle['volume'],
+            )
+            for candle in candles
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['asset', 'interval', 'begin'],
+        update_fields=['end', 'open', 'close', 'high', 'low', 'value', 'volume'],
+    ))
+
+
+def sync_candles(asset: Asset, interval: int, date_from: datetime.date, date_till: datetime.date) -> int:
+    """Загрузить из MOEX ISS свечи только за дни диапазона, которых еще нет в хранилище.
+
+    Дни должны быть завершившимися: загруженный день больше не запрашивается. Страницы MOEX ISS
+    не кэшируются, хранилище само выполняет роль кэша.
+
+    :return: Число сохраненных свечей
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    saved = 0
+    for gap_from, gap_till in find_missing_ranges(asset, interval, date_from, date_till):
+        pages = MOEXAPIService.iter_candles_pages(asset.ticker, str(gap_from), str(gap_till), interval, use_cache=False)
+        for candles, _ in pages:
+            saved += save_candles(asset, interval, candles)
+        # Дни отмечаются загруженными только после всех страниц, при ошибке диапазон будет загружен повторно
+        CandleSyncedDay.objects.bulk_create(
+            [
+                CandleSyncedDay(asset=asset, interval=interval, date=gap_from + datetime.timedelta(days=offset))
+                for offset in range((gap_till - gap_from).days + 1)
+            ],
+            ignore_conflicts=True,
+        )
+    if saved:
+        bump_candles_version(asset.ticker, interval)
+    return saved
+
+
+def bump_candles_version(ticker: str, interval: int):
+    """Отметить появление новых свечей: данные, рассчитанные по свечам акции, должны быть пересчитаны."""
+    try:
+        get_redis_connection('default').incr(CANDLES_VERSION_KEY.format(ticker=ticker, interval=interval))
+    except REDIS_ERRORS:
+        pass
+
+
+def get_candles_version(ticker: str, interval: int) -> int | None:
+    """Номер версии хранимых свечей акции, см. bump_candles_version.
+
+    :return: Номер версии (0 - свечи еще не сохранялись) или None, если Redis недоступен
+    """
+    try:
+        version = get_redis_connection('default').get(CANDLES_VERSION_KEY.format(ticker=ticker, interval=interval))
+    except REDIS_ERRORS:
+        return None
+    return int(version or 0)
+
+
+def get_last_candle_end(ticker: str, dt_from: str, dt_till: str, interval) -> str | None:
+    """Окончание последней закрытой свечи периода по хранилищу, без запросов к MOEX ISS.
+
+    :return: Окончание свечи в формате MOEX ISS или None, если период включает текущий день,
+        не все его дни загружены в хранилище или свечей нет
+    """
+    interval = int(interval)
+    date_from = datetime.date.fromisoformat(str(dt_from)[:10])
+    date_till = datetime.date.fromisoformat(str(dt_till)[:10])
+    if interval not in STORED_INTERVALS or date_till >= get_moscow_now().date():
+        return None
+    asset = Asset.objects.filter(ticker=ticker).first()
+    if asset is None or find_missing_ranges(asset, interval, date_from, date_till):
+        return None
+    end = Candle.objects.filter(
+        asset=asset,
+        interval=interval,
+        begin__gte=get_day_start(date_from),
+        begin__lt=get_day_start(date_till + datetime.timedelta(days=1)),
+    ).order_by('-begin').values_list('end', flat=True).first()
+    if end is None:
+        return None
+    return timezone.localtime(end, MOEX_TIMEZONE).strftime(CANDLE_DATETIME_FORMAT)
+
+
+class CandlePages:
+    """Свечи по акции за период страницами по порядку, в формате parse_start_structure.
+
+    Свечи за завершившиеся дни читаются из локального хранилища (недостающие дни сначала загружаются
+    из MOEX ISS), за текущий день - из MOEX ISS. Если акции нет в справочнике, период или интервал
+    не хранятся локально, все свечи запрашиваются в MOEX ISS.
+
+    Все запросы к MOEX ISS выполняются в load до выдачи первой страницы, при чтении страниц запрашивается
+    только хранилище: ошибка MOEX ISS не обрывает ответ, который уже начали отдавать потоком. Страницы
+    читаются синхронно (for) или из асинхронного кода (async for) в пуле потоков, см. run_in_thread.
+    """
+
+    def __init__(self, ticker: str, dt_from: str, dt_till: str, interval, chunk_size: int = 500):
+        """
+        :param ticker: Код ценной бумаги, например 'SBER'
+        :param dt_from: Дата начала периода, например '2024-03-01'
+        :param dt_till: Дата окончания периода, например '2024-05-01'
+        :param interval: Период свечей
+        :param chunk_size: Число свечей в странице из хранилища
+        """
+        self.ticker = ticker
+        self.dt_from = dt_from
+        self.dt_till = dt_till
+        self.interval = interval
+        self.chunk_size = chunk_size
+        # Свечи из хранилища, которые отдаются перед страницами MOEX ISS, и сами страницы после load
+        self.stored_candles = None
+        self.pages = None
+        # Страницы MOEX ISS взяты из кэша устаревшими, пока MOEX ISS недоступна
+        self.is_stale = False
+
+    def load(self):
+        """Загрузить из MOEX ISS недостающие дни в хранилище и страницы за текущий день; повторно не загружает.
+
+        :raises requests.HTTPError: Ошибка при запросе к MOEX API
+        """
+        if self.pages is not None:
+            return
+        live_from = self.dt_from
+        try:
+            date_from = datetime.date.fromisoformat(str(self.dt_from)[:10])
+            date_till = datetime.date.fromisoformat(str(self.dt_till)[:10])
+            interval = int(self.interval)
+        except ValueError:
+            asset = None
+        else:
+            asset = Asset.objects.filter(ticker=self.ticker).first() if interval in STORED_INTERVALS else None
+
+        if asset is not None:
+            history_till = min(date_till, get_moscow_now().date() - datetime.timedelta(days=1))
+            if date_from <= history_till:
+                sync_candles(asset, interval, date_from, history_till)
+                self.stored_candles = Candle.objects.filter(
+                    asset=asset,
+                    interval=interval,
+                    begin__gte=get_day_start(date_from),
+                    begin__lt=get_day_start(history_till + datetime.timedelta(days=1)),
+                ).order_by('begin').values_list(*CANDLE_FIELDS)
+                live_from = str(history_till + datetime.timedelta(days=1))
+            if date_till < datetime.date.fromisoformat(live_from[:10]):
+                self.pages = []
+                return
+
+        pages = list(MOEXAPIService.iter_candles_pages(self.ticker, live_from, self.dt_till, self.interval))
+        self.is_stale = any(is_stale for _, is_stale in pages)
+        self.pages = [candles for candles, _ in pages]
+
+    async def aload(self):
+        """Асинхронный вариант load: загрузка выполняется в пуле потоков, см. run_in_thread."""
+        if self.pages is None:
+            await run_in_thread(self.load)()
+
+    def read_stored(self, after: datetime.datetime | None = None) -> list[tuple]:
+        """Следующие chunk_size свечей из хранилища после свечи, начавшейся в after, кортежами CANDLE_FIELDS.
+
+        Каждая страница читается отдельным запросом по индексу (asset, interval, begin), поэтому
+        страницы можно читать в разных потоках.
+        """
+        if self.stored_candles is None:
+            return []
+        candles = self.stored_candles
+        if after is not None:
+            candles = candles.filter(begin__gt=after)
+        return list(candles[:self.chunk_size])
+
+    def __iter__(self):
+        self.load()
+        candles = self.read_stored()
+        while candles:
+            yield [candle_to_dict(candle) for candle in candles]
+            candles = self.read_stored(candles[-1][BEGIN_INDEX]) if len(candles) == self.chunk_size else []
+        yield from self.pages
+
+    async def __aiter__(self):
+        await self.aload()
+        read_stored = run_in_thread(self.read_stored)
+        candles = await read_stored() if self.stored_candles is not None else []
+        while candles:
+            yield [candle_to_dict(candle) for candle in candles]
+            candles = await read_stored(candles[-1][BEGIN_INDEX]) if len(candles) == self.chunk_size else []
+        for page in self.pages:
+            yield page
+
+
+def iter_candles(ticker: str, dt_from: str, dt_till: str, interval, chunk_size: int = 500):
+    """Свечи по акции за период страницами по порядку, см. CandlePages.
+
+    :return: Генератор списков свечей
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    yield from CandlePages(ticker, dt_from, dt_till, interval, chunk_size)
+
+
+def get_candles_final_since(dt_till: str, interval: str) -> datetime.datetime | None:
+    """Момент, с которого свечи периода окончательны и ответ по ним больше не меняется.
+
+    Свечи за завершившиеся дни не меняются (см. sync_candles), кроме недельных и более длинных
+    свечей MOEX ISS, которые продолжаются после окончания периода.
+
+    :param dt_till: Дата окончания периода, например '2024-05-01'
+    :param interval: Период свечей MOEX ISS или длительность произвольной свечи, например '4h'
+    :return: Начало дня, следующего за dt_till, или None, если период включает текущий день
+    """
+    if interval.isdigit() and int(interval) not in STORED_INTERVALS:
+        return None
+    try:
+        date_till = datetime.date.fromisoformat(str(dt_till)[:10])
+    except ValueError:
+        return None
+    if date_till >= get_moscow_now().date():
+        return None
+    return get_day_start(date_till + datetime.timedelta(days=1))
+
+
+def get_candles(ticker: str, dt_from: str, dt_till: str, interval) -> list[dict]:
+    """Все свечи по акции за период списком, см. iter_candles."""
+    return list(itertools.chain.from_iterable(iter_candles(ticker, dt_from, dt_till, interval)))
+
+
+def parse_candle_datetime(value: str) -> datetime.datetime:
+    return datetime.datetime.strptime(value, CANDLE_DATETIME_FORMAT).replace(tzinfo=MOEX_TIMEZONE)
+
+
+def get_day_start(date: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(date, datetime.time(), tzinfo=MOEX_TIMEZONE)
+
+
+def candle_to_dict(candle: tuple) -> dict:
+    """Свеча из хранилища в формате MOEX ISS: московское время строкой."""
+    candle = dict(zip(CANDLE_FIELDS, candle))
+    for field in ('begin', 'end'):
+        candle[field] = timezone.localtime(candle[field], MOEX_TIMEZONE).strftime(CANDLE_DATETIME_FORMAT)
+    return candle
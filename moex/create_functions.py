@@ -1,27 +1,206 @@
 import datetime
+import zoneinfo
 
-HOLIDAY_DAYS = ['2025-05-09', '2025-06-12', '2025-11-04', '2025-12-31']
+import ijson
+import numpy as np
+import orjson
 
-MIN_START_TIME_FOR_WORKING_DAY = datetime.time(hour=6)
-MAX_END_TIME_FOR_WORKING_DAY = datetime.time(hour=23, minute=59, second=59)
-MIN_START_TIME_FOR_DAY_OFF = datetime.time(hour=9)
-MAX_END_TIME_FOR_DAY_OFF = datetime.time(hour=18, minute=59, second=59)
+from moex.trading_calendar import TradingCalendar
 
+MOEX_TIMEZONE = zoneinfo.ZoneInfo('Europe/Moscow')
 
-def parse_start_structure(raw_data: dict) -> list[dict]:
-    """Парсинг начальной структуры."""
-    start_stracture = []
+# Типы числовых столбцов в metadata ответов MOEX ISS
+NUMERIC_COLUMN_TYPES = ('int32', 'int64', 'double')
+
+
+def get_column_indexes(raw_data: dict, fields=None) -> dict[str, int]:
+    """Номера нужных столбцов блока MOEX ISS в порядке следования в блоке.
+
+    :param raw_data: Блок ответа MOEX ISS с ключами columns и data
+    :param fields: Нужные столбцы; None - все столбцы. Отсутствующие в блоке столбцы пропускаются
+    :return: Словарь «столбец -> номер»
+    """
     columns = raw_data['columns']
-    for row in raw_data['data']:
-        start_stracture.append(dict(zip(columns, row)))
-    return start_stracture
+    if fields is None:
+        return {column: index for index, column in enumerate(columns)}
+    fields = set(fields)
+    return {column: index for index, column in enumerate(columns) if column in fields}
+
+
+def parse_start_structure(raw_data: dict, fields=None) -> list[dict]:
+    """Парсинг начальной структуры.
+
+    :param raw_data: Блок ответа MOEX ISS с ключами columns и data
+    :param fields: Нужные столбцы; None - все столбцы
+    :return: Список словарей «столбец -> значение» по строкам
+    """
+    if fields is None:
+        columns = raw_data['columns']
+        return [dict(zip(columns, row)) for row in raw_data['data']]
+    indexes = get_column_indexes(raw_data, fields)
+    return [{column: row[index] for column, index in indexes.items()} for row in raw_data['data']]
+
+
+def parse_response_block(response, block: str, fields=None) -> list[dict]:
+    """Строки блока прочитанного ответа MOEX ISS (get, в том числе из кэша), см. parse_start_structure.
+
+    Тело ответа уже в памяти, поэтому документ разбирается orjson целиком: это быстрее разбора по кускам
+    (iter_rows), который нужен только при чтении тела из сокета (get_stream).
+
+    :param response: Ответ requests или httpx
+    :param block: Имя блока, например 'trades'
+    :param fields: Нужные столбцы; None - все столбцы
+    """
+    return parse_start_structure(orjson.loads(response.content)[block], fields)
 
 
-def parse_securities_and_marketdata(raw_data: dict) -> dict:
-    """Парсинг securities и marketdata."""
+def parse_columns(raw_data: dict, fields=None, as_arrays: bool = False) -> dict[str, list | np.ndarray]:
+    """Парсинг блока MOEX ISS по столбцам без создания словаря на каждую строку.
+
+    Из строк берутся только нужные столбцы по их номерам. С as_arrays числовые столбцы
+    (по типам из metadata блока) возвращаются массивами NumPy: целые - int64, если в столбце
+    нет пропусков, иначе, как и дробные, float64 с NaN вместо None.
+
+    :param raw_data: Блок ответа MOEX ISS с ключами columns, data и необязательным metadata
+    :param fields: Нужные столбцы; None - все столбцы
+    :param as_arrays: Возвращать числовые столбцы массивами NumPy
+    :return: Словарь «столбец -> значения» по строкам
+    """
+    data = raw_data['data']
+    metadata = raw_data.get('metadata', {})
+    result = {}
+    for column, index in get_column_indexes(raw_data, fields).items():
+        values = [row[index] for row in data]
+        column_type = metadata.get(column, {}).get('type')
+        if as_arrays and column_type in NUMERIC_COLUMN_TYPES:
+            if column_type == 'double' or None in values:
+                values = np.array(values, dtype=np.float64)
+            else:
+                values = np.array(values, dtype=np.int64)
+        result[column] = values
+    return result
+
+
+def iter_rows(chunks, block: str, fields=None):
+    """Строки блока MOEX ISS словарями по мере разбора тела ответа, без разбора документа целиком.
+
+    В отличие от parse_response_block разобранный документ не строится, хранятся только еще не отданные
+    строки текущего куска. Подходит для тела, читаемого из сокета (BaseAPIService.get_stream): тогда
+    в памяти не хранится и само тело. Прочитанный ответ (get, в том числе из кэша) быстрее разобрать
+    целиком, см. parse_response_block.
+
+    :param chunks: Куски тела ответа, например common_utils.api.iter_response_chunks(response)
+    :param block: Имя блока, например 'trades'
+    :param fields: Нужные столбцы; None - все столбцы
+    :return: Генератор словарей «столбец -> значение»
+    :raises ijson.JSONError: Некорректный или оборванный JSON
+    """
+    parser = BlockRowsParser(block, fields)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_blocks(chunks, blocks: dict) -> dict[str, list[dict]]:
+    """Разобрать несколько блоков MOEX ISS за один проход по телу ответа.
+
+    :param chunks: Куски тела ответа
+    :param blocks: Словарь «имя блока -> нужные столбцы или None»
+    :return: Словарь «имя блока -> список словарей по строкам»
+    :raises ijson.JSONError: Некорректный или оборванный JSON
+    """
+    parsers = {block: BlockRowsParser(block, fields) for block, fields in blocks.items()}
+    result = {block: [] for block in blocks}
+    for chunk in chunks:
+        for block, parser in parsers.items():
+            result[block].extend(parser.feed(chunk))
+    for block, parser in parsers.items():
+        result[block].extend(parser.close())
+    return result
+
+
+class BlockRowsParser:
+    """Инкрементальный разбор одного блока MOEX ISS из кусков JSON.
+
+    Массивы строк data разбираются ijson на C, словарь строится только по нужным столбцам.
+    Столбцы блока в ответах MOEX ISS идут перед data; если строки пришли раньше, они
+    накапливаются до разбора columns.
+    """
+
+    def __init__(self, block: str, fields=None):
+        self.block = block
+        self.fields = fields
+        self.indexes = None
+        self._columns = ijson.sendable_list()
+        self._rows = ijson.sendable_list()
+        self._columns_parser = ijson.items_coro(self._columns, f'{block}.columns')
+        self._rows_parser = ijson.items_coro(self._rows, f'{block}.data.item', use_float=True)
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """Передать очередной кусок тела ответа и получить строки, разобранные полностью."""
+        if self.indexes is None:
+            self._columns_parser.send(chunk)
+            if self._columns:
+                self.indexes = get_column_indexes({'columns': self._columns[0]}, self.fields)
+                self._names = tuple(self.indexes)
+                if len(self.indexes) == len(self._columns[0]):
+                    self._select = None
+                else:
+                    self._select = lambda row, indexes=tuple(self.indexes.values()): [row[i] for i in indexes]
+                # Дальше столбцы не нужны, документ дочитывается только парсером строк
+                self._columns_parser = None
+        self._rows_parser.send(chunk)
+        return self._take_rows()
+
+    def close(self) -> list[dict]:
+        """Завершить разбор и получить оставшиеся строки."""
+        self._rows_parser.close()
+        if self.indexes is None:
+            raise ValueError(f'В ответе MOEX ISS нет блока {self.block}')
+        return self._take_rows()
+
+    def _take_rows(self) -> list[dict]:
+        if self.indexes is None or not self._rows:
+            return []
+        names, select = self._names, self._select
+        if select is None:
+            rows = [dict(zip(names, row)) for row in self._rows]
+        else:
+            rows = [dict(zip(names, select(row))) for row in self._rows]
+        del self._rows[:]
+        return rows
+
+
+def parse_securities_and_marketdata(raw_data: dict, securities_fields=None, marketdata_fields=None) -> dict:
+    """Парсинг securities и marketdata.
+
+    :param raw_data: Ответ MOEX ISS с блоками securities и marketdata
+    :param securities_fields: Нужные столбцы securities; None - все столбцы
+    :param marketdata_fields: Нужные столбцы marketdata; None - все столбцы
+    :return: Словарь «тикер -> {'securities': ..., 'marketdata': ...}»
+    """
+    # SECID нужен для сопоставления строк блоков
+    if securities_fields is not None:
+        securities_fields = {*securities_fields, 'SECID'}
+    if marketdata_fields is not None:
+        marketdata_fields = {*marketdata_fields, 'SECID'}
+    securities = parse_start_structure(raw_data['securities'], securities_fields)
+    marketdata = parse_start_structure(raw_data['marketdata'], marketdata_fields)
+    return join_securities_and_marketdata(securities, marketdata)
+
+
+def stream_securities_and_marketdata(chunks, securities_fields=None, marketdata_fields=None) -> dict:
+    """То же, что parse_securities_and_marketdata, но по кускам тела ответа, см. parse_blocks."""
+    blocks = parse_blocks(chunks, {
+        'securities': None if securities_fields is None else {*securities_fields, 'SECID'},
+        'marketdata': None if marketdata_fields is None else {*marketdata_fields, 'SECID'},
+    })
+    return join_securities_and_marketdata(blocks['securities'], blocks['marketdata'])
+
+
+def join_securities_and_marketdata(securities: list[dict], marketdata: list[dict]) -> dict:
+    """Объединить строки securities и marketdata по SECID."""
     result_dict = {}
-    securities = parse_start_structure(raw_data['securities'])
-    marketdata = parse_start_structure(raw_data['marketdata'])
     for block_of_securities in securities:
         result_dict[block_of_securities['SECID']] = {'securities': block_of_securities}
     for block_of_marketdata in marketdata:
@@ -29,94 +208,53 @@ def parse_securities_and_marketdata(raw_data: dict) -> dict:
     return result_dict
 
 
-def get_day_type(date: datetime):
-    """
-    Определяет тип дня:
-    0 - рабочий день (пн-пт, не праздник)
-    1 - выходной (сб-вс, не праздник)
-    2 - праздник (в списке HOLIDAY_DAYS)
-    """
-    if date.strftime('%Y-%m-%d') in HOLIDAY_DAYS:
-        return 2
-    if date.weekday() >= 5:
-        return 1
-    return 0
-
+def is_trading_time(current_datetime: datetime) -> bool:
+    """Проверяет, идут ли торги на Московской Бирже в указанное время (московское, без часового пояса)."""
+    return TradingCalendar.get().is_trading_time(current_datetime)
 
-def get_next_valid_start_time(current_datetime: datetime):
-    """Получает следующее допустимое время начала с учетом рабочих часов Московской Биржи."""
-    while True:
-        day_type = get_day_type(current_datetime)
 
-        if day_type == 2:  # Праздник - пропускаем весь день
-            # Переходим на начало следующего дня
-            current_datetime = current_datetime.replace(hour=0, minute=0, second=0) + datetime.timedelta(days=1)
-            continue
+def get_moscow_now() -> datetime.datetime:
+    """Текущее московское время без часового пояса, как в данных MOEX ISS."""
+    return datetime.datetime.now(MOEX_TIMEZONE).replace(tzinfo=None)
 
-        # Определяем временные границы для текущего типа дня
-        if day_type == 0:  # Рабочий день
-            min_time = MIN_START_TIME_FOR_WORKING_DAY
-            max_time = MAX_END_TIME_FOR_WORKING_DAY
-        else:  # Выходной
-            min_time = MIN_START_TIME_FOR_DAY_OFF
-            max_time = MAX_END_TIME_FOR_DAY_OFF
 
-        current_time = current_datetime.time()
+def get_market_data_cache_timeout(timeout: int, current_datetime: datetime = None) -> int:
+    """Время хранения рыночных данных в кэше с учетом расписания торгов.
 
-        # Если текущее время меньше минимального - устанавливаем на минимальное
-        if current_time < min_time:
-            return current_datetime.replace(hour=min_time.hour, minute=0, second=0)
+    Во время торгов возвращает timeout без изменений, вне торгов данные не меняются,
+    поэтому запись живет до начала следующей торговой сессии.
+    """
+    current_datetime = current_datetime or get_moscow_now()
+    if is_trading_time(current_datetime):
+        return timeout
+    seconds_until_session = (get_next_valid_start_time(current_datetime) - current_datetime).total_seconds()
+    return max(timeout, int(seconds_until_session))
 
-        # Если текущее время в допустимом диапазоне - возвращаем как есть
-        if current_time <= max_time:
-            return current_datetime.replace(minute=0, second=0)
 
-        # Иначе переходим на следующий день
-        current_datetime = current_datetime.replace(hour=0, minute=0, second=0) + datetime.timedelta(days=1)
+def get_next_valid_start_time(current_datetime: datetime):
+    """Получает начало текущего торгового часа или следующего, если торгов нет, по торговому календарю."""
+    return TradingCalendar.get().next_session_start(current_datetime)
 
 
 def set_appropriate_datetime(list_of_costs: list[float], last_date_end: str, predict_starting_with_next_hour: bool):
-    last_datetime_end = datetime.datetime.strptime(last_date_end, '%Y-%m-%d %H:%M:%S')
+    """Сопоставить предсказанные цены следующим торговым часам.
 
+    :param list_of_costs: Предсказанные цены закрытия по часам
+    :param last_date_end: Окончание последней известной свечи, '%Y-%m-%d %H:%M:%S'
+    :param predict_starting_with_next_hour: Первая цена относится к следующему часу, иначе к часу last_date_end
+    :return: Список свечей с begin, end и close
+    """
+    start = datetime.datetime.strptime(last_date_end, '%Y-%m-%d %H:%M:%S')
     if predict_starting_with_next_hour:
-        next_start_date = (last_datetime_end + datetime.timedelta(hours=1)).replace(minute=0, second=0)
-    else:
-        next_start_date = last_datetime_end.replace(minute=0, second=0)
-
-    next_start_date = get_next_valid_start_time(next_start_date)
-    new_dates = []
-
-    while len(new_dates) < len(list_of_costs):
-        day_type = get_day_type(next_start_date)
-
-        if day_type == 2:  # Праздник - пропускаем
-            next_start_date = get_next_valid_start_time(next_start_date + datetime.timedelta(hours=1))
-            continue
-
-        # Определяем временные границы для текущего типа дня
-        if day_type == 0:  # Рабочий день
-            min_hour = MIN_START_TIME_FOR_WORKING_DAY.hour
-            max_hour = MAX_END_TIME_FOR_WORKING_DAY.hour
-        else:  # Выходной
-            min_hour = MIN_START_TIME_FOR_DAY_OFF.hour
-            max_hour = MAX_END_TIME_FOR_DAY_OFF.hour
-
-        # Проверяем, что текущий час в допустимом диапазоне
-        if min_hour <= next_start_date.hour <= max_hour:
-            end_time = (next_start_date + datetime.timedelta(hours=1) - datetime.timedelta(seconds=1))
-            new_dates.append({
-                'begin': next_start_date.strftime('%Y-%m-%d %H:%M:%S'),
-                'end': end_time.strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        # Переходим к следующему часу
-        next_start_date += datetime.timedelta(hours=1)
-
-        # Если следующий час выходит за пределы рабочего времени, находим следующее допустимое время
-        if next_start_date.hour > max_hour or not (min_hour <= next_start_date.hour <= max_hour):
-            next_start_date = get_next_valid_start_time(next_start_date)
-
-    for index, new_date in enumerate(new_dates):
-        new_date.update({'close': list_of_costs[index]})
-
-    return new_dates
+        start += datetime.timedelta(hours=1)
+
+    begins = TradingCalendar.get().next_slots(start, len(list_of_costs)).astype('datetime64[s]')
+    ends = begins + np.timedelta64(3599, 's')
+    return [
+        {'begin': begin.replace('T', ' '), 'end': end.replace('T', ' '), 'close': close}
+        for begin, end, close in zip(
+            np.datetime_as_string(begins).tolist(),
+            np.datetime_as_string(ends).tolist(),
+            list_of_costs,
+        )
+    ]
@@ -0,0 +1,218 @@
+import hashlib
+
+import numpy as np
+import orjson
+from django.conf import settings
+
+from common_utils.cache import TieredCache
+from moex.candle_store import get_candles_final_since
+from moex.create_functions import get_market_data_cache_timeout
+from moex.resampling import candles_to_columns
+
+# Наибольший период индикатора и число индикаторов в одном запросе
+MAX_PERIOD = 1000
+MAX_INDICATORS = 10
+# Знаков после запятой в значениях индикаторов: полная точность float удваивает размер ответа
+DECIMALS = 6
+# Допустимый разброс степеней затухания внутри блока ewm: точность суммы сохраняется до 1e-16 * 1e8
+EWM_BLOCK_SCALE = np.log(1e8)
+
+indicators_cache = TieredCache('indicators', l1_max_size=256)
+
+
+def ewm(values: np.ndarray, alpha: float, initial: float | None = None) -> np.ndarray:
+    """Экспоненциальное сглаживание ``y[t] = alpha * x[t] + (1 - alpha) * y[t - 1]`` без цикла по элементам.
+
+    Рекурсия раскрывается в ``y[k] = d^(k+1) * y[-1] + alpha * d^k * cumsum(x[i] / d^i)``, где d = 1 - alpha.
+    Чтобы степени d не теряли точность, ряд обрабатывается блоками, в пределах которых d^k не меньше 1e-8;
+    цикл Python идет по блокам (сотни и тысячи значений), а не по значениям.
+
+    :param values: Ряд значений
+    :param alpha: Коэффициент сглаживания от 0 до 1
+    :param initial: Значение y[-1]; None - первое значение ряда, тогда y[0] = x[0]
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty_like(values)
+    if not len(values):
+        return result
+    decay = 1 - alpha
+    if decay <= 0:
+        result[:] = values
+        return result
+    block = max(1, int(EWM_BLOCK_SCALE / -np.log(decay)))
+    powers = decay ** np.arange(min(block, len(values)))
+    state = values[0] if initial is None else initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        chunk_powers = powers[:len(chunk)]
+        smoothed = alpha * chunk_powers * np.cumsum(chunk / chunk_powers) + decay * chunk_powers * state
+        result[start:start + len(chunk)] = smoothed
+        state = smoothed[-1]
+    return result
+
+
+def sma(columns: dict[str, np.ndarray], period: int) -> np.ndarray:
+    """Простая скользящая средняя цен закрытия; первые period - 1 значений - NaN."""
+    close = columns['close']
+    result = np.full(len(close), np.nan)
+    if len(close) >= period:
+        cumulative = np.cumsum(np.r_[0.0, close])
+        result[period - 1:] = (cumulative[period:] - cumulative[:-period]) / period
+    return result
+
+
+def ema(columns: dict[str, np.ndarray], period: int) -> np.ndarray:
+    """Экспоненциальная скользящая средняя цен закрытия, alpha = 2 / (period + 1); первые period - 1 значений - NaN."""
+    result = ewm(columns['close'], 2 / (period + 1))
+    result[:period - 1] = np.nan
+    return result
+
+
+def rsi(columns: dict[str, np.ndarray], period: int) -> np.ndarray:
+    """Индекс относительной силы со сглаживанием Уайлдера; первые period значений - NaN."""
+    close = columns['close']
+    result = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return result
+    delta = np.diff(close)
+    gains, losses = np.maximum(delta, 0), np.maximum(-delta, 0)
+    # Первое среднее - простое за period изменений, далее сглаживание с alpha = 1 / period
+    average_gain = np.r_[gains[:period].mean(), ewm(gains[period:], 1 / period, gains[:period].mean())]
+    average_loss = np.r_[losses[:period].mean(), ewm(losses[period:], 1 / period, losses[:period].mean())]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[period:] = np.where(average_loss == 0, 100.0, 100 - 100 / (1 + average_gain / average_loss))
+    return result
+
+
+def macd(columns: dict[str, np.ndarray], fast: int, slow: int, signal: int) -> dict[str, np.ndarray]:
+    """MACD: разность EMA fast и slow, сигнальная линия (EMA signal от MACD) и гистограмма."""
+    close = columns['close']
+    line = ewm(close, 2 / (fast + 1)) - ewm(close, 2 / (slow + 1))
+    signal_line = ewm(line, 2 / (signal + 1))
+    histogram = line - signal_line
+    line[:slow - 1] = np.nan
+    signal_line[:slow + signal - 2] = np.nan
+    histogram[:slow + signal - 2] = np.nan
+    return {'macd': line, 'signal': signal_line, 'histogram': histogram}
+
+
+def bollinger(columns: dict[str, np.ndarray], period: int, width: float) -> dict[str, np.ndarray]:
+    """Полосы Боллинджера: SMA period и границы на width стандартных отклонений (по генеральной совокупности)."""
+    close = columns['close']
+    middle = sma(columns, period)
+    deviation = np.full(len(close), np.nan)
+    if len(close) >= period:
+        deviation[period - 1:] = np.lib.stride_tricks.sliding_window_view(close, period).std(axis=1)
+    return {'middle': middle, 'upper': middle + width * deviation, 'lower': middle - width * deviation}
+
+
+def vwap(columns: dict[str, np.ndarray]) -> np.ndarray:
+    """Средневзвешенная по объему типичная цена (high + low + close) / 3 с начала каждого торгового дня."""
+    typical = (columns['high'] + columns['low'] + columns['close']) / 3
+    volume = columns['volume'].astype(np.float64)
+    if not len(volume):
+        return typical
+    days = columns['begin'].astype('datetime64[D]')
+    day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    day_lengths = np.diff(np.r_[day_starts, len(days)])
+
+    def cumsum_by_day(values):
+        cumulative = np.cumsum(values)
+        before_day = np.r_[0.0, cumulative][day_starts]
+        return cumulative - np.repeat(before_day, day_lengths)
+
+    price_volume, total_volume = cumsum_by_day(typical * volume), cumsum_by_day(volume)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total_volume > 0, price_volume / total_volume, np.nan)
+
+
+# Индикаторы: функция, параметры по умолчанию и число целых параметров-периодов в начале списка параметров
+INDICATORS = {
+    'sma': (sma, (20,), 1),
+    'ema': (ema, (20,), 1),
+    'rsi': (rsi, (14,), 1),
+    'macd': (macd, (12, 26, 9), 3),
+    'bollinger': (bollinger, (20, 2), 1),
+    'vwap': (vwap, (), 0),
+}
+
+
+def parse_indicators(indicators_string: str) -> dict[str, tuple[str, tuple]]:
+    """Разобрать список индикаторов вида ``sma:20,ema:50,macd:12:26:9,bollinger:20:2,vwap``.
+
+    Параметры, которые не указаны, берутся по умолчанию: ``rsi`` - то же, что ``rsi:14``.
+
+    :return: Словарь «ключ ответа -> (индикатор, параметры)», например ``{'sma_20': ('sma', (20,))}``
+    :raises ValueError: Неизвестный индикатор или неверные параметры
+    """
+    parsed = {}
+    for spec in filter(None, (spec.strip().lower() for spec in indicators_string.split(','))):
+        name, *values = spec.split(':')
+        if name not in INDICATORS:
+            raise ValueError(f'неизвестный индикатор {name}')
+        _, defaults, periods = INDICATORS[name]
+        if len(values) > len(defaults):
+            raise ValueError(f'у индикатора {name} не более {len(defaults)} параметров')
+        try:
+            params = tuple(
+                (int if index < periods else float)(value) for index, value in enumerate(values)
+            ) + defaults[len(values):]
+        except ValueError:
+            raise ValueError(f'неверные параметры индикатора {spec}') from None
+        if any(not 1 <= period <= MAX_PERIOD for period in params[:periods]):
+            raise ValueError(f'периоды индикатора {spec} должны быть от 1 до {MAX_PERIOD}')
+        if not all(param > 0 for param in params[periods:]):
+            raise ValueError(f'параметры индикатора {spec} должны быть положительными')
+        parsed['_'.join([name, *(f'{param:g}' for param in params)])] = (name, params)
+    if not parsed:
+        raise ValueError('не указаны индикаторы')
+    if len(parsed) > MAX_INDICATORS:
+        raise ValueError(f'не более {MAX_INDICATORS} индикаторов в запросе')
+    return parsed
+
+
+def compute_indicators(candles: list[dict], indicators: dict[str, tuple[str, tuple]]) -> bytes:
+    """Рассчитать индикаторы по свечам и закодировать ответ.
+
+    :param candles: Свечи в формате parse_start_structure по порядку
+    :param indicators: Результат parse_indicators
+    :return: JSON ``{"begin": [...], "<ключ>": [...] или {"<линия>": [...]}}``, значения периода разгона - null
+    """
+    columns = candles_to_columns(candles)
+    result = {
+        'begin': [value.replace('T', ' ') for value in np.datetime_as_string(columns['begin'], unit='s').tolist()],
+    }
+    for key, (name, params) in indicators.items():
+        values = INDICATORS[name][0](columns, *params)
+        if isinstance(values, dict):
+            result[key] = {line: np.round(line_values, DECIMALS) for line, line_values in values.items()}
+        else:
+            result[key] = np.round(values, DECIMALS)
+    return orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def get_indicators(ticker: str, dt_from: str, dt_till: str, interval: str, indicators: dict, pages) -> bytes:
+    """Индикаторы по свечам за период из кэша или рассчитанные по страницам свечей.
+
+    Ответ по окончательным свечам (см. get_candles_final_since) хранится как свечи за завершившиеся дни,
+    по периоду с текущим днем - как свечи MOEX ISS.
+
+    :param pages: Страницы свечей за период (CandlePages), читаются только при промахе кэша. Индикаторы
+        по устаревшим страницам (pages.is_stale) не кэшируются
+    :return: JSON, см. compute_indicators
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    key = hashlib.sha1(repr((ticker, dt_from, dt_till, interval, sorted(indicators.items()))).encode()).hexdigest()
+    body = indicators_cache.get(key)
+    if body is not None:
+        return body
+
+    body = compute_indicators([candle for page in pages for candle in page], indicators)
+    if pages.is_stale:
+        return body
+    if get_candles_final_since(dt_till, interval) is not None:
+        timeout = settings.MOEX_CACHE['TIMEOUTS']['CANDLES_HISTORY']
+    else:
+        timeout = get_market_data_cache_timeout(settings.MOEX_CACHE['TIMEOUTS']['CANDLES'])
+    indicators_cache.set(key, body, timeout)
+    return body
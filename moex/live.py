@@ -0,0 +1,218 @@
+import asyncio
+import time
+import weakref
+from collections import defaultdict
+
+import orjson
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from common_utils.single_flight import REDIS_ERRORS
+from moex.create_functions import get_market_data_cache_timeout, parse_response_block
+from services.moex import MOEXAPIService
+
+# Канал Redis pub/sub с событиями потока ('orderbook' или 'trades') по акции
+LIVE_CHANNEL = 'moex:live:{ticker}:{stream}'
+LIVE_STREAMS = ('orderbook', 'trades')
+ORDERBOOK_KEY = 'moex:orderbook:{ticker}'
+# Акции, ленты сделок и стаканы которых обновляют фоновые задачи: тикер -> время последнего интереса
+WATCHED_TICKERS_KEY = 'moex:trade_tape:watched'
+WATCHED_ORDERBOOKS_KEY = 'moex:orderbook:watched'
+WATCHED_KEYS = {'trades': WATCHED_TICKERS_KEY, 'orderbook': WATCHED_ORDERBOOKS_KEY}
+
+
+def get_live_channel(ticker: str, stream: str) -> str:
+    return LIVE_CHANNEL.format(ticker=ticker, stream=stream)
+
+
+def get_orderbook_level(row: dict) -> str:
+    """Ключ уровня стакана: направление и цена."""
+    return f'{row["BUYSELL"]}:{row["PRICE"]}'
+
+
+def diff_orderbook(old_levels: dict[str, dict], new_levels: dict[str, dict]) -> list[dict]:
+    """Изменения стакана: новые и изменившиеся уровни, а также исчезнувшие уровни с QUANTITY = 0."""
+    changes = [row for level, row in new_levels.items() if old_levels.get(level) != row]
+    changes.extend({**row, 'QUANTITY': 0} for level, row in old_levels.items() if level not in new_levels)
+    return changes
+
+
+def get_orderbook_snapshot(ticker: str) -> list[dict]:
+    """Последний стакан по акции, сохраненный update_orderbook, или пустой список."""
+    try:
+        levels = get_redis_connection('default').hvals(ORDERBOOK_KEY.format(ticker=ticker))
+    except REDIS_ERRORS:
+        return []
+    return sorted((orjson.loads(level) for level in levels), key=lambda row: (row['BUYSELL'], row['PRICE']))
+
+
+def update_orderbook(ticker: str) -> int:
+    """Запросить стакан по акции в MOEX ISS и опубликовать изменившиеся уровни.
+
+    :param ticker: Код ценной бумаги, например 'SBER'
+    :return: Число изменившихся уровней
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    response = MOEXAPIService.get_orderbook_for_action(ticker, use_cache=False)
+    response.raise_for_status()
+    new_levels = {get_orderbook_level(row): row for row in parse_response_block(response, 'orderbook')}
+
+    connection = get_redis_connection('default')
+    key = ORDERBOOK_KEY.format(ticker=ticker)
+    old_levels = {level.decode(): orjson.loads(row) for level, row in connection.hgetall(key).items()}
+    changes = diff_orderbook(old_levels, new_levels)
+
+    pipeline = connection.pipeline(transaction=True)
+    pipeline.delete(key)
+    if new_levels:
+        pipeline.hset(key, mapping={level: orjson.dumps(row) for level, row in new_levels.items()})
+        pipeline.expire(key, get_market_data_cache_timeout(settings.MOEX_LIVE['WATCH_TIMEOUT']))
+    if changes:
+        publish_live_event(pipeline, ticker, 'orderbook', changes)
+    pipeline.execute()
+    return len(changes)
+
+
+def publish_live_event(pipeline, ticker: str, stream: str, data: list[dict]):
+    """Добавить в pipeline публикацию события потока по акции."""
+    pipeline.publish(get_live_channel(ticker, stream), orjson.dumps({'ticker': ticker, 'data': data}))
+
+
+def get_watched_orderbooks() -> list[str]:
+    """Акции, на стаканы которых есть подписчики потока."""
+    connection = get_redis_connection('default')
+    connection.zremrangebyscore(WATCHED_ORDERBOOKS_KEY, '-inf', time.time() - settings.MOEX_LIVE['WATCH_TIMEOUT'])
+    return [ticker.decode() for ticker in connection.zrange(WATCHED_ORDERBOOKS_KEY, 0, -1)]
+
+
+def format_event(stream: str, data: bytes) -> bytes:
+    """Событие Server-Sent Events."""
+    return b'event: %s\ndata: %s\n\n' % (stream.encode(), data)
+
+
+class LiveHub:
+    """Общая на воркер и событийный цикл подписка Redis pub/sub с раздачей событий подписчикам потока.
+
+    Сколько бы клиентов ни было подписано на акцию, воркер держит одно соединение с Redis, получает
+    каждое событие один раз и один раз форматирует его в SSE. Подписчик получает события через
+    asyncio.Queue; если он не успевает их забирать и очередь переполнена, вместо событий он получает
+    None и должен переподключиться. Раз в HEARTBEAT секунд хаб отмечает акции подписчиков как
+    отслеживаемые, чтобы фоновые задачи продолжали их обновлять.
+    """
+    _hubs = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        self.redis = redis.asyncio.from_url(settings.CACHES['default']['LOCATION'])
+        self.pubsub = self.redis.pubsub()
+        self.queues = defaultdict(set)
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self._watched_at = float('-inf')
+
+    @classmethod
+    def get(cls) -> 'LiveHub':
+        """Хаб текущего событийного цикла."""
+        loop = asyncio.get_running_loop()
+        hub = cls._hubs.get(loop)
+        if hub is None:
+            hub = cls._hubs[loop] = cls()
+        return hub
+
+    async def subscribe(self, channels: list[str], queue: asyncio.Queue):
+        async with self._lock:
+            new_channels = [channel for channel in channels if not self.queues[channel]]
+            for channel in channels:
+                self.queues[channel].add(queue)
+            if new_channels:
+                await self.pubsub.subscribe(*new_channels)
+                self._watched_at = float('-inf')
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, channels: list[str], queue: asyncio.Queue):
+        async with self._lock:
+            unused_channels = []
+            for channel in channels:
+                self.queues[channel].discard(queue)
+                if not self.queues[channel]:
+                    del self.queues[channel]
+                    unused_channels.append(channel)
+            if unused_channels:
+                await self.pubsub.unsubscribe(*unused_channels)
+
+    def stats(self) -> dict:
+        return {
+            'channels': len(self.queues),
+            'subscribers': len({queue for queues in self.queues.values() for queue in queues}),
+        }
+
+    async def _read(self):
+        while True:
+            try:
+                if time.monotonic() - self._watched_at >= settings.MOEX_LIVE['HEARTBEAT']:
+                    await self._watch()
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+            except REDIS_ERRORS:
+                # redis-py переподписывается на каналы при переподключении
+                await asyncio.sleep(1)
+                continue
+            if message is not None:
+                self._dispatch(message['channel'].decode(), message['data'])
+
+    def _dispatch(self, channel: str, data: bytes):
+        queues = self.queues.get(channel)
+        if not queues:
+            return
+        event = format_event(channel.rsplit(':', 1)[1], data)
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _watch(self):
+        self._watched_at = time.monotonic()
+        watched = defaultdict(dict)
+        now = time.time()
+        for channel in self.queues:
+            _, _, ticker, stream = channel.split(':')
+            watched[WATCHED_KEYS[stream]][ticker] = now
+        if watched:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key, tickers in watched.items():
+                pipeline.zadd(key, tickers)
+            await pipeline.execute()
+
+
+async def iter_live_events(tickers: list[str], streams: list[str]):
+    """События потока по акциям в формате SSE: сначала текущие стаканы, затем изменения.
+
+    :param tickers: Коды ценных бумаг
+    :param streams: Потоки из LIVE_STREAMS
+    :return: Асинхронный генератор байтов событий; завершается, если подписчик не успевает за событиями
+    """
+    hub = LiveHub.get()
+    channels = [get_live_channel(ticker, stream) for ticker in tickers for stream in streams]
+    queue = asyncio.Queue(maxsize=settings.MOEX_LIVE['QUEUE_SIZE'])
+    await hub.subscribe(channels, queue)
+    try:
+        if 'orderbook' in streams:
+            for ticker in tickers:
+                snapshot = await sync_to_async(get_orderbook_snapshot, thread_sensitive=False)(ticker)
+                yield format_event('snapshot', orjson.dumps({'ticker': ticker, 'data': snapshot}))
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.MOEX_LIVE['HEARTBEAT'])
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if event is None:
+                yield format_event('overflow', b'{}')
+                return
+            yield event
+    finally:
+        await hub.unsubscribe(channels, queue)
@@ -0,0 +1,121 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from common_utils.api import UPSTREAM_HTTP_ERRORS
+from common_utils.circuit_breaker import CircuitOpenError
+from common_utils.rate_limiter import RateLimiter
+from moex.candle_store import STORED_INTERVALS, find_missing_ranges, sync_candles
+from moex.create_functions import get_moscow_now
+from moex.models import Asset
+from services.moex import MOEXAPIService
+
+
+class Command(BaseCommand):
+    """Загружает историю свечей по всем активным акциям в локальное хранилище.
+
+    Период каждой пары (акция, интервал) делится на отрезки по ``--chunk-days`` дней, отрезки загружаются
+    в пуле потоков. Загруженные дни отмечаются в CandleSyncedDay, поэтому прерванный запуск продолжается
+    с незагруженных отрезков.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=5, help='Depth of history in years')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, help='First day, YYYY-MM-DD')
+        parser.add_argument('--till', dest='date_till', type=datetime.date.fromisoformat, help='Last day, YYYY-MM-DD')
+        parser.add_argument(
+            '--intervals',
+            type=lambda value: [int(interval) for interval in value.split(',')],
+            default=list(STORED_INTERVALS),
+            help='Comma-separated MOEX candle intervals',
+        )
+        parser.add_argument('--tickers', type=lambda value: value.split(','), help='Comma-separated tickers')
+        parser.add_argument('--workers', type=int, default=4, help='Number of chunks loaded concurrently')
+        parser.add_argument('--rate-limit', type=float, default=10, help='Max requests per second to MOEX ISS')
+        parser.add_argument('--chunk-days', type=int, default=30, help='Days per chunk (checkpoint granularity)')
+
+    def handle(self, *args, **options):
+        unsupported_intervals = set(options['intervals']) - set(STORED_INTERVALS)
+        if unsupported_intervals:
+            raise CommandError(f'Unsupported intervals: {sorted(unsupported_intervals)}')
+
+        date_till = options['date_till'] or get_moscow_now().date() - datetime.timedelta(days=1)
+        date_from = options['date_from'] or date_till - datetime.timedelta(days=365 * options['years'])
+
+        assets = Asset.objects.filter(is_active=True).order_by('ticker')
+        if options['tickers']:
+            assets = assets.filter(ticker__in=options['tickers'])
+
+        chunks = [
+            (asset, interval, chunk_from, chunk_till)
+            for asset in assets
+            for interval in options['intervals']
+            for gap_from, gap_till in find_missing_ranges(asset, interval, date_from, date_till)
+            for chunk_from, chunk_till in split_range(gap_from, gap_till, options['chunk_days'])
+        ]
+        self.stdout.write(f'{len(chunks)} chunks to load from {date_from} till {date_till}')
+        if not chunks:
+            return
+
+        MOEXAPIService.rate_limiter = RateLimiter(options['rate_limit'])
+        self.rows, self.done, self.failed = 0, 0, 0
+        self.started_at = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = {executor.submit(load_chunk, *chunk): chunk for chunk in chunks}
+                try:
+                    for future in as_completed(futures):
+                        self.report(futures[future], future, len(chunks))
+                except KeyboardInterrupt:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    self.stdout.write(self.style.WARNING('Interrupted, the next run will resume from unloaded chunks'))
+        finally:
+            MOEXAPIService.rate_limiter = None
+
+        elapsed = time.monotonic() - self.started_at
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {self.rows} rows in {elapsed:.0f} s ({self.rows / elapsed:.0f} rows/s), '
+            f'{self.done} chunks loaded, {self.failed} failed',
+        ))
+
+    def report(self, chunk, future, total):
+        asset, interval, chunk_from, chunk_till = chunk
+        try:
+            rows = future.result()
+        except (CircuitOpenError, *UPSTREAM_HTTP_ERRORS, *MOEXAPIService.transport_errors) as error:
+            self.failed += 1
+            self.stderr.write(f'{asset.ticker} interval={interval} {chunk_from}..{chunk_till}: {error}')
+            return
+        except Exception as error:
+            # Ошибка БД или разбора ответа в одном отрезке не прерывает загрузку остальных
+            self.failed += 1
+            self.stderr.write(
+                f'{asset.ticker} interval={interval} {chunk_from}..{chunk_till}: {type(error).__name__}: {error}',
+            )
+            return
+        self.rows += rows
+        self.done += 1
+        elapsed = time.monotonic() - self.started_at
+        self.stdout.write(
+            f'[{self.done + self.failed}/{total}] {asset.ticker} interval={interval} {chunk_from}..{chunk_till}: '
+            f'{rows} rows, total {self.rows} rows, {self.rows / elapsed:.0f} rows/s',
+        )
+
+
+def load_chunk(asset, interval, chunk_from, chunk_till) -> int:
+    """Загрузить отрезок в потоке пула и закрыть соединение потока с БД."""
+    try:
+        return sync_candles(asset, interval, chunk_from, chunk_till)
+    finally:
+        connections.close_all()
+
+
+def split_range(date_from: datetime.date, date_till: datetime.date, days: int):
+    """Разбить диапазон дней на последовательные отрезки не длиннее days дней."""
+    while date_from <= date_till:
+        chunk_till = min(date_from + datetime.timedelta(days=days - 1), date_till)
+        yield date_from, chunk_till
+        date_from = chunk_till + datetime.timedelta(days=1)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moex', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveSmallIntegerField(verbose_name='Период свечи (код MOEX ISS)')),
+                ('begin', models.DateTimeField(verbose_name='Начало свечи')),
+                ('end', models.DateTimeField(verbose_name='Окончание свечи')),
+                ('open', models.FloatField(verbose_name='Цена открытия')),
+                ('close', models.FloatField(verbose_name='Цена закрытия')),
+                ('high', models.FloatField(verbose_name='Максимальная цена')),
+                ('low', models.FloatField(verbose_name='Минимальная цена')),
+                ('value', models.FloatField(verbose_name='Объем в валюте')),
+                ('volume', models.BigIntegerField(verbose_name='Объем в штуках')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='moex.asset', verbose_name='Акция')),
+            ],
+            options={
+                'verbose_name': 'Свеча',
+                'verbose_name_plural': 'Свечи',
+                'constraints': [models.UniqueConstraint(fields=('asset', 'interval', 'begin'), name='unique_candle_asset_interval_begin')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CandleSyncedDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveSmallIntegerField(verbose_name='Период свечей (код MOEX ISS)')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candle_synced_days', to='moex.asset', verbose_name='Акция')),
+            ],
+            options={
+                'verbose_name': 'Загруженный день свечей',
+                'verbose_name_plural': 'Загруженные дни свечей',
+                'constraints': [models.UniqueConstraint(fields=('asset', 'interval', 'date'), name='unique_candle_synced_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 12:26
+
+import datetime
+
+from django.db import migrations, models
+
+# Праздники, которые раньше были заданы в коде (HOLIDAY_DAYS)
+HOLIDAYS_2025 = ['2025-05-09', '2025-06-12', '2025-11-04', '2025-12-31']
+
+
+def add_holidays(apps, schema_editor):
+    TradingCalendarDay = apps.get_model('moex', 'TradingCalendarDay')
+    TradingCalendarDay.objects.bulk_create(
+        [TradingCalendarDay(date=datetime.date.fromisoformat(day), day_type='holiday') for day in HOLIDAYS_2025],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moex', '0002_candle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradingCalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('day_type', models.CharField(choices=[('holiday', 'Торгов нет'), ('shortened', 'Сокращенная сессия'), ('working', 'Рабочий день с расписанием будней')], max_length=10, verbose_name='Тип дня')),
+                ('session_start', models.TimeField(blank=True, null=True, verbose_name='Начало сессии (для сокращенной сессии; пусто - как в будни)')),
+                ('session_end', models.TimeField(blank=True, null=True, verbose_name='Окончание сессии (для сокращенной сессии; пусто - как в будни)')),
+                ('description', models.CharField(blank=True, max_length=200, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'День торгового календаря',
+                'verbose_name_plural': 'Торговый календарь',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(add_holidays, migrations.RunPython.noop),
+    ]
@@ -27,3 +27,69 @@ class Asset(AutoDateMixin):
 
     def __str__(self):
         return f'{self.ticker} ({self.name})'
+
+
+class Candle(models.Model):
+    """Свеча MOEX ISS по акции за завершившийся торговый день. Исторические свечи не меняются."""
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='candles', verbose_name='Акция')
+    interval = models.PositiveSmallIntegerField(verbose_name='Период свечи (код MOEX ISS)')
+    begin = models.DateTimeField(verbose_name='Начало свечи')
+    end = models.DateTimeField(verbose_name='Окончание свечи')
+    open = models.FloatField(verbose_name='Цена открытия')
+    close = models.FloatField(verbose_name='Цена закрытия')
+    high = models.FloatField(verbose_name='Максимальная цена')
+    low = models.FloatField(verbose_name='Минимальная цена')
+    value = models.FloatField(verbose_name='Объем в валюте')
+    volume = models.BigIntegerField(verbose_name='Объем в штуках')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'interval', 'begin'], name='unique_candle_asset_interval_begin'),
+        ]
+        verbose_name = 'Свеча'
+        verbose_name_plural = 'Свечи'
+
+
+class CandleSyncedDay(models.Model):
+    """Завершившийся день, свечи за который уже загружены из MOEX ISS (в том числе если их нет - выходной)."""
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='candle_synced_days', verbose_name='Акция')
+    interval = models.PositiveSmallIntegerField(verbose_name='Период свечей (код MOEX ISS)')
+    date = models.DateField(verbose_name='Дата')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'interval', 'date'], name='unique_candle_synced_day'),
+        ]
+        verbose_name = 'Загруженный день свечей'
+        verbose_name_plural = 'Загруженные дни свечей'
+
+
+class TradingCalendarDay(models.Model):
+    """День, расписание торгов которого отличается от обычного (будни 06:00-23:59:59, выходные 09:00-18:59:59)."""
+    DAY_TYPES = (
+        ('holiday', 'Торгов нет'),
+        ('shortened', 'Сокращенная сессия'),
+        ('working', 'Рабочий день с расписанием будней'),
+    )
+
+    date = models.DateField(unique=True, verbose_name='Дата')
+    day_type = models.CharField(max_length=10, choices=DAY_TYPES, verbose_name='Тип дня')
+    session_start = models.TimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начало сессии (для сокращенной сессии; пусто - как в будни)',
+    )
+    session_end = models.TimeField(
+        null=True,
+        blank=True,
+        verbose_name='Окончание сессии (для сокращенной сессии; пусто - как в будни)',
+    )
+    description = models.CharField(max_length=200, blank=True, verbose_name='Описание')
+
+    class Meta:
+        ordering = ['date']
+        verbose_name = 'День торгового календаря'
+        verbose_name_plural = 'Торговый календарь'
+
+    def __str__(self):
+        return f'{self.date} ({self.get_day_type_display()})'
@@ -0,0 +1,155 @@
+import re
+
+import numpy as np
+
+from moex.candle_store import CANDLE_FIELDS, CandlePages
+from moex.trading_calendar import TradingCalendar, regular_sessions
+
+# Периоды свечей MOEX ISS в минутах, которые не нужно строить из минутных свечей
+NATIVE_INTERVALS = {1: 1, 10: 10, 60: 60}
+
+INTERVAL_PATTERN = re.compile(r'^(\d+)([mh])$')
+MINUTES_IN_DAY = 60 * 24
+
+
+def parse_resample_interval(interval: str) -> int | None:
+    """Длительность произвольной свечи в минутах: '5m' - 5 минут, '4h' - 4 часа.
+
+    :return: Число минут или None, если значение не является длительностью до суток
+    """
+    match = INTERVAL_PATTERN.match(str(interval).strip().lower())
+    if match is None:
+        return None
+    minutes = int(match[1]) * (60 if match[2] == 'h' else 1)
+    return minutes if 0 < minutes <= MINUTES_IN_DAY else None
+
+
+def get_sessions(days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Начало торговой сессии и минута после ее окончания для каждого дня (datetime64[D]) по торговому календарю.
+
+    Дни без торгов, по которым все же есть свечи, выравниваются по обычному расписанию.
+
+    :return: Пара массивов datetime64[m]
+    """
+    day_numbers = days.astype(np.int64)
+    start, end = TradingCalendar.get().sessions(day_numbers)
+    regular_start, regular_end = regular_sessions(day_numbers)
+    no_session = start > end
+    start = np.where(no_session, regular_start, start)
+    end = np.where(no_session, regular_end, end)
+    day_starts = days.astype('datetime64[m]')
+    # Окончание сессии входит в нее: свеча сессии заканчивается не позже следующей минуты
+    return day_starts + (start // 60).astype('timedelta64[m]'), day_starts + (end // 60 + 1).astype('timedelta64[m]')
+
+
+def resample_candles(candles: dict[str, np.ndarray], minutes: int) -> dict[str, np.ndarray]:
+    """Построить свечи длительностью minutes минут из минутных свечей за один проход без циклов Python.
+
+    Свечи выравниваются от начала торговой сессии каждого дня и не переходят через окончание сессии
+    (свечи после окончания сессии - через границу дня), поэтому последняя свеча сессии может быть короче.
+
+    :param candles: Столбцы минутных свечей, отсортированных по begin: begin (datetime64), open, close,
+        high, low, value, volume
+    :param minutes: Длительность свечи в минутах
+    :return: Столбцы свечей того же формата, begin и end - datetime64[s]
+    """
+    begin = candles['begin'].astype('datetime64[m]')
+    if not len(begin):
+        return {field: candles[field][:0] for field in CANDLE_FIELDS}
+
+    size = np.timedelta64(minutes, 'm')
+    days = begin.astype('datetime64[D]')
+    session_starts, session_ends = get_sessions(days)
+    # Свечи до начала сессии (аукцион открытия) относятся к первой свече сессии
+    offsets = np.maximum(begin - session_starts, np.timedelta64(0, 'm'))
+    bucket_starts = session_starts + offsets // size * size
+    day_ends = days.astype('datetime64[m]') + np.timedelta64(MINUTES_IN_DAY, 'm')
+    bucket_ends = np.minimum(bucket_starts + size, np.where(bucket_starts < session_ends, session_ends, day_ends))
+
+    first = np.flatnonzero(np.r_[True, bucket_starts[1:] != bucket_starts[:-1]])
+    last = np.r_[first[1:] - 1, len(begin) - 1]
+    return {
+        'open': candles['open'][first],
+        'close': candles['close'][last],
+        'high': np.maximum.reduceat(candles['high'], first),
+        'low': np.minimum.reduceat(candles['low'], first),
+        'value': np.add.reduceat(candles['value'], first),
+        'volume': np.add.reduceat(candles['volume'], first),
+        'begin': bucket_starts[first].astype('datetime64[s]'),
+        'end': bucket_ends[first].astype('datetime64[s]') - np.timedelta64(1, 's'),
+    }
+
+
+def candles_to_columns(candles: list[dict]) -> dict[str, np.ndarray]:
+    """Свечи в формате parse_start_structure в столбцы NumPy."""
+    return {
+        'open': np.fromiter((candle['open'] for candle in candles), dtype=np.float64, count=len(candles)),
+        'close': np.fromiter((candle['close'] for candle in candles), dtype=np.float64, count=len(candles)),
+        'high': np.fromiter((candle['high'] for candle in candles), dtype=np.float64, count=len(candles)),
+        'low': np.fromiter((candle['low'] for candle in candles), dtype=np.float64, count=len(candles)),
+        'value': np.fromiter((candle['value'] for candle in candles), dtype=np.float64, count=len(candles)),
+        'volume': np.fromiter((candle['volume'] for candle in candles), dtype=np.int64, count=len(candles)),
+        'begin': np.array([candle['begin'] for candle in candles], dtype='datetime64[s]'),
+        'end': np.array([candle['end'] for candle in candles], dtype='datetime64[s]'),
+    }
+
+
+def columns_to_candles(columns: dict[str, np.ndarray]) -> list[dict]:
+    """Столбцы NumPy в свечи формата parse_start_structure."""
+    values = {field: columns[field].tolist() for field in ('open', 'close', 'high', 'low', 'value', 'volume')}
+    for field in ('begin', 'end'):
+        values[field] = [value.replace('T', ' ') for value in np.datetime_as_string(columns[field], unit='s').tolist()]
+    return [dict(zip(CANDLE_FIELDS, row)) for row in zip(*(values[field] for field in CANDLE_FIELDS))]
+
+
+class ResampledCandlePages(CandlePages):
+    """Свечи произвольной длительности за период, построенные из минутных свечей, страницами по порядку.
+
+    Минутные свечи загружаются и обрабатываются целиком в load, поэтому при чтении страниц запросов нет.
+    """
+
+    def __init__(self, ticker: str, dt_from: str, dt_till: str, minutes: int, chunk_size: int = 500):
+        super().__init__(ticker, dt_from, dt_till, 1, chunk_size)
+        self.minutes = minutes
+
+    def load(self):
+        if self.pages is not None:
+            return
+        minute_pages = CandlePages(self.ticker, self.dt_from, self.dt_till, 1)
+        pages = [candles_to_columns(page) for page in minute_pages]
+        self.is_stale = minute_pages.is_stale
+        if not pages:
+            self.pages = []
+            return
+        minute_columns = {field: np.concatenate([page[field] for page in pages]) for field in CANDLE_FIELDS}
+        columns = resample_candles(minute_columns, self.minutes)
+        self.pages = [
+            columns_to_candles({field: values[start:start + self.chunk_size] for field, values in columns.items()})
+            for start in range(0, len(columns['begin']), self.chunk_size)
+        ]
+
+
+def get_resampled_candle_pages(ticker: str, dt_from: str, dt_till: str, minutes: int,
+                               chunk_size: int = 500) -> CandlePages:
+    """Страницы свечей произвольной длительности за период.
+
+    Свечи, совпадающие с периодами MOEX ISS (1, 10, 60 минут), берутся готовыми, см. CandlePages.
+
+    :param ticker: Код ценной бумаги, например 'SBER'
+    :param dt_from: Дата начала периода, например '2024-03-01'
+    :param dt_till: Дата окончания периода, например '2024-05-01'
+    :param minutes: Длительность свечи в минутах
+    :param chunk_size: Число свечей в странице
+    """
+    if minutes in NATIVE_INTERVALS:
+        return CandlePages(ticker, dt_from, dt_till, NATIVE_INTERVALS[minutes], chunk_size)
+    return ResampledCandlePages(ticker, dt_from, dt_till, minutes, chunk_size)
+
+
+def iter_resampled_candles(ticker: str, dt_from: str, dt_till: str, minutes: int, chunk_size: int = 500):
+    """Свечи произвольной длительности за период страницами по порядку, см. get_resampled_candle_pages.
+
+    :return: Генератор списков свечей
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    yield from get_resampled_candle_pages(ticker, dt_from, dt_till, minutes, chunk_size)
@@ -68,6 +68,11 @@ class ActionMarketdataSerializer(serializers.Serializer):
     UPDATETIME = serializers.TimeField(help_text='Время последнего обновления (формат HH:MM:SS)')
 
 
+# Столбцы блоков securities и marketdata MOEX ISS, которые попадают в ответы
+SECURITIES_FIELDS = tuple(ActionSecuritiesSerializer().fields)
+MARKETDATA_FIELDS = tuple(ActionMarketdataSerializer().fields)
+
+
 class ActionTradeStatisticsResponseSerializer(serializers.Serializer):
     """Сериализатор итоговых данных по акции, содержащих статистические данные и рыночные показатели"""
     ticker = serializers.CharField(help_text='Идентификатор ценной бумаги')
@@ -172,3 +177,52 @@ class ActionTradesResponseSerializer(serializers.Serializer):
             '- DECIMALS: Количество знаков после запятой для цены.\n'
             '- TRADINGSESSION: Сессия торгов (1 - основная сессия).\n'
         )
+
+
+class BatchCandlesParamsSerializer(serializers.Serializer):
+    """Сериализатор параметров свечей в пакетном запросе"""
+    dt_from = serializers.CharField(help_text='Дата начала периода (формат YYYY-MM-DD)')
+    dt_till = serializers.CharField(help_text='Дата окончания периода (формат YYYY-MM-DD)')
+    interval = serializers.CharField(
+        default='10',
+        help_text='Период свечей: 1, 10, 60, 24, 7, 31 или произвольная длительность до суток, например 5m, 4h',
+    )
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """Сериализатор пакетного запроса рыночных данных по нескольким акциям"""
+    tickers = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        help_text='Коды ценных бумаг',
+    )
+    kinds = serializers.ListField(
+        child=serializers.ChoiceField(choices=['orderbook', 'trades', 'candles', 'trade_statistics']),
+        allow_empty=False,
+        help_text='Виды данных: orderbook - стакан, trades - сделки, candles - свечи, '
+                  'trade_statistics - торговая статистика',
+    )
+    candles = BatchCandlesParamsSerializer(required=False, help_text='Параметры свечей, обязательны для candles')
+
+    def validate(self, attrs):
+        if 'candles' in attrs['kinds'] and 'candles' not in attrs:
+            raise serializers.ValidationError({'candles': 'Обязательное поле для вида данных candles.'})
+        return attrs
+
+
+class BatchItemResponseSerializer(serializers.Serializer):
+    """Сериализатор результата одного элемента пакетного запроса"""
+    ticker = serializers.CharField(help_text='Код ценной бумаги')
+    kind = serializers.CharField(help_text='Вид данных')
+    status = serializers.IntegerField(help_text='HTTP-статус элемента: 200 - успех, иначе ошибка')
+    stale = serializers.BooleanField(required=False, help_text='Данные взяты из устаревшего кэша')
+    data = serializers.JSONField(
+        required=False,
+        help_text='Данные в формате ответа соответствующего представления (при status 200)',
+    )
+    detail = serializers.CharField(required=False, help_text='Описание ошибки (при status, отличном от 200)')
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    """Сериализатор ответа пакетного запроса"""
+    results = BatchItemResponseSerializer(many=True, help_text='Результаты в порядке акций и видов данных запроса')
@@ -0,0 +1,97 @@
+import json
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from common_utils.single_flight import REDIS_ERRORS
+from moex.create_functions import get_market_data_cache_timeout
+
+BOARD_SNAPSHOT_KEY = 'moex:board_snapshot'
+# Версия снимка: счетчик замен и время последней замены, по ним строится ETag ответа
+BOARD_SNAPSHOT_VERSION_KEY = 'moex:board_snapshot:version'
+
+
+def save_board_snapshot(board: dict):
+    """Сохранить снимок торговой статистики режима торгов TQBR в Redis.
+
+    Снимок хранится в хеше «тикер -> JSON с securities и marketdata» и подменяется атомарно.
+    Во время торгов он живет MAX_AGE секунд (если обновление остановится, представления вернутся
+    к запросам в MOEX), вне торгов - до начала следующей сессии. Снимок, сохраненный во время торгов,
+    после окончания сессии сохраняется еще раз, см. is_board_snapshot_refresh_due.
+
+    :param board: Результат parse_securities_and_marketdata по всем акциям
+    """
+    if not board:
+        return
+    connection = get_redis_connection('default')
+    tmp_key = f'{BOARD_SNAPSHOT_KEY}:tmp'
+    pipeline = connection.pipeline(transaction=True)
+    pipeline.delete(tmp_key)
+    pipeline.hset(tmp_key, mapping={ticker: json.dumps(data) for ticker, data in board.items()})
+    pipeline.rename(tmp_key, BOARD_SNAPSHOT_KEY)
+    pipeline.hincrby(BOARD_SNAPSHOT_VERSION_KEY, 'version', 1)
+    pipeline.hset(BOARD_SNAPSHOT_VERSION_KEY, 'updated_at', time.time())
+    timeout = get_market_data_cache_timeout(settings.MOEX_BOARD_SNAPSHOT['MAX_AGE'])
+    pipeline.expire(BOARD_SNAPSHOT_KEY, timeout)
+    pipeline.expire(BOARD_SNAPSHOT_VERSION_KEY, timeout)
+    pipeline.execute()
+
+
+def is_board_snapshot_refresh_due() -> bool:
+    """Нужно ли обновить снимок вне торгов.
+
+    Снимок, сохраненный во время торгов, истекает через MAX_AGE секунд после окончания сессии, поэтому
+    его нужно сохранить еще раз: тогда он живет до начала следующей сессии. Снимок, сохраненный вне торгов,
+    уже окончательный.
+
+    :return: True, если снимка нет или он истекает не позже чем через MAX_AGE секунд
+    """
+    try:
+        ttl = get_redis_connection('default').ttl(BOARD_SNAPSHOT_KEY)
+    except REDIS_ERRORS:
+        return False
+    # -2 - снимка нет, -1 - снимок без времени жизни
+    return ttl == -2 or 0 <= ttl <= settings.MOEX_BOARD_SNAPSHOT['MAX_AGE']
+
+
+def get_board_snapshot_version() -> tuple[int, float] | None:
+    """Версия снимка торговой статистики без чтения самого снимка.
+
+    Счетчик замен начинается заново, если снимок истек, поэтому версия включает и время замены.
+
+    :return: Пара (номер версии, время замены в timestamp) или None, если снимка нет или Redis недоступен
+    """
+    try:
+        version = get_redis_connection('default').hgetall(BOARD_SNAPSHOT_VERSION_KEY)
+    except REDIS_ERRORS:
+        return None
+    if not version:
+        return None
+    return int(version[b'version']), float(version[b'updated_at'])
+
+
+def get_board_snapshot(tickers: list[str]) -> dict | None:
+    """Получить из снимка данные по указанным акциям за O(k) без обращения к MOEX.
+
+    :param tickers: Коды ценных бумаг; пустой список - все акции снимка
+    :return: Словарь «тикер -> данные» или None, если снимка нет или Redis недоступен
+    """
+    try:
+        connection = get_redis_connection('default')
+        if tickers:
+            pipeline = connection.pipeline().exists(BOARD_SNAPSHOT_KEY).hmget(BOARD_SNAPSHOT_KEY, tickers)
+            exists, values = pipeline.execute()
+            if not exists:
+                return None
+            values = dict(zip(tickers, values))
+        else:
+            values = connection.hgetall(BOARD_SNAPSHOT_KEY)
+            if not values:
+                return None
+    except REDIS_ERRORS:
+        return None
+    return {
+        ticker.decode() if isinstance(ticker, bytes) else ticker: json.loads(value)
+        for ticker, value in values.items() if value is not None
+    }
@@ -0,0 +1,82 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import shared_task
+
+from common_utils.api import iter_response_chunks
+from moex.create_functions import get_moscow_now, is_trading_time, stream_securities_and_marketdata
+from moex.live import get_watched_orderbooks, update_orderbook
+from moex.models import Asset
+from moex.serializers import MARKETDATA_FIELDS, SECURITIES_FIELDS
+from moex.snapshots import is_board_snapshot_refresh_due, save_board_snapshot
+from moex.trade_tapes import get_watched_tickers, is_trade_tape_refresh_due, update_trade_tape
+from services.moex import MOEXAPIService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def warm_up_market_data_cache():
+    """Задача для прогрева кэша рыночных данных в начале торговой сессии.
+
+    Вне торгов записи кэша живут до начала следующей сессии и истекают одновременно,
+    поэтому торговая статистика и стаканы активных акций запрашиваются заранее, до первых пользователей.
+    """
+    if not is_trading_time(get_moscow_now()):
+        return
+
+    tickers = list(Asset.objects.filter(is_active=True).values_list('ticker', flat=True))
+    requests_to_moex = [MOEXAPIService.get_trade_statictics_for_actions] + [
+        lambda ticker=ticker: MOEXAPIService.get_orderbook_for_action(ticker) for ticker in tickers
+    ]
+
+    with ThreadPoolExecutor(max_workers=MOEXAPIService.pool_size) as executor:
+        futures = [executor.submit(request_to_moex) for request_to_moex in requests_to_moex]
+    errors = sum(1 for future in futures if future.exception() is not None)
+    logger.info(f'Market data cache warmed up: {len(futures) - errors} requests, {errors} errors')
+
+
+@shared_task(ignore_result=True)
+def update_board_snapshot():
+    """Задача для обновления снимка торговой статистики по всем акциям во время торгов.
+
+    После окончания сессии снимок обновляется еще один раз и хранится до начала следующей сессии.
+    """
+    if not is_trading_time(get_moscow_now()) and not is_board_snapshot_refresh_due():
+        return
+
+    with MOEXAPIService.stream_trade_statictics_for_actions() as response:
+        response.raise_for_status()
+        board = stream_securities_and_marketdata(iter_response_chunks(response), SECURITIES_FIELDS, MARKETDATA_FIELDS)
+    save_board_snapshot(board)
+
+
+@shared_task(ignore_result=True)
+def update_trade_tapes():
+    """Задача для дописывания новых сделок в ленты отслеживаемых акций во время торгов.
+
+    На каждую акцию приходится один запрос к MOEX за период, сколько бы клиентов ни опрашивали ее сделки.
+    После окончания сессии каждая лента обновляется еще один раз и хранится до начала следующей сессии.
+    """
+    tickers = get_watched_tickers()
+    if not is_trading_time(get_moscow_now()):
+        tickers = [ticker for ticker in tickers if is_trade_tape_refresh_due(ticker)]
+    with ThreadPoolExecutor(max_workers=MOEXAPIService.pool_size) as executor:
+        futures = {ticker: executor.submit(update_trade_tape, ticker) for ticker in tickers}
+    for ticker, future in futures.items():
+        if future.exception() is not None:
+            logger.warning(f'Trade tape update failed for {ticker}: {future.exception()}')
+
+
+@shared_task(ignore_result=True)
+def update_orderbooks():
+    """Задача для публикации изменений стаканов акций, на которые подписаны клиенты потока, во время торгов."""
+    if not is_trading_time(get_moscow_now()):
+        return
+
+    tickers = get_watched_orderbooks()
+    with ThreadPoolExecutor(max_workers=MOEXAPIService.pool_size) as executor:
+        futures = {ticker: executor.submit(update_orderbook, ticker) for ticker in tickers}
+    for ticker, future in futures.items():
+        if future.exception() is not None:
+            logger.warning(f'Orderbook update failed for {ticker}: {future.exception()}')
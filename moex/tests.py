@@ -1,3 +1,424 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from common_utils.encoders import RowEncoder
+from moex.create_functions import iter_rows, parse_columns, parse_response_block, parse_start_structure
+from moex.indicators import bollinger, ema, ewm, macd, parse_indicators, rsi, sma, vwap
+from moex.models import TradingCalendarDay
+from moex.resampling import parse_resample_interval, resample_candles
+from moex.serializers import ActionCandlesResponseSerializer, ActionTradeStatisticsResponseSerializer, \
+    ActionTradesResponseSerializer
+from moex.trading_calendar import TradingCalendar
+from moex.views import ActionCandlesGetAPIView
+from services.moex import MOEXAPIService
+
+
+def make_minute_candles(begins: list[str]) -> dict[str, np.ndarray]:
+    """Минутные свечи со значениями по порядку: open = close = номер свечи, high = номер + 0.5, low = номер - 0.5."""
+    values = np.arange(len(begins), dtype=np.float64)
+    begin = np.array(begins, dtype='datetime64[s]')
+    return {
+        'open': values,
+        'close': values,
+        'high': values + 0.5,
+        'low': values - 0.5,
+        'value': values * 10,
+        'volume': np.ones(len(begins), dtype=np.int64),
+        'begin': begin,
+        'end': begin + np.timedelta64(59, 's'),
+    }
+
+
+class TradingCalendarTestCase(TestCase):
+
+    def setUp(self):
+        # Календарь процесса перечитывается из тестовой БД
+        TradingCalendar._instance = None
+        TradingCalendar._loaded_at = float('-inf')
+
+    def tearDown(self):
+        TradingCalendar._instance = None
+        TradingCalendar._loaded_at = float('-inf')
+
+
+class TradingCalendarSlotsTestCase(TradingCalendarTestCase):
+
+    def test_next_slots_follow_sessions(self):
+        calendar = TradingCalendar.get()
+        # Пятница перед праздником 2025-05-09 (из миграции): 8 мая, затем суббота с 09:00
+        slots = calendar.next_slots(datetime.datetime(2025, 5, 8, 22, 30), 4).tolist()
+        self.assertEqual(slots, [
+            datetime.datetime(2025, 5, 8, 22),
+            datetime.datetime(2025, 5, 8, 23),
+            datetime.datetime(2025, 5, 10, 9),
+            datetime.datetime(2025, 5, 10, 10),
+        ])
+
+    def test_next_slots_match_hour_by_hour_search(self):
+        calendar = TradingCalendar.get()
+        start = datetime.datetime(2025, 4, 28, 15, 20)
+        hour, expected = start.replace(minute=0), []
+        while len(expected) < 200:
+            if calendar.is_trading_time(hour):
+                expected.append(hour)
+            hour += datetime.timedelta(hours=1)
+        self.assertEqual(calendar.next_slots(start, 200).tolist(), expected)
+
+    def test_sessions_from_database(self):
+        TradingCalendarDay.objects.create(
+            date=datetime.date(2025, 3, 4),
+            day_type='shortened',
+            session_start=datetime.time(10),
+            session_end=datetime.time(14, 59, 59),
+        )
+        calendar = TradingCalendar.get()
+        self.assertEqual(
+            calendar.is_session(['2025-03-04T09:59', '2025-03-04T10:00', '2025-03-04T15:00']).tolist(),
+            [False, True, False],
+        )
+        self.assertFalse(calendar.is_trading_time(datetime.datetime(2025, 5, 9, 12)))
+        self.assertEqual(
+            calendar.next_session_start(datetime.datetime(2025, 3, 4, 15, 30)),
+            datetime.datetime(2025, 3, 5, 6),
+        )
+
+    def test_get_in_event_loop_reloads_in_thread(self):
+        async def get_in_event_loop():
+            # Запрос к БД в событийном цикле вызвал бы SynchronousOnlyOperation
+            calendar = TradingCalendar.get()
+            self.assertIsNotNone(calendar)
+            self.assertTrue(TradingCalendar.is_reload_due())
+            await TradingCalendar._reload_task
+
+        with mock.patch.object(TradingCalendar, 'reload') as reload:
+            asyncio.run(get_in_event_loop())
+        reload.assert_called_once_with()
+        self.assertFalse(TradingCalendar._lock.locked())
+
+
+class ResampleCandlesTestCase(TradingCalendarTestCase):
+
+    def test_parse_resample_interval(self):
+        self.assertEqual(parse_resample_interval('5m'), 5)
+        self.assertEqual(parse_resample_interval('4H'), 240)
+        self.assertEqual(parse_resample_interval('24h'), 60 * 24)
+        self.assertIsNone(parse_resample_interval('25h'))
+        self.assertIsNone(parse_resample_interval('0m'))
+        self.assertIsNone(parse_resample_interval('10'))
+
+    def test_buckets_are_aligned_to_working_day_session_start(self):
+        # Вторник: сессия с 06:00, свеча аукциона открытия 05:59 относится к первой свече сессии
+        columns = resample_candles(
+            make_minute_candles(['2025-03-04 05:59', '2025-03-04 06:00', '2025-03-04 06:59', '2025-03-04 07:00']),
+            60,
+        )
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 4, 6), datetime.datetime(2025, 3, 4, 7)],
+        )
+        self.assertEqual(
+            columns['end'].tolist(),
+            [datetime.datetime(2025, 3, 4, 6, 59, 59), datetime.datetime(2025, 3, 4, 7, 59, 59)],
+        )
+        self.assertEqual(columns['open'].tolist(), [0.0, 3.0])
+        self.assertEqual(columns['close'].tolist(), [2.0, 3.0])
+        self.assertEqual(columns['high'].tolist(), [2.5, 3.5])
+        self.assertEqual(columns['low'].tolist(), [-0.5, 2.5])
+        self.assertEqual(columns['value'].tolist(), [30.0, 30.0])
+        self.assertEqual(columns['volume'].tolist(), [3, 1])
+
+    def test_buckets_are_aligned_to_day_off_session_start(self):
+        # Суббота: сессия с 09:00, свечи по 90 минут начинаются в 09:00 и 10:30
+        columns = resample_candles(
+            make_minute_candles(['2025-03-01 09:00', '2025-03-01 10:29', '2025-03-01 10:30']),
+            90,
+        )
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 1, 9), datetime.datetime(2025, 3, 1, 10, 30)],
+        )
+        self.assertEqual(columns['volume'].tolist(), [2, 1])
+
+    def test_last_bucket_does_not_cross_day_boundary(self):
+        # Свечи по 5 часов от 06:00: последняя начинается в 21:00 и заканчивается в конце дня
+        columns = resample_candles(
+            make_minute_candles(['2025-03-04 23:30', '2025-03-05 06:00']),
+            300,
+        )
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 4, 21), datetime.datetime(2025, 3, 5, 6)],
+        )
+        self.assertEqual(columns['end'][0].tolist(), datetime.datetime(2025, 3, 4, 23, 59, 59))
+
+    def test_last_bucket_ends_with_day_off_session(self):
+        # Суббота: сессия 09:00-18:59:59, свеча по 4 часа от 17:00 заканчивается с сессией, а не в 20:59:59
+        columns = resample_candles(make_minute_candles(['2025-03-01 09:00', '2025-03-01 18:59']), 240)
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 1, 9), datetime.datetime(2025, 3, 1, 17)],
+        )
+        self.assertEqual(columns['end'][1].tolist(), datetime.datetime(2025, 3, 1, 18, 59, 59))
+
+    def test_last_bucket_ends_with_shortened_session(self):
+        TradingCalendarDay.objects.create(
+            date=datetime.date(2025, 3, 4),
+            day_type='shortened',
+            session_start=datetime.time(10),
+            session_end=datetime.time(14, 59, 59),
+        )
+        columns = resample_candles(make_minute_candles(['2025-03-04 10:00', '2025-03-04 14:30']), 240)
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 4, 10), datetime.datetime(2025, 3, 4, 14)],
+        )
+        self.assertEqual(
+            columns['end'].tolist(),
+            [datetime.datetime(2025, 3, 4, 13, 59, 59), datetime.datetime(2025, 3, 4, 14, 59, 59)],
+        )
+
+    def test_buckets_are_aligned_to_shortened_session_from_calendar(self):
+        TradingCalendarDay.objects.create(
+            date=datetime.date(2025, 3, 4),
+            day_type='shortened',
+            session_start=datetime.time(10),
+            session_end=datetime.time(18, 59, 59),
+        )
+        columns = resample_candles(
+            make_minute_candles(['2025-03-04 10:00', '2025-03-04 10:59', '2025-03-04 11:00']),
+            60,
+        )
+        self.assertEqual(
+            columns['begin'].tolist(),
+            [datetime.datetime(2025, 3, 4, 10), datetime.datetime(2025, 3, 4, 11)],
+        )
+
+    def test_empty_candles(self):
+        columns = resample_candles(make_minute_candles([]), 60)
+        self.assertEqual(len(columns['begin']), 0)
+
+
+class RowEncoderTestCase(SimpleTestCase):
+
+    def assert_matches_drf(self, serializer_class, rows, fields=None):
+        """Кодирование RowEncoder совпадает с JSONRenderer по данным сериализатора байт в байт,
+        с набором полей - с теми же полями ответа DRF."""
+        expected = JSONRenderer().render(serializer_class(rows, many=True).data)
+        encoded = RowEncoder.for_serializer(serializer_class, fields).encode(rows)
+        if fields is None:
+            self.assertEqual(encoded, expected)
+        else:
+            self.assertEqual(
+                json.loads(encoded),
+                [{field: row[field] for field in fields} for row in json.loads(expected)],
+            )
+
+    def test_trades(self):
+        rows = [
+            {
+                'TRADENO': 12000000001, 'TRADETIME': '10:00:01', 'BOARDID': 'TQBR', 'SECID': 'SBER', 'PRICE': 310,
+                'QUANTITY': 5, 'VALUE': 15525.5, 'PERIOD': 'N', 'TRADETIME_GRP': 1000,
+                'SYSTIME': '2025-03-04 10:00:01', 'BUYSELL': 'B', 'DECIMALS': 2, 'TRADINGSESSION': 1,
+            },
+            {
+                'TRADENO': 12000000002, 'TRADETIME': '10:00:02', 'BOARDID': 'TQBR', 'SECID': 'SBER', 'PRICE': None,
+                'QUANTITY': 1, 'VALUE': 310.1, 'PERIOD': 'N', 'TRADETIME_GRP': 1000,
+                'SYSTIME': '2025-03-04 10:00:02', 'BUYSELL': 'S', 'DECIMALS': 2, 'TRADINGSESSION': '1',
+            },
+        ]
+        self.assert_matches_drf(ActionTradesResponseSerializer, rows)
+        self.assert_matches_drf(ActionTradesResponseSerializer, rows, ('TRADENO', 'PRICE'))
+
+    def test_candles(self):
+        rows = [
+            {
+                'open': 310.5, 'close': 311, 'high': 311.9, 'low': 310.1, 'value': 125000.0, 'volume': 400,
+                'begin': '2025-03-04 10:00:00', 'end': '2025-03-04 10:09:59',
+            },
+        ]
+        self.assert_matches_drf(ActionCandlesResponseSerializer, rows)
+
+    def test_nested_serializers(self):
+        securities = {field: None for field in ActionTradeStatisticsResponseSerializer().fields['securities'].fields}
+        marketdata = {field: None for field in ActionTradeStatisticsResponseSerializer().fields['marketdata'].fields}
+        securities.update({'SECID': 'SBER', 'PREVPRICE': 310, 'LOTSIZE': 10, 'PREVDATE': '2025-03-03'})
+        marketdata.update({'SECID': 'SBER', 'LAST': 311.5})
+        rows = [{'ticker': 'SBER', 'securities': securities, 'marketdata': marketdata}]
+        self.assert_matches_drf(ActionTradeStatisticsResponseSerializer, rows)
+
+
+class ParseColumnsTestCase(SimpleTestCase):
+    raw_data = {
+        'metadata': {
+            'TRADENO': {'type': 'int64'},
+            'PRICE': {'type': 'double'},
+            'QUANTITY': {'type': 'int32'},
+            'SECID': {'type': 'string'},
+        },
+        'columns': ['TRADENO', 'SECID', 'PRICE', 'QUANTITY'],
+        'data': [[1, 'SBER', 310.5, 10], [2, 'SBER', None, 20], [3, 'SBER', 311.0, None]],
+    }
+
+    def test_projection_matches_rows(self):
+        columns = parse_columns(self.raw_data, ['PRICE', 'TRADENO', 'UNKNOWN'])
+        self.assertEqual(set(columns), {'PRICE', 'TRADENO'})
+        rows = parse_start_structure(self.raw_data, ['PRICE', 'TRADENO'])
+        self.assertEqual(columns['PRICE'], [row['PRICE'] for row in rows])
+        self.assertEqual(columns['TRADENO'], [row['TRADENO'] for row in rows])
+
+    def test_numeric_columns_as_arrays(self):
+        columns = parse_columns(self.raw_data, as_arrays=True)
+        self.assertEqual(columns['TRADENO'].dtype, np.int64)
+        # Целый столбец с пропуском и дробный столбец - float64 с NaN
+        self.assertEqual(columns['QUANTITY'].dtype, np.float64)
+        self.assertTrue(np.isnan(columns['QUANTITY'][2]))
+        self.assertTrue(np.isnan(columns['PRICE'][1]))
+        self.assertEqual(columns['SECID'], ['SBER'] * 3)
+
+    def test_response_block_matches_incremental_rows(self):
+        response = requests.Response()
+        response._content = json.dumps({'trades': self.raw_data}).encode()
+        body = response.content
+        chunks = [body[start:start + 16] for start in range(0, len(body), 16)]
+        self.assertEqual(
+            parse_response_block(response, 'trades', ['PRICE', 'TRADENO']),
+            list(iter_rows(chunks, 'trades', ['PRICE', 'TRADENO'])),
+        )
+
+
+def ewm_loop(values, alpha, initial=None):
+    """Экспоненциальное сглаживание циклом Python - эталон для ewm."""
+    result, state = [], values[0] if initial is None else initial
+    for value in values:
+        state = alpha * value + (1 - alpha) * state
+        result.append(state)
+    return np.array(result)
+
+
+class IndicatorsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.close = 300 + np.cumsum(rng.normal(0, 1, 3000))
+        self.columns = {'close': self.close}
+
+    def test_ewm_matches_loop(self):
+        # Малые alpha дают длинные блоки, большие - блоки из нескольких значений
+        for alpha in (0.001, 0.05, 0.5, 0.99):
+            np.testing.assert_allclose(ewm(self.close, alpha), ewm_loop(self.close, alpha), rtol=1e-10)
+        np.testing.assert_allclose(ewm(self.close, 0.1, 5.0), ewm_loop(self.close, 0.1, 5.0), rtol=1e-10)
+
+    def test_sma_and_ema(self):
+        result = sma(self.columns, 20)
+        self.assertTrue(np.isnan(result[:19]).all())
+        np.testing.assert_allclose(result[19:], [self.close[i - 19:i + 1].mean() for i in range(19, 3000)])
+        result = ema(self.columns, 20)
+        self.assertTrue(np.isnan(result[:19]).all())
+        np.testing.assert_allclose(result[19:], ewm_loop(self.close, 2 / 21)[19:], rtol=1e-10)
+
+    def test_rsi_bounds_and_constant_rise(self):
+        result = rsi(self.columns, 14)
+        self.assertTrue(np.isnan(result[:14]).all())
+        self.assertTrue(((result[14:] >= 0) & (result[14:] <= 100)).all())
+        self.assertTrue((rsi({'close': np.arange(50.0)}, 14)[14:] == 100).all())
+
+    def test_macd_and_bollinger(self):
+        lines = macd(self.columns, 12, 26, 9)
+        line = ewm_loop(self.close, 2 / 13) - ewm_loop(self.close, 2 / 27)
+        np.testing.assert_allclose(lines['macd'][25:], line[25:], atol=1e-9)
+        np.testing.assert_allclose(lines['histogram'][33:], (line - ewm_loop(line, 0.2))[33:], atol=1e-9)
+        bands = bollinger(self.columns, 20, 2)
+        std = np.array([self.close[i - 19:i + 1].std() for i in range(19, 3000)])
+        np.testing.assert_allclose(bands['upper'][19:] - bands['middle'][19:], 2 * std)
+
+    def test_vwap_restarts_each_day(self):
+        columns = {
+            'high': np.array([11.0, 21.0, 31.0]),
+            'low': np.array([9.0, 19.0, 29.0]),
+            'close': np.array([10.0, 20.0, 30.0]),
+            'volume': np.array([1, 3, 5]),
+            'begin': np.array(['2025-03-04T10:00', '2025-03-04T11:00', '2025-03-05T10:00'], dtype='datetime64[s]'),
+        }
+        np.testing.assert_allclose(vwap(columns), [10.0, 17.5, 30.0])
+
+    def test_parse_indicators(self):
+        self.assertEqual(
+            parse_indicators('sma:50, rsi,macd:12:26:9,bollinger:20:2.5,vwap'),
+            {
+                'sma_50': ('sma', (50,)),
+                'rsi_14': ('rsi', (14,)),
+                'macd_12_26_9': ('macd', (12, 26, 9)),
+                'bollinger_20_2.5': ('bollinger', (20, 2.5)),
+                'vwap': ('vwap', ()),
+            },
+        )
+        for invalid in ('', 'unknown', 'sma:0', 'sma:x', 'sma:1:2', 'bollinger:20:0', 'bollinger:20:nan'):
+            with self.assertRaises(ValueError, msg=invalid):
+                parse_indicators(invalid)
+
+
+class ActionCandlesViewTestCase(TestCase):
+
+    @staticmethod
+    def make_page(status_code: int, start: int = 0, count: int = 0) -> requests.Response:
+        """Страница свечей MOEX ISS с count свечами, начиная с номера start."""
+        rows = [[number, number, number, number, 1.0, 1, '2024-01-09 10:00:00', '2024-01-09 10:09:59']
+                for number in range(start, start + count)]
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps({
+            'candles': {'columns': ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end'], 'data': rows},
+        }).encode()
+        response._content_consumed = True
+        response.url = 'https://iss.moex.com/iss/candles.json'
+        return response
+
+    def get_candles(self, pages: dict[int, requests.Response]):
+        """Ответ ActionCandlesGetAPIView, страницы MOEX ISS - по номеру первой записи."""
+        request = APIRequestFactory().get('/', {'from': '2024-01-01', 'till': '2024-01-10', 'interval': '10'})
+        force_authenticate(request, user=get_user_model()(username='test'))
+        with mock.patch.object(
+            MOEXAPIService,
+            'get_candles_for_action',
+            side_effect=lambda ticker, dt_from, dt_till, interval, start=0, use_cache=True: pages[start],
+        ):
+            response = ActionCandlesGetAPIView.as_view()(request, ticker='SBER')
+            content = b''.join(response.streaming_content) if response.streaming else None
+        return response, content
+
+    def test_all_pages_are_streamed(self):
+        response, content = self.get_candles({
+            0: self.make_page(200, 0, 500),
+            500: self.make_page(200, 500, 500),
+            1000: self.make_page(200, 1000, 20),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([candle['open'] for candle in json.loads(content)], list(range(1020)))
+        self.assertIn('ETag', response)
+
+    def test_stale_page_marks_response(self):
+        stale_page = self.make_page(200, 500, 20)
+        stale_page.is_stale = True
+        response, content = self.get_candles({0: self.make_page(200, 0, 500), 500: stale_page})
+        self.assertEqual(len(json.loads(content)), 520)
+        self.assertEqual(response['Warning'], '110 - "Response is Stale"')
+        self.assertNotIn('ETag', response)
+
+    def test_error_on_later_page_is_returned_before_streaming(self):
+        response, content = self.get_candles({
+            0: self.make_page(200, 0, 500),
+            500: self.make_page(503),
+            1000: self.make_page(200, 1000, 20),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(content)
+        self.assertNotIn('ETag', response)
@@ -0,0 +1,161 @@
+import time
+
+import orjson
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+
+from common_utils.single_flight import REDIS_ERRORS
+from moex.create_functions import get_market_data_cache_timeout, get_moscow_now, parse_response_block
+from moex.live import WATCHED_TICKERS_KEY, publish_live_event
+from services.moex import MOEXAPIService
+
+TRADE_TAPE_KEY = 'moex:trade_tape:{ticker}'
+
+
+def get_tape_keys(ticker: str) -> tuple[str, str]:
+    """Ключи ленты сделок: поток Redis и хеш с описанием ленты."""
+    key = TRADE_TAPE_KEY.format(ticker=ticker)
+    return key, f'{key}:meta'
+
+
+def get_trades_delta(ticker: str, tradeno=None) -> list[dict] | None:
+    """Сделки по акции из ленты в Redis начиная с указанного номера, как в ответе MOEX ISS.
+
+    Лента - поток Redis, запись которого имеет идентификатор ``<TRADENO>-0`` и хранит значения
+    столбцов сделки списком, имена столбцов хранятся один раз в хеше ленты. Вызов отмечает акцию
+    как отслеживаемую, поэтому следующие запросы обслуживает update_trade_tapes.
+
+    :param ticker: Код ценной бумаги, например 'SBER'
+    :param tradeno: Номер сделки, с которой нужны сделки; None - с начала дня
+    :return: Не более trades_page_size сделок или None, если ленты нет, она устарела
+        или начало запрошенного диапазона уже вытеснено из ленты
+    """
+    try:
+        tradeno = int(tradeno) if tradeno is not None else None
+    except ValueError:
+        return None
+    key, meta_key = get_tape_keys(ticker)
+    try:
+        connection = get_redis_connection('default')
+        pipeline = connection.pipeline(transaction=False)
+        pipeline.zadd(WATCHED_TICKERS_KEY, {ticker: time.time()})
+        pipeline.hgetall(meta_key)
+        pipeline.xrange(key, count=1)
+        pipeline.xrange(key, min=f'{tradeno}-0' if tradeno else '-', count=MOEXAPIService.trades_page_size)
+        _, meta, first_entry, entries = pipeline.execute()
+    except REDIS_ERRORS:
+        return None
+    if not meta:
+        return None
+
+    first_tradeno = int(first_entry[0][0].split(b'-')[0]) if first_entry else None
+    is_trimmed = first_tradeno is not None and first_tradeno != int(meta[b'first_tradeno'])
+    if is_trimmed and (tradeno is None or tradeno < first_tradeno):
+        return None
+    columns = orjson.loads(meta[b'columns'])
+    return [dict(zip(columns, orjson.loads(fields[b'r']))) for _, fields in entries]
+
+
+def get_watched_tickers() -> list[str]:
+    """Акции, сделки по которым запрашивались за последние WATCH_TIMEOUT секунд."""
+    connection = get_redis_connection('default')
+    watched_since = time.time() - settings.MOEX_TRADE_TAPE['WATCH_TIMEOUT']
+    connection.zremrangebyscore(WATCHED_TICKERS_KEY, '-inf', watched_since)
+    return [ticker.decode() for ticker in connection.zrange(WATCHED_TICKERS_KEY, 0, -1)]
+
+
+def is_trade_tape_refresh_due(ticker: str) -> bool:
+    """Нужно ли обновить ленту сделок вне торгов, см. moex.snapshots.is_board_snapshot_refresh_due.
+
+    Лента, обновленная во время торгов, истекает через MAX_AGE секунд после окончания сессии,
+    поэтому ее нужно обновить еще раз: тогда она хранится до начала следующей сессии.
+    """
+    try:
+        ttl = get_redis_connection('default').ttl(get_tape_keys(ticker)[1])
+    except REDIS_ERRORS:
+        return False
+    # -2 - ленты нет, -1 - лента без времени жизни
+    return ttl == -2 or 0 <= ttl <= settings.MOEX_TRADE_TAPE['MAX_AGE']
+
+
+def update_trade_tape(ticker: str) -> int:
+    """Дописать в ленту новые сделки по акции из MOEX ISS.
+
+    Новая лента и лента прошлого торгового дня загружаются с начала дня. Сделки, дописанные
+    в существующую ленту, публикуются подписчикам потока сделок (moex.live). Одновременно ленту
+    одной акции обновляет только один процесс: блокировка продлевается после каждой страницы сделок,
+    поэтому не истекает и при долгой загрузке ленты с начала дня.
+
+    :param ticker: Код ценной бумаги, например 'SBER'
+    :return: Число добавленных сделок
+    :raises requests.HTTPError: Ошибка при запросе к MOEX API
+    """
+    connection = get_redis_connection('default')
+    key, meta_key = get_tape_keys(ticker)
+    lock = connection.lock(f'{key}:lock', timeout=settings.MOEX_TRADE_TAPE['MAX_AGE'])
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        return _update_trade_tape(connection, lock, ticker, key, meta_key)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+def _update_trade_tape(connection, lock, ticker: str, key: str, meta_key: str) -> int:
+    today = get_moscow_now().date().isoformat()
+    meta = connection.hgetall(meta_key)
+    if meta and meta[b'date'].decode() == today:
+        last_entry = connection.xrevrange(key, count=1)
+        last_tradeno = int(last_entry[0][0].split(b'-')[0]) if last_entry else None
+        first_tradeno = int(meta[b'first_tradeno'])
+    else:
+        connection.delete(key, meta_key)
+        last_tradeno = first_tradeno = None
+
+    timeout = get_market_data_cache_timeout(settings.MOEX_TRADE_TAPE['MAX_AGE'])
+    # Сделки с начала дня при создании ленты не публикуются, история доступна через представление сделок
+    is_new_tape = last_tradeno is None
+    added = 0
+    while True:
+        response = MOEXAPIService.get_trades_for_action(ticker, last_tradeno, use_cache=False)
+        response.raise_for_status()
+        trades = parse_response_block(response, 'trades')
+        # Выдача MOEX ISS начинается с сделки last_tradeno включительно
+        new_trades = [trade for trade in trades if last_tradeno is None or trade['TRADENO'] > last_tradeno]
+
+        pipeline = connection.pipeline(transaction=True)
+        for trade in new_trades:
+            pipeline.xadd(
+                key,
+                {'r': orjson.dumps(list(trade.values()))},
+                id=f'{trade["TRADENO"]}-0',
+                maxlen=settings.MOEX_TRADE_TAPE['MAX_LENGTH'],
+                approximate=True,
+            )
+        if new_trades:
+            first_tradeno = first_tradeno or new_trades[0]['TRADENO']
+            last_tradeno = new_trades[-1]['TRADENO']
+            pipeline.hset(meta_key, mapping={
+                'columns': orjson.dumps(list(new_trades[0])),
+                'date': today,
+                'first_tradeno': first_tradeno,
+            })
+            if not is_new_tape:
+                publish_live_event(pipeline, ticker, 'trades', new_trades)
+        elif first_tradeno is None:
+            # Сделок за день еще нет: пустая лента тоже актуальна
+            pipeline.hset(meta_key, mapping={'columns': b'[]', 'date': today, 'first_tradeno': 0})
+        pipeline.expire(key, timeout)
+        pipeline.expire(meta_key, timeout)
+        pipeline.execute()
+        added += len(new_trades)
+
+        if len(trades) < MOEXAPIService.trades_page_size or not new_trades:
+            return added
+        # Блокировка снова живет MAX_AGE секунд; если она уже истекла, LockNotOwnedError прерывает обновление:
+        # ленту может обновлять другой процесс
+        lock.reacquire()
@@ -0,0 +1,221 @@
+import asyncio
+import datetime
+import logging
+import threading
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from moex.models import TradingCalendarDay
+
+logger = logging.getLogger(__name__)
+
+# Обычное расписание торгов Московской Биржи, границы включительно
+MIN_START_TIME_FOR_WORKING_DAY = datetime.time(hour=6)
+MAX_END_TIME_FOR_WORKING_DAY = datetime.time(hour=23, minute=59, second=59)
+MIN_START_TIME_FOR_DAY_OFF = datetime.time(hour=9)
+MAX_END_TIME_FOR_DAY_OFF = datetime.time(hour=18, minute=59, second=59)
+
+SECONDS_IN_DAY = 60 * 60 * 24
+# Сессия дня без торгов: начало позже окончания
+NO_SESSION = (SECONDS_IN_DAY, -1)
+
+
+def time_to_seconds(value: datetime.time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+WORKING_DAY_SESSION = (time_to_seconds(MIN_START_TIME_FOR_WORKING_DAY), time_to_seconds(MAX_END_TIME_FOR_WORKING_DAY))
+DAY_OFF_SESSION = (time_to_seconds(MIN_START_TIME_FOR_DAY_OFF), time_to_seconds(MAX_END_TIME_FOR_DAY_OFF))
+
+
+def regular_sessions(days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Начало и окончание сессии по обычному расписанию в секундах от полуночи.
+
+    :param days: Номера дней от 1970-01-01 (четверг)
+    """
+    weekend = (days + 3) % 7 >= 5
+    return (
+        np.where(weekend, DAY_OFF_SESSION[0], WORKING_DAY_SESSION[0]),
+        np.where(weekend, DAY_OFF_SESSION[1], WORKING_DAY_SESSION[1]),
+    )
+
+
+def is_event_loop_thread() -> bool:
+    """Выполняется ли код в потоке запущенного событийного цикла, где запросы к БД запрещены."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class TradingCalendar:
+    """Торговый календарь: сессии по дням и отсортированный массив торговых часов.
+
+    Дни, расписание которых отличается от обычного (праздники, сокращенные сессии, перенесенные
+    рабочие дни), хранятся в TradingCalendarDay. Календарь строится один раз на процесс на YEARS_AHEAD
+    лет вперед и перечитывается из БД раз в RELOAD_INTERVAL секунд (см. TRADING_CALENDAR). Торговый
+    час - час, начало которого попадает в сессию; поиск следующих часов - двоичный поиск по массиву.
+    """
+    _instance = None
+    _loaded_at = float('-inf')
+    _lock = threading.Lock()
+    _reload_task = None
+
+    def __init__(self, first_day: datetime.date, last_day: datetime.date,
+                 sessions: dict[datetime.date, tuple[int, int]] = None):
+        """
+        :param first_day: Первый день календаря
+        :param last_day: Последний день календаря
+        :param sessions: Сессии дней, которые отличаются от обычного расписания: «день -> (начало, окончание)»
+            в секундах от полуночи, для дня без торгов - NO_SESSION
+        """
+        self.first_day = np.datetime64(first_day, 'D').astype(np.int64)
+        days = np.arange(self.first_day, np.datetime64(last_day, 'D').astype(np.int64) + 1)
+        self.session_start, self.session_end = regular_sessions(days)
+        for day, (start, end) in (sessions or {}).items():
+            index = (day - first_day).days
+            if 0 <= index < len(days):
+                self.session_start[index], self.session_end[index] = start, end
+
+        # Часы с началом внутри сессии: от округленного вверх начала до часа окончания
+        first_hours = -(-self.session_start // 3600)
+        counts = np.maximum(self.session_end // 3600 - first_hours + 1, 0)
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        hours = np.repeat(days * 24 + first_hours, counts) + np.arange(counts.sum()) - offsets
+        self.slots = hours.astype('datetime64[h]')
+
+    @classmethod
+    def get(cls) -> 'TradingCalendar':
+        """Календарь процесса, построенный по TradingCalendarDay не раньше RELOAD_INTERVAL секунд назад.
+
+        В потоке событийного цикла БД не читается: календарь перечитывается в потоке (см. aget),
+        а до тех пор используется прежний. Пока календарь ни разу не прочитан из БД, используется
+        обычное расписание.
+        """
+        if cls.is_reload_due() and cls._lock.acquire(blocking=False):
+            if is_event_loop_thread():
+                cls._reload_task = asyncio.ensure_future(cls._reload_and_release())
+            else:
+                try:
+                    cls.reload()
+                finally:
+                    cls._lock.release()
+        if cls._instance is None:
+            cls._instance = cls(*cls.get_period())
+        return cls._instance
+
+    @classmethod
+    async def aget(cls) -> 'TradingCalendar':
+        """Асинхронный вариант get(): календарь перечитывается из БД в потоке, а не в событийном цикле."""
+        if cls.is_reload_due() and cls._lock.acquire(blocking=False):
+            await cls._reload_and_release()
+        return cls.get()
+
+    @classmethod
+    async def _reload_and_release(cls):
+        try:
+            await sync_to_async(cls.reload)()
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def is_reload_due(cls) -> bool:
+        return time.monotonic() - cls._loaded_at > settings.TRADING_CALENDAR['RELOAD_INTERVAL']
+
+    @classmethod
+    def reload(cls):
+        """Перечитать календарь из БД; при ошибке БД остается прежний, и чтение повторяется при следующем get()."""
+        calendar = cls.load()
+        if calendar is not None:
+            cls._instance, cls._loaded_at = calendar, time.monotonic()
+
+    @staticmethod
+    def get_period() -> tuple[datetime.date, datetime.date]:
+        """Первый и последний дни календаря: год назад и YEARS_AHEAD лет вперед."""
+        today = datetime.date.today()
+        return (
+            today - datetime.timedelta(days=366),
+            today + datetime.timedelta(days=366 * settings.TRADING_CALENDAR['YEARS_AHEAD']),
+        )
+
+    @classmethod
+    def load(cls) -> 'TradingCalendar | None':
+        """Построить календарь по дням из БД; None - ошибка БД."""
+        first_day, last_day = cls.get_period()
+        try:
+            days = list(TradingCalendarDay.objects.all())
+        except DatabaseError:
+            logger.warning('Trading calendar is not loaded', exc_info=True)
+            return None
+
+        sessions = {}
+        for day in days:
+            if day.day_type == 'holiday':
+                sessions[day.date] = NO_SESSION
+            else:
+                sessions[day.date] = (
+                    time_to_seconds(day.session_start) if day.session_start else WORKING_DAY_SESSION[0],
+                    time_to_seconds(day.session_end) if day.session_end else WORKING_DAY_SESSION[1],
+                )
+        if sessions:
+            first_day, last_day = min(first_day, min(sessions)), max(last_day, max(sessions))
+        return cls(first_day, last_day, sessions)
+
+    def sessions(self, days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Начало и окончание сессии дней в секундах от полуночи; у дня без торгов начало позже окончания.
+
+        Дни за пределами календаря берутся по обычному расписанию.
+
+        :param days: Номера дней от 1970-01-01
+        """
+        start, end = regular_sessions(days)
+        index = days - self.first_day
+        inside = (index >= 0) & (index < len(self.session_start))
+        start[inside] = self.session_start[index[inside]]
+        end[inside] = self.session_end[index[inside]]
+        return start, end
+
+    def is_session(self, timestamps) -> np.ndarray:
+        """Идут ли торги в моменты времени (московское время без часового пояса).
+
+        Дни за пределами календаря проверяются по обычному расписанию.
+
+        :param timestamps: Массив или список datetime64/datetime
+        :return: Массив bool той же длины
+        """
+        seconds = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+        days, time_of_day = np.divmod(seconds, SECONDS_IN_DAY)
+        start, end = self.sessions(days)
+        return (time_of_day >= start) & (time_of_day <= end)
+
+    def is_trading_time(self, current_datetime: datetime.datetime) -> bool:
+        return bool(self.is_session([current_datetime])[0])
+
+    def next_slots(self, start: datetime.datetime, count: int) -> np.ndarray:
+        """Следующие торговые часы начиная с часа start включительно.
+
+        Часы дней до начала календаря строятся по обычному расписанию: дни с особым расписанием
+        всегда входят в календарь.
+
+        :return: Массив datetime64[h] из count часов
+        :raises ValueError: count часов после start выходят за последний день календаря
+        """
+        hour = np.datetime64(start, 'h')
+        slots = self.slots
+        day = hour.astype('datetime64[D]')
+        if day.astype(np.int64) < self.first_day:
+            earlier = TradingCalendar(day.item(), np.datetime64(int(self.first_day) - 1, 'D').item())
+            slots = np.concatenate([earlier.slots, slots])
+        index = int(np.searchsorted(slots, hour))
+        if index + count > len(slots):
+            raise ValueError(f'{count} торговых часов с {start} за пределами торгового календаря')
+        return slots[index:index + count]
+
+    def next_session_start(self, current_datetime: datetime.datetime) -> datetime.datetime:
+        """Начало текущего торгового часа или следующего, если торгов сейчас нет."""
+        return self.next_slots(current_datetime, 1)[0].item()
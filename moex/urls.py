@@ -1,14 +1,43 @@
 
+from django.conf import settings
 from django.urls import path
 
-from machine_learning.views import MLPredictTickerAPIView
+from machine_learning.views import AsyncMLPredictTickerAPIView, MLPredictTickerAPIView
 from .views import ActionTradeStatisticsGetAPIView, ActionCandlesGetAPIView, ActionOrderBookGetAPIView, \
-    ActionTradesGetAPIView
+    ActionTradesGetAPIView, AsyncActionTradeStatisticsGetAPIView, AsyncActionCandlesGetAPIView, \
+    AsyncActionOrderBookGetAPIView, AsyncActionTradesGetAPIView, AsyncActionLiveStreamAPIView, \
+    AsyncMarketDataBatchAPIView, MarketDataBatchAPIView, ServiceStatsGetAPIView, ActionIndicatorsGetAPIView, \
+    AsyncActionIndicatorsGetAPIView
+
+# Под uvicorn (ASGI) используются асинхронные представления, под gunicorn (WSGI) - синхронные
+if settings.ASYNC_VIEWS:
+    trade_statistics_view = AsyncActionTradeStatisticsGetAPIView
+    candles_view = AsyncActionCandlesGetAPIView
+    indicators_view = AsyncActionIndicatorsGetAPIView
+    orderbook_view = AsyncActionOrderBookGetAPIView
+    trades_view = AsyncActionTradesGetAPIView
+    batch_view = AsyncMarketDataBatchAPIView
+    predict_view = AsyncMLPredictTickerAPIView
+else:
+    trade_statistics_view = ActionTradeStatisticsGetAPIView
+    candles_view = ActionCandlesGetAPIView
+    indicators_view = ActionIndicatorsGetAPIView
+    orderbook_view = ActionOrderBookGetAPIView
+    trades_view = ActionTradesGetAPIView
+    batch_view = MarketDataBatchAPIView
+    predict_view = MLPredictTickerAPIView
 
 urlpatterns = [
-    path('trade_statistics/', ActionTradeStatisticsGetAPIView.as_view(), name='trade_statistics'),
-    path('<str:ticker>/candles/', ActionCandlesGetAPIView.as_view(), name='candles'),
-    path('<str:ticker>/orderbook/', ActionOrderBookGetAPIView.as_view(), name='orderbook'),
-    path('<str:ticker>/trades/', ActionTradesGetAPIView.as_view(), name='trades'),
-    path('predict/<str:ticker>/', MLPredictTickerAPIView.as_view(), name='predict'),
-]
\ No newline at end of file
+    path('trade_statistics/', trade_statistics_view.as_view(), name='trade_statistics'),
+    path('batch/', batch_view.as_view(), name='batch'),
+    path('<str:ticker>/candles/', candles_view.as_view(), name='candles'),
+    path('<str:ticker>/indicators/', indicators_view.as_view(), name='indicators'),
+    path('<str:ticker>/orderbook/', orderbook_view.as_view(), name='orderbook'),
+    path('<str:ticker>/trades/', trades_view.as_view(), name='trades'),
+    path('predict/<str:ticker>/', predict_view.as_view(), name='predict'),
+    path('service_stats/', ServiceStatsGetAPIView.as_view(), name='service_stats'),
+]
+
+# Поток стаканов и сделок держит соединения открытыми и работает только под uvicorn (ASGI)
+if settings.ASYNC_VIEWS:
+    urlpatterns.append(path('stream/', AsyncActionLiveStreamAPIView.as_view(), name='stream'))
@@ -1,17 +1,39 @@
 import datetime
 
+import orjson
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter, OpenApiResponse
-from requests import HTTPError
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from moex.create_functions import parse_securities_and_marketdata, parse_start_structure
+from common_utils.api import UPSTREAM_HTTP_ERRORS
+from common_utils.cache import TieredCache
+from common_utils.circuit_breaker import CircuitBreaker
+from common_utils.db import run_in_thread
+from common_utils.micro_batcher import MicroBatcher
+from common_utils.renderers import ROW_FORMAT_RENDERERS, ROW_FORMATS_DESCRIPTION
+from common_utils.views import RowEncodingMixin, add_stale_headers, add_validator_headers, extend_schema_from, \
+    fields_parameter, get_not_modified_response, get_upstream_validators, make_etag
+from moex.batch import fetch_batch
+from moex.candle_store import CandlePages, get_candles_final_since
+from moex.indicators import MAX_INDICATORS, get_indicators, parse_indicators
+from moex.resampling import get_resampled_candle_pages, parse_resample_interval
+from moex.create_functions import MOEX_TIMEZONE, parse_response_block, parse_securities_and_marketdata
 from services.ml_fastapi import MLAPIService
-from services.moex import MOEXAPIService
-from moex.serializers import ActionTradeStatisticsResponseSerializer, ActionCandlesResponseSerializer, \
-    ActionOrderBookResponseSerializer, ActionTradesResponseSerializer
+from services.moex import CANDLES_INTERVAL_MINUTES, AsyncMOEXAPIService, MOEXAPIService
+from moex.live import LIVE_STREAMS, iter_live_events
+from moex.snapshots import get_board_snapshot, get_board_snapshot_version
+from moex.trade_tapes import get_trades_delta
+from moex.trading_calendar import TradingCalendar
+from moex.serializers import MARKETDATA_FIELDS, SECURITIES_FIELDS, ActionTradeStatisticsResponseSerializer, \
+    ActionCandlesResponseSerializer, ActionOrderBookResponseSerializer, ActionTradesResponseSerializer, \
+    BatchRequestSerializer, BatchResponseSerializer
 
 
 # Create your views here.
@@ -76,14 +98,52 @@ class ActionTradeStatisticsGetAPIView(APIView):
         tickers = tickers_string.split(',') if tickers_string else []
         ticker = tickers[0] if len(tickers) == 1 else ''
 
+        snapshot_response = self.build_snapshot_response(tickers)
+        if snapshot_response is not None:
+            return snapshot_response
+
         response = MOEXAPIService.get_trade_statictics_for_actions(ticker)
+        return self.build_response(response, tickers)
+
+    def build_response(self, response, tickers):
         try:
             response.raise_for_status()
-        except HTTPError:
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
 
-        result_data = parse_securities_and_marketdata(response.json())
+        etag, last_modified = get_upstream_validators(self.request, response)
+        not_modified = get_not_modified_response(self.request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response_to_client = self.build_board_response(
+            parse_securities_and_marketdata(orjson.loads(response.content), SECURITIES_FIELDS, MARKETDATA_FIELDS),
+            tickers,
+        )
+        add_validator_headers(response_to_client, etag, last_modified)
+        return add_stale_headers(response_to_client, getattr(response, 'is_stale', False))
+
+    def build_snapshot_response(self, tickers):
+        """Ответ по снимку торговой статистики или None, если снимка нет.
+
+        ETag строится по версии снимка, поэтому для 304 сам снимок не читается. Если снимок заменят
+        между чтением версии и снимка, клиент получит новые данные со старым ETag и загрузит их повторно.
+        """
+        snapshot_version = get_board_snapshot_version()
+        if snapshot_version is None:
+            return None
+        etag = make_etag(self.request, *snapshot_version)
+        last_modified = snapshot_version[1]
+        not_modified = get_not_modified_response(self.request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
 
+        board = get_board_snapshot(tickers)
+        if board is None:
+            return None
+        return add_validator_headers(self.build_board_response(board, tickers), etag, last_modified)
+
+    def build_board_response(self, result_data, tickers):
         if len(tickers) > 1:
             result_data = [{'ticker': key, **result_data[key]} for key in sorted(tickers) if key in result_data]
         else:
@@ -91,10 +151,12 @@ class ActionTradeStatisticsGetAPIView(APIView):
         return Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data)
 
 
-class ActionCandlesGetAPIView(APIView):
+class ActionCandlesGetAPIView(RowEncodingMixin, APIView):
 
     permission_classes = [IsAuthenticated]
     serializer_class = ActionCandlesResponseSerializer
+    fast_encoding = True
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *ROW_FORMAT_RENDERERS]
 
     @extend_schema(
         tags=['Real-time market data - Акции'],
@@ -128,8 +190,10 @@ class ActionCandlesGetAPIView(APIView):
         },
         summary='Получить свечи по одной указанной акции за определенный период',
         description=(
-            f'Возвращает свечи по одной указанной акции за определенный период (первые 500 записей), '
-            f'включая:\n\n{serializer_class.Meta.description}'
+            f'Возвращает все свечи по одной указанной акции за определенный период. Свечи за завершившиеся дни '
+            f'читаются из локального хранилища, недостающие дни и текущий день загружаются из MOEX ISS '
+            f'параллельно страницами по 500 записей. Ответ отдается потоком по мере получения страниц. '
+            f'{ROW_FORMATS_DESCRIPTION} Включает:\n\n{serializer_class.Meta.description}'
         ),
         parameters=[
             OpenApiParameter(
@@ -176,15 +240,19 @@ class ActionCandlesGetAPIView(APIView):
                 location=OpenApiParameter.QUERY,
                 description=(
                     'Период свечей:\n\n- 1 - 1 мин;\n- 10 - 10 мин;\n - 60 - 1 час;\n - 24 - 1 день;\n'
-                    ' - 7 - 1 неделя;\n - 31 - 1 месяц.'
+                    ' - 7 - 1 неделя;\n - 31 - 1 месяц;\n'
+                    ' - произвольная длительность до суток в минутах или часах, например 5m, 15m, 4h - свечи '
+                    'строятся из минутных свечей от начала торговой сессии.'
                 ),
                 type=str,
                 required=True,
                 default=10,
             ),
+            fields_parameter(serializer_class, 'begin,close,volume'),
         ],
     )
     def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
         dt_from = request.query_params.get('from')
         dt_till = request.query_params.get('till')
         interval = request.query_params.get('interval')
@@ -194,22 +262,83 @@ class ActionCandlesGetAPIView(APIView):
                 data={'detail': 'Не был представлен один или несколько параметров запроса'},
             )
 
-        response = MOEXAPIService.get_candles_for_action(ticker, dt_from, dt_till, interval)
-
+        pages = self.get_pages(ticker, dt_from, dt_till, interval)
+        if pages is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Неверный период свечей'})
+        etag, final_since = self.get_validators(request, dt_till, interval)
+        not_modified = get_not_modified_response(request, etag, final_since) if etag else None
+        if not_modified is not None:
+            return not_modified
         try:
-            response.raise_for_status()
-        except HTTPError:
+            pages.load()
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
+        page_format = self.get_page_format(fields)
+        return self.build_response(self.stream_pages(pages, page_format), page_format, pages, etag, final_since)
 
-        result_data = parse_start_structure(response.json()['candles'])
+    @staticmethod
+    def build_response(streaming_content, page_format, pages, etag, final_since):
+        """Потоковый ответ по загруженным страницам свечей с валидаторами и пометкой устаревших данных.
 
-        return Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data)
+        Валидаторы добавляются только к полному ответу: все страницы MOEX ISS уже получены без ошибок
+        и не взяты из устаревшего кеша, иначе клиент сохранил бы неполные свечи под окончательным ETag.
+        """
+        response = StreamingHttpResponse(streaming_content, content_type=page_format.content_type)
+        if etag and not pages.is_stale:
+            add_validator_headers(response, etag, final_since)
+        return add_stale_headers(response, pages.is_stale)
 
+    @staticmethod
+    def get_validators(request, dt_till, interval) -> tuple[str | None, float | None]:
+        """ETag и Last-Modified ответа по окончательным свечам, для периода с текущим днем - (None, None).
 
-class ActionOrderBookGetAPIView(APIView):
+        Окончательные свечи за период не меняются, поэтому ответ определяется самим запросом
+        и 304 отдается без обращения к хранилищу и MOEX ISS. Ответ с текущим днем отдается потоком,
+        и хеш его содержимого до отправки неизвестен. К ответу валидаторы добавляются после загрузки
+        всех страниц, см. build_response.
+        """
+        final_since = get_candles_final_since(dt_till, interval)
+        if final_since is None:
+            return None, None
+        return make_etag(request), final_since.timestamp()
+
+    @staticmethod
+    def get_pages(ticker, dt_from, dt_till, interval) -> CandlePages | None:
+        """Страницы свечей для периода MOEX ISS или произвольной длительности, None - неверный период.
+
+        Свечи загружаются при вызове load или при первом чтении страниц.
+        """
+        if interval.isdigit() and int(interval) in CANDLES_INTERVAL_MINUTES:
+            return CandlePages(ticker, dt_from, dt_till, interval)
+        minutes = parse_resample_interval(interval)
+        if minutes is None:
+            return None
+        return get_resampled_candle_pages(ticker, dt_from, dt_till, minutes)
+
+    @staticmethod
+    def stream_pages(pages, page_format):
+        """Отдать загруженные страницы свечей (см. CandlePages.load) одним телом ответа в формате page_format,
+        не собирая его целиком в памяти."""
+        yield page_format.start()
+        for page in pages:
+            if page:
+                yield page_format.page(page)
+        yield page_format.end()
+
+    @staticmethod
+    async def astream_pages(pages, page_format):
+        yield page_format.start()
+        async for page in pages:
+            if page:
+                yield page_format.page(page)
+        yield page_format.end()
+
+
+class ActionOrderBookGetAPIView(RowEncodingMixin, APIView):
 
     permission_classes = [IsAuthenticated]
     serializer_class = ActionOrderBookResponseSerializer
+    fast_encoding = True
 
     @extend_schema(
         tags=['Real-time market data - Акции'],
@@ -260,24 +389,39 @@ class ActionOrderBookGetAPIView(APIView):
                 type=str,
                 required=True,
             ),
+            fields_parameter(serializer_class, 'BUYSELL,PRICE,QUANTITY'),
         ],
     )
     def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
         response = MOEXAPIService.get_orderbook_for_action(ticker)
+        return self.build_response(response, fields)
+
+    def build_response(self, response, fields=None):
         try:
             response.raise_for_status()
-        except HTTPError:
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
 
-        result_data = parse_start_structure(response.json()['orderbook'])
+        etag, last_modified = get_upstream_validators(self.request, response)
+        not_modified = get_not_modified_response(self.request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
 
-        return Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data)
+        result_data = parse_response_block(response, 'orderbook', self.get_serializer_sources(fields))
+
+        return add_stale_headers(
+            add_validator_headers(self.rows_response(result_data, fields), etag, last_modified),
+            getattr(response, 'is_stale', False),
+        )
 
 
-class ActionTradesGetAPIView(APIView):
+class ActionTradesGetAPIView(RowEncodingMixin, APIView):
 
     permission_classes = [IsAuthenticated]
     serializer_class = ActionTradesResponseSerializer
+    fast_encoding = True
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *ROW_FORMAT_RENDERERS]
 
     @extend_schema(
         tags=['Real-time market data - Акции'],
@@ -311,8 +455,10 @@ class ActionTradesGetAPIView(APIView):
         },
         summary='Получить все сделки по одной указанной акции за текущий торговый день',
         description=(
-            f'Возвращает все сделки по одной указанной акции за текущий торговый день, '
-            f'включая:\n\n{serializer_class.Meta.description}'
+            f'Возвращает сделки по одной указанной акции за текущий торговый день, не более 5000 за запрос. '
+            f'Сделки отслеживаемых акций отдаются из ленты в Redis, которую фоновая задача дополняет '
+            f'новыми сделками из MOEX ISS, поэтому опрос новых сделок по tradeno не обращается к MOEX. '
+            f'{ROW_FORMATS_DESCRIPTION} Включает:\n\n{serializer_class.Meta.description}'
         ),
         parameters=[
             OpenApiParameter(
@@ -340,16 +486,572 @@ class ActionTradesGetAPIView(APIView):
                 ],
                 type=int,
             ),
+            fields_parameter(serializer_class, 'TRADENO,TRADETIME,PRICE,QUANTITY,BUYSELL'),
         ],
     )
     def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
         tradeno = request.query_params.get('tradeno')
+        trades = get_trades_delta(ticker, tradeno)
+        if trades is not None:
+            return self.build_tape_response(trades, fields)
+
         response = MOEXAPIService.get_trades_for_action(ticker, tradeno)
+        return self.build_response(response, fields)
+
+    def build_response(self, response, fields=None):
         try:
             response.raise_for_status()
-        except HTTPError:
+        except UPSTREAM_HTTP_ERRORS:
             return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
 
-        result_data = parse_start_structure(response.json()['trades'])
+        etag, last_modified = get_upstream_validators(self.request, response)
+        not_modified = get_not_modified_response(self.request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
 
-        return Response(status=status.HTTP_200_OK, data=self.serializer_class(result_data, many=True).data)
+        result_data = parse_response_block(response, 'trades', self.get_serializer_sources(fields))
+
+        return add_stale_headers(
+            add_validator_headers(self.rows_response(result_data, fields), etag, last_modified),
+            getattr(response, 'is_stale', False),
+        )
+
+    def build_tape_response(self, trades, fields=None):
+        """Ответ по сделкам из ленты (moex.trade_tapes).
+
+        Лента только дописывается, поэтому номер последней сделки и число сделок однозначно
+        определяют ответ на запрос. Last-Modified - время последней сделки.
+        """
+        last_trade = trades[-1] if trades else {}
+        etag = make_etag(self.request, last_trade.get('TRADENO'), len(trades))
+        last_modified = None
+        if last_trade.get('SYSTIME'):
+            last_modified = datetime.datetime.strptime(
+                last_trade['SYSTIME'], '%Y-%m-%d %H:%M:%S',
+            ).replace(tzinfo=MOEX_TIMEZONE).timestamp()
+        not_modified = get_not_modified_response(self.request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return add_validator_headers(self.rows_response(trades, fields), etag, last_modified)
+
+
+class ActionIndicatorsGetAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Real-time market data - Акции'],
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(
+                description='Значения индикаторов по свечам',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'begin': {'type': 'array', 'items': {'type': 'string'}},
+                    },
+                    'additionalProperties': {
+                        'oneOf': [
+                            {'type': 'array', 'items': {'type': 'number', 'nullable': True}},
+                            {
+                                'type': 'object',
+                                'additionalProperties': {
+                                    'type': 'array', 'items': {'type': 'number', 'nullable': True},
+                                },
+                            },
+                        ],
+                    },
+                },
+                examples=[
+                    OpenApiExample(
+                        'SMA 2 и MACD',
+                        value={
+                            'begin': ['2025-01-03 10:00:00', '2025-01-03 11:00:00', '2025-01-03 12:00:00'],
+                            'sma_2': [None, 272.615, 272.87],
+                            'macd_12_26_9': {
+                                'macd': [None, None, None],
+                                'signal': [None, None, None],
+                                'histogram': [None, None, None],
+                            },
+                        },
+                    ),
+                ],
+            ),
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(
+                description='Неверные параметры запроса или ошибка при запросе к MOEX API',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Неверные индикаторы: неизвестный индикатор atr'
+                        },
+                    },
+                },
+            ),
+            status.HTTP_401_UNAUTHORIZED: OpenApiResponse(
+                description='Учетные данные не предоставлены',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Authentication credentials were not provided.'
+                        },
+                    },
+                },
+            ),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: {},
+        },
+        summary='Получить технические индикаторы по свечам одной акции за определенный период',
+        description=(
+            'Рассчитывает технические индикаторы по свечам одной акции за период и возвращает только их '
+            'значения без самих свечей: SMA, EMA, RSI (сглаживание Уайлдера), MACD, полосы Боллинджера '
+            'и VWAP с начала торгового дня. Индикаторы считаются по ценам закрытия свечей, кроме VWAP, '
+            'который использует типичную цену и объем. Значения периода разгона индикатора - null. '
+            'Результат кэшируется по акции, периоду, интервалу и параметрам индикаторов.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='ticker',
+                location=OpenApiParameter.PATH,
+                description='Код ценной бумаги',
+                examples=[
+                    OpenApiExample(
+                        'Акция Сбербанка',
+                        value='SBER',
+                    ),
+                ],
+                type=str,
+                required=True,
+            ),
+            OpenApiParameter(
+                name='from',
+                location=OpenApiParameter.QUERY,
+                description='Дата начала периода (формат YY-MM-DD)',
+                type=str,
+                required=True,
+            ),
+            OpenApiParameter(
+                name='till',
+                location=OpenApiParameter.QUERY,
+                description='Дата окончания периода (формат YY-MM-DD)',
+                type=str,
+                required=True,
+            ),
+            OpenApiParameter(
+                name='interval',
+                location=OpenApiParameter.QUERY,
+                description='Период свечей, как у списка свечей: 1, 10, 60, 24, 7, 31 или произвольный (5m, 4h)',
+                type=str,
+                required=True,
+                default=10,
+            ),
+            OpenApiParameter(
+                name='indicators',
+                location=OpenApiParameter.QUERY,
+                description=(
+                    f'Индикаторы через запятую, параметры через двоеточие (не более {MAX_INDICATORS}):\n\n'
+                    '- sma:период (20);\n- ema:период (20);\n- rsi:период (14);\n'
+                    '- macd:быстрый:медленный:сигнальный (12:26:9);\n- bollinger:период:ширина (20:2);\n- vwap.\n\n'
+                    'Ключ индикатора в ответе - его имя и параметры через подчеркивание, например macd_12_26_9.'
+                ),
+                examples=[
+                    OpenApiExample(
+                        'Скользящие средние, RSI, MACD, полосы Боллинджера и VWAP',
+                        value='sma:20,ema:50,rsi,macd:12:26:9,bollinger:20:2,vwap',
+                    ),
+                ],
+                type=str,
+                required=True,
+            ),
+        ],
+    )
+    def get(self, request, ticker, *args, **kwargs):
+        params = self.get_params(request, ticker)
+        if isinstance(params, Response):
+            return params
+        etag, final_since = ActionCandlesGetAPIView.get_validators(request, params[2], params[3])
+        not_modified = get_not_modified_response(request, etag, final_since) if etag else None
+        if not_modified is not None:
+            return not_modified
+        try:
+            body = get_indicators(*params)
+        except UPSTREAM_HTTP_ERRORS:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
+        return self.build_response(request, body, etag, final_since, params[-1].is_stale)
+
+    @staticmethod
+    def get_params(request, ticker):
+        """Аргументы get_indicators (страницы свечей создаются, но не читаются) или ответ 400."""
+        dt_from = request.query_params.get('from')
+        dt_till = request.query_params.get('till')
+        interval = request.query_params.get('interval')
+        indicators_string = request.query_params.get('indicators')
+        if not dt_from or not dt_till or not interval or not indicators_string:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'detail': 'Не был представлен один или несколько параметров запроса'},
+            )
+        try:
+            indicators = parse_indicators(indicators_string)
+        except ValueError as error:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': f'Неверные индикаторы: {error}'})
+        pages = ActionCandlesGetAPIView.get_pages(ticker, dt_from, dt_till, interval)
+        if pages is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Неверный период свечей'})
+        return ticker, dt_from, dt_till, interval, indicators, pages
+
+    @staticmethod
+    def build_response(request, body, etag, final_since, is_stale=False):
+        """Ответ с телом индикаторов; для периода с текущим днем ETag считается по телу."""
+        if etag is None:
+            etag = make_etag(request, body)
+            not_modified = get_not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+        return add_stale_headers(
+            add_validator_headers(HttpResponse(body, content_type='application/json'), etag, final_since),
+            is_stale,
+        )
+
+
+class MarketDataBatchAPIView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = BatchResponseSerializer
+
+    @extend_schema(
+        tags=['Real-time market data - Акции'],
+        request=BatchRequestSerializer,
+        responses={
+            status.HTTP_200_OK: serializer_class,
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(
+                description='Неверные параметры запроса',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Не более 100 элементов в пакете'
+                        },
+                    },
+                },
+            ),
+            status.HTTP_401_UNAUTHORIZED: OpenApiResponse(
+                description='Учетные данные не предоставлены',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Authentication credentials were not provided.'
+                        },
+                    },
+                },
+            ),
+            status.HTTP_500_INTERNAL_SERVER_ERROR: {},
+        },
+        summary='Получить рыночные данные по нескольким акциям одним запросом',
+        description=(
+            'Возвращает стаканы, сделки, свечи и торговую статистику по нескольким акциям одним ответом '
+            'вместо отдельного запроса на каждую акцию и вид данных. Элементы пакета (акция, вид данных) '
+            'загружаются параллельно в ограниченном пуле. Ошибка одного элемента не прерывает пакет: '
+            'элемент возвращается со своим статусом и описанием ошибки.'
+        ),
+        examples=[
+            OpenApiExample(
+                'Стаканы и свечи Сбербанка и Газпрома',
+                value={
+                    'tickers': ['SBER', 'GAZP'],
+                    'kinds': ['orderbook', 'candles'],
+                    'candles': {'dt_from': '2025-01-01', 'dt_till': '2025-03-01', 'interval': '60'},
+                },
+                request_only=True,
+            ),
+        ],
+    )
+    def post(self, request, *args, **kwargs):
+        batch = self.get_batch(request)
+        if isinstance(batch, Response):
+            return batch
+        return HttpResponse(fetch_batch(*batch), content_type='application/json')
+
+    @staticmethod
+    def get_batch(request):
+        """Акции, виды данных и параметры свечей запроса или ответ 400."""
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tickers = list(dict.fromkeys(serializer.validated_data['tickers']))
+        kinds = list(dict.fromkeys(serializer.validated_data['kinds']))
+        if len(tickers) * len(kinds) > settings.MOEX_BATCH['MAX_ITEMS']:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'detail': f'Не более {settings.MOEX_BATCH["MAX_ITEMS"]} элементов в пакете'},
+            )
+        return tickers, kinds, serializer.validated_data.get('candles', {})
+
+
+class AsyncActionLiveStreamAPIView(AsyncAPIView):
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=['Real-time market data - Акции'],
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(
+                description=(
+                    'Поток Server-Sent Events (text/event-stream). События:\n\n'
+                    '- snapshot: текущий стакан акции при подключении, '
+                    '`{"ticker": "SBER", "data": [уровни стакана]}`;\n'
+                    '- orderbook: изменившиеся уровни стакана, исчезнувший уровень имеет QUANTITY = 0;\n'
+                    '- trades: новые сделки в формате ответа сделок;\n'
+                    '- overflow: клиент не успевает читать события, поток закрывается, нужно переподключиться.\n\n'
+                    'Каждые 15 секунд без событий отправляется комментарий keep-alive.'
+                ),
+            ),
+            status.HTTP_400_BAD_REQUEST: OpenApiResponse(
+                description='Неверные параметры запроса',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Не были представлены акции'
+                        },
+                    },
+                },
+            ),
+            status.HTTP_401_UNAUTHORIZED: OpenApiResponse(
+                description='Учетные данные не предоставлены',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'detail': {
+                            'type': 'string',
+                            'example': 'Authentication credentials were not provided.'
+                        },
+                    },
+                },
+            ),
+        },
+        summary='Подписаться на изменения стаканов и новые сделки по акциям',
+        description=(
+            'Держит соединение и отправляет изменения стаканов котировок и новые сделки по указанным акциям '
+            'вместо частого опроса представлений стакана и сделок. Стаканы и сделки опрашиваются в MOEX ISS '
+            'одной фоновой задачей на акцию и раздаются подписчикам через Redis pub/sub. '
+            'Доступно только при запуске через uvicorn (ASGI).'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='tickers',
+                location=OpenApiParameter.QUERY,
+                description='Акции в формате перечисления идентификаторов ценных бумаг через запятую',
+                examples=[
+                    OpenApiExample(
+                        'Акции Сбербанка и Газпрома',
+                        value='SBER,GAZP',
+                    ),
+                ],
+                type=str,
+                required=True,
+            ),
+            OpenApiParameter(
+                name='streams',
+                location=OpenApiParameter.QUERY,
+                description='Потоки через запятую: orderbook - стаканы, trades - сделки. По умолчанию оба',
+                examples=[
+                    OpenApiExample(
+                        'Только сделки',
+                        value='trades',
+                    ),
+                ],
+                type=str,
+            ),
+        ],
+    )
+    async def get(self, request, *args, **kwargs):
+        tickers_string = request.query_params.get('tickers')
+        tickers = sorted({ticker.strip() for ticker in tickers_string.split(',') if ticker.strip()}) \
+            if tickers_string else []
+        streams_string = request.query_params.get('streams')
+        streams = [stream for stream in LIVE_STREAMS if stream in streams_string.split(',')] \
+            if streams_string else list(LIVE_STREAMS)
+        if not tickers or not streams:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'detail': 'Не были представлены акции или потоки'},
+            )
+        if len(tickers) > settings.MOEX_LIVE['MAX_TICKERS']:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'detail': f'Можно подписаться не более чем на {settings.MOEX_LIVE["MAX_TICKERS"]} акций'},
+            )
+
+        response = StreamingHttpResponse(iter_live_events(tickers, streams), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Отключает буферизацию ответа в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ServiceStatsGetAPIView(APIView):
+
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=['Служебное'],
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(
+                description='Счетчики кэшей ответов и выключателей запросов внешних сервисов',
+                response={
+                    'type': 'object',
+                    'properties': {
+                        'cache': {
+                            'type': 'object',
+                            'example': {
+                                'moex': {
+                                    'l1_hits': 120, 'l2_hits': 30, 'misses': 10, 'sets': 10, 'stale_hits': 0,
+                                    'hit_ratio': 0.9375, 'l1_size': 10,
+                                },
+                            },
+                        },
+                        'circuit_breakers': {
+                            'type': 'object',
+                            'example': {
+                                'moex': {
+                                    'state': 'closed', 'window_failures': 1, 'rejected': 0, 'failures': 3, 'trips': 0,
+                                },
+                            },
+                        },
+                        'micro_batchers': {
+                            'type': 'object',
+                            'example': {
+                                'ml_predict': {
+                                    'max_size': 32, 'max_wait': 0.005, 'batches': 40, 'items': 130,
+                                    'full_batches': 1, 'average_size': 3.25,
+                                },
+                            },
+                        },
+                    },
+                },
+            ),
+        },
+        summary='Получить счетчики кэшей и выключателей запросов внешних сервисов',
+        description=(
+            'Возвращает счетчики попаданий и промахов L1/L2 кэшей ответов внешних сервисов в текущем воркере, '
+            'а также общее для всех воркеров состояние выключателей запросов (closed, open, half_open) '
+            'со счетчиками ошибок, отклоненных запросов и срабатываний в текущем воркере, и размеры пакетов '
+            'объединенных запросов предсказаний в текущем воркере.'
+        ),
+    )
+    def get(self, request, *args, **kwargs):
+        data = {
+            'cache': {namespace: cache.stats() for namespace, cache in TieredCache.instances.items()},
+            'circuit_breakers': {name: breaker.stats() for name, breaker in CircuitBreaker.instances.items()},
+            'micro_batchers': {name: batcher.stats() for name, batcher in MicroBatcher.instances.items()},
+        }
+        return Response(status=status.HTTP_200_OK, data=data)
+
+
+class AsyncMarketDataBatchAPIView(AsyncAPIView, MarketDataBatchAPIView):
+
+    @extend_schema_from(MarketDataBatchAPIView.post)
+    async def post(self, request, *args, **kwargs):
+        batch = self.get_batch(request)
+        if isinstance(batch, Response):
+            return batch
+        # Пул потоков пакета ограничен MOEX_BATCH['MAX_WORKERS'], событийный цикл не блокируется
+        content = await sync_to_async(fetch_batch, thread_sensitive=False)(*batch)
+        return HttpResponse(content, content_type='application/json')
+
+
+class AsyncActionTradeStatisticsGetAPIView(AsyncAPIView, ActionTradeStatisticsGetAPIView):
+
+    @extend_schema_from(ActionTradeStatisticsGetAPIView.get)
+    async def get(self, request, *args, **kwargs):
+        tickers_string = request.query_params.get('tickers')
+        tickers = tickers_string.split(',') if tickers_string else []
+        ticker = tickers[0] if len(tickers) == 1 else ''
+
+        snapshot_response = await sync_to_async(self.build_snapshot_response, thread_sensitive=False)(tickers)
+        if snapshot_response is not None:
+            return snapshot_response
+
+        # Время хранения в кэше зависит от календаря: он читается из БД вне событийного цикла
+        await TradingCalendar.aget()
+        response = await AsyncMOEXAPIService.get_trade_statictics_for_actions(ticker)
+        return self.build_response(response, tickers)
+
+
+class AsyncActionCandlesGetAPIView(AsyncAPIView, ActionCandlesGetAPIView):
+
+    @extend_schema_from(ActionCandlesGetAPIView.get)
+    async def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
+        dt_from = request.query_params.get('from')
+        dt_till = request.query_params.get('till')
+        interval = request.query_params.get('interval')
+        if not dt_from or not dt_till or not interval:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={'detail': 'Не был представлен один или несколько параметров запроса'},
+            )
+
+        pages = self.get_pages(ticker, dt_from, dt_till, interval)
+        if pages is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Неверный период свечей'})
+        etag, final_since = self.get_validators(request, dt_till, interval)
+        not_modified = get_not_modified_response(request, etag, final_since) if etag else None
+        if not_modified is not None:
+            return not_modified
+        try:
+            await pages.aload()
+        except UPSTREAM_HTTP_ERRORS:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
+        page_format = self.get_page_format(fields)
+        return self.build_response(self.astream_pages(pages, page_format), page_format, pages, etag, final_since)
+
+
+class AsyncActionIndicatorsGetAPIView(AsyncAPIView, ActionIndicatorsGetAPIView):
+
+    @extend_schema_from(ActionIndicatorsGetAPIView.get)
+    async def get(self, request, ticker, *args, **kwargs):
+        params = self.get_params(request, ticker)
+        if isinstance(params, Response):
+            return params
+        etag, final_since = ActionCandlesGetAPIView.get_validators(request, params[2], params[3])
+        not_modified = get_not_modified_response(request, etag, final_since) if etag else None
+        if not_modified is not None:
+            return not_modified
+        try:
+            # Загрузка свечей и расчет на NumPy выполняются в потоке, событийный цикл не блокируется
+            body = await run_in_thread(get_indicators)(*params)
+        except UPSTREAM_HTTP_ERRORS:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data={'detail': 'Ошибка при запросе к MOEX API'})
+        return self.build_response(request, body, etag, final_since, params[-1].is_stale)
+
+
+class AsyncActionOrderBookGetAPIView(AsyncAPIView, ActionOrderBookGetAPIView):
+
+    @extend_schema_from(ActionOrderBookGetAPIView.get)
+    async def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
+        await TradingCalendar.aget()
+        response = await AsyncMOEXAPIService.get_orderbook_for_action(ticker)
+        return self.build_response(response, fields)
+
+
+class AsyncActionTradesGetAPIView(AsyncAPIView, ActionTradesGetAPIView):
+
+    @extend_schema_from(ActionTradesGetAPIView.get)
+    async def get(self, request, ticker, *args, **kwargs):
+        fields = self.get_fields(request)
+        tradeno = request.query_params.get('tradeno')
+        trades = await sync_to_async(get_trades_delta, thread_sensitive=False)(ticker, tradeno)
+        if trades is not None:
+            return self.build_tape_response(trades, fields)
+
+        await TradingCalendar.aget()
+        response = await AsyncMOEXAPIService.get_trades_for_action(ticker, tradeno)
+        return self.build_response(response, fields)
@@ -1,22 +1,116 @@
+import copy
+
+import orjson
 from django.conf import settings
 from requests import Response
 
-from common_utils.api import BaseAPIService
+from common_utils.api import AsyncBaseAPIService, BaseAPIService
+from common_utils.circuit_breaker import CircuitBreaker
+from common_utils.micro_batcher import MicroBatcher
+
+
+def parse_batch_results(response, count: int) -> list | None:
+    """Предсказания из успешного ответа predict/batch по элементам пакета.
+
+    :return: Список из count предсказаний или None, если тело ответа не такой список
+    """
+    try:
+        results = response.json()
+    except ValueError:
+        return None
+    if not isinstance(results, list) or len(results) != count:
+        return None
+    return results
+
+
+def split_batch_response(response, count: int) -> list:
+    """Разделить ответ predict/batch на ответы по элементам пакета, как если бы они запрашивались по одному.
+
+    Неуспешный ответ достается каждому элементу без изменений. Ответ, тело которого не список из count
+    предсказаний, считается ошибкой ML API: каждому элементу достается его копия со статусом 502,
+    и raise_for_status() вызывает ту же ошибку, что и при неуспешном ответе.
+    """
+    if response.status_code != 200:
+        return [response] * count
+    results = parse_batch_results(response, count)
+    if results is None:
+        invalid_response = copy.copy(response)
+        invalid_response.status_code = 502
+        return [invalid_response] * count
+    responses = []
+    for result in results:
+        item_response = copy.copy(response)
+        item_response._content = orjson.dumps(result)
+        responses.append(item_response)
+    return responses
 
 
 class MLAPIService(BaseAPIService):
     host = settings.SERVICE_URLS['ML_SERVICE_URL']
     api_path = ''
     token = settings.SERVICE_TOKENS['ML_SERVICE_TOKEN']
+    pool_size = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['POOL_SIZE']
+    async_pool_size = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['ASYNC_POOL_SIZE']
+    connect_timeout = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['CONNECT_TIMEOUT']
+    read_timeout = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['READ_TIMEOUT']
+    max_retries = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['MAX_RETRIES']
+    backoff_factor = settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['BACKOFF_FACTOR']
+    circuit_breaker = CircuitBreaker(
+        'ml',
+        failure_threshold=settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['CIRCUIT_BREAKER']['FAILURE_THRESHOLD'],
+        window=settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['CIRCUIT_BREAKER']['WINDOW'],
+        slow_call_threshold=settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['CIRCUIT_BREAKER']['SLOW_CALL_THRESHOLD'],
+        recovery_timeout=settings.SERVICE_HTTP_OPTIONS['ML_SERVICE']['CIRCUIT_BREAKER']['RECOVERY_TIMEOUT'],
+    )
+    micro_batcher = MicroBatcher(
+        'ml_predict',
+        max_size=settings.ML_PREDICTIONS['MICRO_BATCH_MAX_SIZE'],
+        max_wait=settings.ML_PREDICTIONS['MICRO_BATCH_MAX_WAIT'],
+    )
 
     @classmethod
     def predict(cls, ticker, data) -> Response:
         """Предсказать цены закрытия свечей на следующие 20 часов.
 
+        Одновременные вызовы по разным акциям объединяются micro_batcher в один запрос predict/batch,
+        если MICRO_BATCH_MAX_SIZE больше 1.
+
         :param ticker: Код ценной бумаги, например 'SBER'.
         :param data: Цены закрытия свечей за предыдущие 20 часов.
         :return: Объект Response.
         """
-        print(data)
-        return cls.post(f'predict/{ticker}', json=data)
+        if cls.micro_batcher.max_size <= 1:
+            return cls.post(f'predict/{ticker}', json=data)
+        return cls.micro_batcher.submit({'ticker': ticker, **data}, cls.predict_micro_batch)
+
+    @classmethod
+    def predict_micro_batch(cls, items: list[dict]) -> list[Response]:
+        """Запрос predict/batch по пакету micro_batcher с обычным таймаутом и ответы по элементам пакета."""
+        return split_batch_response(cls.post('predict/batch', json={'items': items}), len(items))
 
+    @classmethod
+    def predict_batch(cls, items: list[dict]) -> Response:
+        """Предсказать цены закрытия свечей на следующие 20 часов по нескольким акциям одним запросом.
+
+        :param items: Входные данные по акциям: словари ticker, last_date_end и data, как у predict.
+        :return: Объект Response со списком предсказанных цен для каждого элемента items в том же порядке.
+        """
+        return cls.post(
+            'predict/batch',
+            json={'items': items},
+            timeout=(cls.connect_timeout, settings.ML_PREDICTIONS['BATCH_READ_TIMEOUT']),
+        )
+
+
+class AsyncMLAPIService(AsyncBaseAPIService, MLAPIService):
+    """Асинхронный MLAPIService: те же методы, возвращающие корутины с httpx.Response."""
+
+    @classmethod
+    async def predict(cls, ticker, data):
+        if cls.micro_batcher.max_size <= 1:
+            return await cls.post(f'predict/{ticker}', json=data)
+        return await cls.micro_batcher.asubmit({'ticker': ticker, **data}, cls.predict_micro_batch)
+
+    @classmethod
+    async def predict_micro_batch(cls, items: list[dict]) -> list:
+        return split_batch_response(await cls.post('predict/batch', json={'items': items}), len(items))
@@ -1,57 +1,218 @@
+import datetime
+import itertools
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 from requests import Response
 
-from common_utils.api import BaseAPIService
+from common_utils.api import AsyncBaseAPIService, BaseAPIService
+from common_utils.cache import TieredCache
+from common_utils.circuit_breaker import CircuitBreaker
+from common_utils.single_flight import SingleFlight
+from moex.create_functions import get_market_data_cache_timeout, parse_response_block
+
+# Длительность свечи в минутах по коду интервала MOEX ISS
+CANDLES_INTERVAL_MINUTES = {1: 1, 10: 10, 60: 60, 24: 60 * 24, 7: 60 * 24 * 7, 31: 60 * 24 * 31, 4: 60 * 24 * 92}
 
 
 class MOEXAPIService(BaseAPIService):
     host = settings.SERVICE_URLS['MOEX_SERVICE_URL']
     api_path = 'iss/'
     token = settings.SERVICE_TOKENS['MOEX_SERVICE_TOKEN']
+    pool_size = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['POOL_SIZE']
+    async_pool_size = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['ASYNC_POOL_SIZE']
+    connect_timeout = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CONNECT_TIMEOUT']
+    read_timeout = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['READ_TIMEOUT']
+    max_retries = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['MAX_RETRIES']
+    backoff_factor = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['BACKOFF_FACTOR']
+    single_flight = SingleFlight(
+        'moex',
+        lock_timeout=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['SINGLE_FLIGHT_LOCK_TIMEOUT'],
+        result_timeout=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['SINGLE_FLIGHT_RESULT_TIMEOUT'],
+    ) if settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['SINGLE_FLIGHT'] else None
+    response_cache = TieredCache(
+        'moex',
+        l1_max_size=settings.MOEX_CACHE['L1_MAX_SIZE'],
+        stale_timeout=settings.MOEX_CACHE['STALE_TIMEOUT'],
+    )
+    circuit_breaker = CircuitBreaker(
+        'moex',
+        failure_threshold=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CIRCUIT_BREAKER']['FAILURE_THRESHOLD'],
+        window=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CIRCUIT_BREAKER']['WINDOW'],
+        slow_call_threshold=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CIRCUIT_BREAKER']['SLOW_CALL_THRESHOLD'],
+        recovery_timeout=settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CIRCUIT_BREAKER']['RECOVERY_TIMEOUT'],
+    )
+    cache_timeouts = settings.MOEX_CACHE['TIMEOUTS']
+    # Размер страницы свечей MOEX ISS и число одновременно загружаемых страниц
+    candles_page_size = 500
+    candles_max_workers = settings.SERVICE_HTTP_OPTIONS['MOEX_SERVICE']['CANDLES_MAX_WORKERS']
+    # Максимальное число сделок в одном ответе MOEX ISS
+    trades_page_size = 5000
 
     @classmethod
-    def get_trade_statictics_for_actions(cls, ticker: str = '') -> Response:
+    def get_trade_statictics_for_actions(cls, ticker: str = '', use_cache: bool = True) -> Response:
         """Торговая статистика по всем акциям или по одной указанной на текущий день.
 
         :param ticker: Код ценной бумаги, например 'SBER'
+        :param use_cache: Брать ответ из кэша и сохранять его в кэш
         :return: Объект Response
         """
         additional_url = f'/{ticker}' if ticker else ''
-        return cls.get(f'engines/stock/markets/shares/boards/tqbr/securities{additional_url}.json')
+        return cls.get(
+            f'engines/stock/markets/shares/boards/tqbr/securities{additional_url}.json',
+            cache_timeout=get_market_data_cache_timeout(cls.cache_timeouts['TRADE_STATISTICS']) if use_cache else 0,
+        )
+
+    @classmethod
+    def stream_trade_statictics_for_actions(cls, ticker: str = ''):
+        """Торговая статистика без кэша с чтением тела ответа из сокета, см. BaseAPIService.get_stream.
+
+        :param ticker: Код ценной бумаги, например 'SBER'
+        :return: Контекстный менеджер с объектом Response
+        """
+        additional_url = f'/{ticker}' if ticker else ''
+        return cls.get_stream(f'engines/stock/markets/shares/boards/tqbr/securities{additional_url}.json')
 
     @classmethod
-    def get_candles_for_action(cls, ticker: str, dt_from: str, dt_till: str, interval: int = 10) -> Response:
-        """Свечи по одной указанной акции.
+    def get_candles_for_action(cls, ticker: str, dt_from: str, dt_till: str, interval: int = 10,
+                               start: int = 0, use_cache: bool = True) -> Response:
+        """Свечи по одной указанной акции, одна страница (не более candles_page_size записей).
 
         :param ticker: Код ценной бумаги, например 'SBER'
         :param dt_from: Дата начала периода, например '2024-03-01'
         :param dt_till: Дата окончания периода, например '2024-05-01'
         :param interval: Период свечей
+        :param start: Номер первой записи страницы
+        :param use_cache: Брать ответ из кэша и сохранять его в кэш
         :return: Объект Response
         """
         return cls.get(
             (
                 f'engines/stock/markets/shares/boards/tqbr/securities/{ticker}/candles.json'
-                f'?from={dt_from}&till={dt_till}&interval={interval}'
+                f'?from={dt_from}&till={dt_till}&interval={interval}' + (f'&start={start}' if start else '')
             ),
+            cache_timeout=cls.get_candles_cache_timeout(dt_till) if use_cache else 0,
         )
 
     @classmethod
-    def get_orderbook_for_action(cls, ticker: str) -> Response:
+    def iter_candles_pages(cls, ticker: str, dt_from: str, dt_till: str, interval: int = 10,
+                           use_cache: bool = True):
+        """Все страницы свечей за период по порядку, в формате parse_start_structure.
+
+        Первая страница запрашивается сразу, следующие - параллельно, не более ``candles_max_workers``
+        одновременно: по мере выдачи очередной страницы запрашивается следующая, пока не придет неполная
+        страница. Каждая страница проверяется и разбирается один раз, см. parse_candles_page.
+
+        :param ticker: Код ценной бумаги, например 'SBER'
+        :param dt_from: Дата начала периода, например '2024-03-01'
+        :param dt_till: Дата окончания периода, например '2024-05-01'
+        :param interval: Период свечей
+        :param use_cache: Брать страницы из кэша и сохранять их в кэш
+        :return: Генератор пар (свечи страницы, признак устаревшей страницы из кэша, см. BaseAPIService.get)
+        :raises requests.HTTPError: Ошибка при запросе страницы к MOEX API
+        """
+        first_page = cls.get_candles_for_action(ticker, dt_from, dt_till, interval, use_cache=use_cache)
+        candles = cls.parse_candles_page(first_page)
+        yield candles, getattr(first_page, 'is_stale', False)
+        if len(candles) < cls.candles_page_size:
+            return
+
+        starts = cls.iter_candles_page_starts(dt_from, dt_till, interval)
+        with ThreadPoolExecutor(max_workers=cls.candles_max_workers) as executor:
+            def submit_next():
+                start = next(starts, None)
+                if start is not None:
+                    futures.append(executor.submit(
+                        cls.get_candles_for_action, ticker, dt_from, dt_till, interval, start, use_cache,
+                    ))
+
+            futures = deque()
+            for _ in range(cls.candles_max_workers):
+                submit_next()
+            try:
+                while futures:
+                    page = futures.popleft().result()
+                    candles = cls.parse_candles_page(page)
+                    yield candles, getattr(page, 'is_stale', False)
+                    if len(candles) < cls.candles_page_size:
+                        break
+                    submit_next()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    @staticmethod
+    def parse_candles_page(page: Response) -> list[dict]:
+        """Свечи страницы MOEX ISS в формате parse_start_structure.
+
+        :raises requests.HTTPError: Ошибка при запросе к MOEX API
+        """
+        page.raise_for_status()
+        return parse_response_block(page, 'candles')
+
+    @classmethod
+    def iter_candles_page_starts(cls, dt_from: str, dt_till: str, interval):
+        """Номера первых записей страниц свечей после первой.
+
+        Их число ограничено оценкой сверху, как если бы торги шли круглосуточно, чтобы не запрашивать
+        заведомо пустые страницы в конце периода.
+        """
+        page_size = cls.candles_page_size
+        try:
+            date_from = datetime.date.fromisoformat(str(dt_from)[:10])
+            date_till = datetime.date.fromisoformat(str(dt_till)[:10])
+            interval_minutes = CANDLES_INTERVAL_MINUTES[int(interval)]
+        except (ValueError, KeyError):
+            return itertools.count(page_size, page_size)
+        max_candles = math.ceil(((date_till - date_from).days + 1) * 60 * 24 / interval_minutes)
+        return iter(range(page_size, max_candles, page_size))
+
+    @classmethod
+    def get_candles_cache_timeout(cls, dt_till: str):
+        """Время хранения свечей в кэше: свечи за завершившиеся дни не меняются и хранятся дольше,
+        остальные вне торгов хранятся до начала следующей сессии.
+
+        :param dt_till: Дата окончания периода, например '2024-05-01'
+        :return: Время хранения в секундах
+        """
+        try:
+            date_till = datetime.date.fromisoformat(str(dt_till)[:10])
+        except ValueError:
+            return get_market_data_cache_timeout(cls.cache_timeouts['CANDLES'])
+        if date_till < datetime.date.today():
+            return cls.cache_timeouts['CANDLES_HISTORY']
+        return get_market_data_cache_timeout(cls.cache_timeouts['CANDLES'])
+
+    @classmethod
+    def get_orderbook_for_action(cls, ticker: str, use_cache: bool = True) -> Response:
         """Стакан котировок по одной указанной акции.
 
         :param ticker: Код ценной бумаги, например 'SBER'
+        :param use_cache: Брать ответ из кэша и сохранять его в кэш
         :return: Объект Response
         """
-        return cls.get(f'engines/stock/markets/shares/boards/tqbr/securities/{ticker}/orderbook.json')
+        return cls.get(
+            f'engines/stock/markets/shares/boards/tqbr/securities/{ticker}/orderbook.json',
+            cache_timeout=get_market_data_cache_timeout(cls.cache_timeouts['ORDERBOOK']) if use_cache else 0,
+        )
 
     @classmethod
-    def get_trades_for_action(cls, ticker: str, tradeno: int) -> Response:
-        """Стакан котировок по одной указанной акции.
+    def get_trades_for_action(cls, ticker: str, tradeno: int = None, use_cache: bool = True) -> Response:
+        """Сделки по одной указанной акции за текущий торговый день, не более trades_page_size записей.
 
         :param ticker: Код ценной бумаги, например 'SBER'
-        :param tradeno: Получить сделки, которые идут начиная с указанного номера
+        :param tradeno: Получить сделки, которые идут начиная с указанного номера; None - с начала дня
+        :param use_cache: Брать ответ из кэша и сохранять его в кэш
         :return: Объект Response
         """
-        return cls.get(f'engines/stock/markets/shares/boards/tqbr/securities/{ticker}/trades.json?tradeno={tradeno}')
+        query = f'?tradeno={tradeno}' if tradeno is not None else ''
+        return cls.get(
+            f'engines/stock/markets/shares/boards/tqbr/securities/{ticker}/trades.json{query}',
+            cache_timeout=get_market_data_cache_timeout(cls.cache_timeouts['TRADES']) if use_cache else 0,
+        )
+
 
+class AsyncMOEXAPIService(AsyncBaseAPIService, MOEXAPIService):
+    """Асинхронный MOEXAPIService: те же методы, возвращающие корутины с httpx.Response."""